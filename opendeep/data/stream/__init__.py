@@ -3,3 +3,4 @@ from __future__ import division, absolute_import, print_function
 from .filestream import *
 from .modifystream import *
 from .batchstream import *
+from .augmentstream import *
@@ -0,0 +1,122 @@
+"""
+A wrapper object for augmenting iterable streams of images on the host (CPU) before they reach the model.
+
+Random cropping and mirroring is done per-example in a pool of worker processes that run ahead of the training
+loop, so the network is handed already-cropped images (instead of doing one crop/mirror for the whole batch
+inside the compiled graph like :func:`opendeep.utils.nnet.mirror_images`).
+"""
+# standard libraries
+import itertools
+import logging
+import multiprocessing
+from collections import deque
+# third party libraries
+import numpy
+
+log = logging.getLogger(__name__)
+
+def crop_mirror(image, cropsize, rng=None):
+    """
+    Crops a single (channels, rows, cols) image to (channels, cropsize, cropsize), randomly mirroring it
+    left-right.
+
+    Parameters
+    ----------
+    image : array_like
+        The (channels, rows, cols) image.
+    cropsize : int
+        The size of the square crop.
+    rng : numpy.random.RandomState, optional
+        The random state to pick the crop offset and mirroring with. If None, the image is center cropped
+        and not mirrored.
+
+    Returns
+    -------
+    array_like
+        The (channels, cropsize, cropsize) cropped image.
+    """
+    rows, cols = image.shape[-2:]
+    assert rows >= cropsize and cols >= cropsize, \
+        "Can't crop image with shape %s to size %d!" % (str(image.shape), cropsize)
+    if rng is None:
+        row, col = (rows - cropsize) // 2, (cols - cropsize) // 2
+        return image[..., row:row + cropsize, col:col + cropsize]
+    row = rng.randint(rows - cropsize + 1)
+    col = rng.randint(cols - cropsize + 1)
+    output = image[..., row:row + cropsize, col:col + cropsize]
+    if rng.randint(2):
+        output = output[..., ::-1]
+    return output
+
+def _augment_chunk(args):
+    """
+    Crops (and mirrors) a chunk of images in a worker - each chunk gets its own seed so the augmentation doesn't
+    depend on which worker processes it.
+    """
+    images, cropsize, seed = args
+    rng = None if seed is None else numpy.random.RandomState(seed)
+    return [numpy.ascontiguousarray(crop_mirror(numpy.asarray(image), cropsize, rng)) for image in images]
+
+class AugmentStream:
+    """
+    Creates an iterable stream of (randomly) cropped and mirrored images from an input stream of images.
+
+    Parameters
+    ----------
+    stream : iterable
+        The input stream of (channels, rows, cols) images.
+    cropsize : int
+        The size of the square crop (227 for AlexNet).
+    rand_crop : bool
+        Whether to randomly crop and mirror each image. If False, each image is center cropped (use this for the
+        valid and test streams).
+    processes : int
+        The number of worker processes to augment in. If 0, the images are augmented in this process.
+    chunk_size : int
+        The number of images sent to a worker at once.
+    buffer_chunks : int
+        The maximum number of chunks being augmented ahead of the consumer (this bounds the memory used).
+    seed : int
+        The seed for the random crops and mirrors.
+    """
+    def __init__(self, stream, cropsize=227, rand_crop=True, processes=2, chunk_size=64, buffer_chunks=8,
+                 seed=1234):
+        self.stream = stream
+        self.cropsize = cropsize
+        self.rand_crop = rand_crop
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.buffer_chunks = buffer_chunks
+        self.rng = numpy.random.RandomState(seed)
+
+    def _chunks(self):
+        it = iter(self.stream)
+        while True:
+            images = list(itertools.islice(it, self.chunk_size))
+            if len(images) == 0:
+                return
+            seed = self.rng.randint(2**30) if self.rand_crop else None
+            yield images, self.cropsize, seed
+
+    def __iter__(self):
+        chunks = self._chunks()
+        if not self.processes:
+            for chunk in chunks:
+                for image in _augment_chunk(chunk):
+                    yield image
+            return
+
+        pool = multiprocessing.Pool(processes=self.processes)
+        try:
+            # keep up to buffer_chunks chunks in flight so the workers run ahead of the training loop.
+            pending = deque()
+            for chunk in itertools.islice(chunks, self.buffer_chunks):
+                pending.append(pool.apply_async(_augment_chunk, (chunk,)))
+            while len(pending) > 0:
+                images = pending.popleft().get()
+                for chunk in itertools.islice(chunks, 1):
+                    pending.append(pool.apply_async(_augment_chunk, (chunk,)))
+                for image in images:
+                    yield image
+        finally:
+            pool.terminate()
@@ -0,0 +1,35 @@
+import unittest
+import numpy
+from opendeep.data.stream.augmentstream import AugmentStream
+
+class TestAugmentStream(unittest.TestCase):
+
+    def setUp(self):
+        self.images = [numpy.arange(3*8*8).reshape((3, 8, 8)) + i for i in range(10)]
+
+    def testCenterCrop(self):
+        stream = AugmentStream(self.images, cropsize=6, rand_crop=False, processes=0)
+        for image, cropped in zip(self.images, stream):
+            numpy.testing.assert_array_equal(cropped, image[:, 1:7, 1:7])
+
+    def testRandomCrop(self):
+        stream = AugmentStream(self.images, cropsize=6, processes=0, chunk_size=3)
+        crops = list(stream)
+        assert len(crops) == len(self.images)
+        for image, cropped in zip(self.images, crops):
+            assert cropped.shape == (3, 6, 6)
+            # the crop is a window of the image or its mirror
+            windows = [image[:, r:r+6, c:c+6] for r in range(3) for c in range(3)]
+            windows += [window[:, :, ::-1] for window in windows]
+            assert any(numpy.array_equal(cropped, window) for window in windows)
+
+    def testProcesses(self):
+        expected = list(AugmentStream(self.images, cropsize=6, processes=0, chunk_size=3, seed=5))
+        crops = list(AugmentStream(self.images, cropsize=6, processes=2, chunk_size=3, buffer_chunks=2, seed=5))
+        assert len(crops) == len(expected)
+        for a, b in zip(crops, expected):
+            numpy.testing.assert_array_equal(a, b)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,10 +7,12 @@ for experimentation, and then later you should make your creation into a new :cl
 import logging
 import time
 # third party libraries
+import theano
 import theano.tensor as T
+from theano.compat.python2x import OrderedDict
 # internal references
 from opendeep.models.model import Model
-from opendeep.utils.constructors import function
+from opendeep.models.utils.modify_layer import ModifyLayer
 from opendeep.utils.misc import make_time_units_string, raise_to_list
 
 log = logging.getLogger(__name__)
@@ -173,6 +175,52 @@ class Prototype(Model):
             log.warning("This container doesn't have any models! So no outputs to get...")
             return None
 
+    def compile_run_fn(self, inference=False):
+        """
+        Compiles the `f_run` function from all unique inputs to the models in the Prototype (from `get_inputs()`)
+        to the outputs (from `get_outputs()`).
+
+        Parameters
+        ----------
+        inference : bool
+            Whether to compile the function for inference only, with the noise switches of all the models folded
+            to constant zeros so their noise subgraphs are pruned (see :meth:`Model.compile_run_fn`). Modifying
+            layers (like batch normalization) are also folded into the layers before them where possible.
+
+        Returns
+        -------
+        Theano function
+            The compiled theano function for running the Prototype.
+        """
+        if hasattr(self, 'f_run') and getattr(self, 'f_run_inference', False) == inference:
+            return self.f_run
+        inputs = raise_to_list(self.get_inputs())
+        outputs = raise_to_list(self.get_outputs())
+        if outputs is not None and len(outputs) == 1:
+            outputs = outputs[0]
+        updates = self.get_updates()
+        t = time.time()
+        log.info("Compiling f_run%s...", " for inference" if inference else "")
+        self.f_run = self._compile_run(inputs, outputs, updates, inference)
+        self.f_run_inference = inference
+        log.info("Compilation done! Took %s", make_time_units_string(time.time() - t))
+        return self.f_run
+
+    def _compile_run(self, inputs, outputs, updates, inference=False):
+        if inference:
+            # fold the modifying layers into the parameters of the layers before them (in order, so the
+            # replacements of later layers build on the earlier ones)
+            replace = OrderedDict()
+            for previous, model in zip(self.models[:-1], self.models[1:]):
+                if isinstance(model, ModifyLayer):
+                    folded = model.get_folded_outputs(previous)
+                    if folded is not None:
+                        replace[model.get_outputs()] = folded
+            if len(replace) > 0:
+                log.info("Folding %d modifying layers for inference", len(replace))
+                outputs = theano.clone(outputs, replace=replace)
+        return super(Prototype, self)._compile_run(inputs, outputs, updates, inference)
+
     def run(self, input):
         """
         This method will return the Prototype's output (run through the `f_run` function), given an input. The input
@@ -192,6 +240,12 @@ class Prototype(Model):
         array_like
             Theano/numpy tensor-like object that is the output of the model's computation graph.
         """
+        # make sure the input is raised to a list - we are going to splat it!
+        input = raise_to_list(input)
+        # an inference f_run has the switches folded in, so they don't need to be touched.
+        if getattr(self, 'f_run_inference', False):
+            return self.f_run(*input)
+
         # set the noise switches off for running! we assume unseen data is noisy anyway :)
         old_switch_vals = []
         if len(self.get_switches()) > 0:
@@ -199,23 +253,10 @@ class Prototype(Model):
             old_switch_vals = [switch.get_value() for switch in self.get_switches()]
             [switch.set_value(0.) for switch in self.get_switches()]
 
-        # make sure the input is raised to a list - we are going to splat it!
-        input = raise_to_list(input)
-        # first check if we already made an f_run function
-        if hasattr(self, 'f_run'):
-            output = self.f_run(*input)
-        # otherwise, compile it!
-        else:
-            inputs = raise_to_list(self.get_inputs())
-            outputs = raise_to_list(self.get_outputs())
-            if outputs is not None and len(outputs) == 1:
-                outputs = outputs[0]
-            updates = self.get_updates()
-            t = time.time()
-            log.info("Compiling f_run...")
-            self.f_run = function(inputs=inputs, outputs=outputs, updates=updates, name="f_run")
-            log.info("Compilation done! Took %s", make_time_units_string(time.time() - t))
-            output = self.f_run(*input)
+        # first check if we already made an f_run function, otherwise compile it!
+        if not hasattr(self, 'f_run'):
+            self.compile_run_fn()
+        output = self.f_run(*input)
 
         # reset any switches to how they were!
         if len(self.get_switches()) > 0:
@@ -353,6 +394,20 @@ class Prototype(Model):
             lr_scalers.update(model.get_lr_scalers())
         return lr_scalers
 
+    def get_param_masks(self):
+        """
+        This method returns the masks for pruned parameters from every model in the Prototype.
+
+        Returns
+        -------
+        dict
+            Dictionary of (SharedVariable: SharedVariable) mapping the model parameters to their binary masks.
+        """
+        param_masks = {}
+        for model in self.models:
+            param_masks.update(model.get_param_masks())
+        return param_masks
+
     def get_switches(self):
         """
         This method returns a list of shared theano variables representing switches for adding noise in the model.
@@ -370,6 +425,14 @@ class Prototype(Model):
             noise_switches.extend(raise_to_list(model.get_switches()))
         return noise_switches
 
+    def reset_state(self):
+        """
+        Resets the state carried between calls (like recurrent hiddens for truncated backpropagation through time)
+        for every model in the Prototype.
+        """
+        for model in self.models:
+            model.reset_state()
+
     def get_params(self):
         """
         This returns the list of theano shared variables that will be trained by the :class:`Optimizer`.
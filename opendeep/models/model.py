@@ -9,6 +9,9 @@ their ability to connect with other Models.
 import logging
 import os
 import time
+# third party libraries
+import theano.tensor as T
+from theano.compat.python2x import OrderedDict
 # internal references
 import opendeep.models
 from opendeep.utils.decorators import init_optimizer
@@ -16,6 +19,7 @@ from opendeep.utils import file_ops
 from opendeep.utils.constructors import function
 from opendeep.utils.misc import (make_time_units_string, raise_to_list, add_kwargs_to_dict)
 from opendeep.utils.file_ops import mkdir_p
+from opendeep.utils.nnet import fold_switches
 
 try:
     import cPickle as pickle
@@ -123,7 +127,8 @@ class Model(object):
         # Necessary inputs to a Model - these are the minimum requirements for modularity to work.
         self.inputs = raise_to_list(inputs)
         self.hiddens = raise_to_list(hiddens)
-        self.output_size = raise_to_list(outputs)
+        # layers created with an `output_size` argument (instead of `outputs`) keep their output size
+        self.output_size = raise_to_list(outputs) if outputs is not None else kwargs.get('output_size')
         self.params = params
         self.outdir = outdir
 
@@ -141,6 +146,10 @@ class Model(object):
         self.args['output_size'] = self.output_size
         self.args['params'] = self.params
         self.args['outdir'] = self.outdir
+        # every model answers for the hooks used to link models together (like in Prototype.add()),
+        # even if it doesn't accept them
+        for hook in ['inputs_hook', 'hiddens_hook', 'params_hook']:
+            self.args.setdefault(hook, None)
 
         # log the arguments.
         log.info("%s self.args: %s", self._classname, str(self.args))
@@ -239,7 +248,7 @@ class Model(object):
     ##########################################################
     # Methods for running and training the model on an input #
     ##########################################################
-    def compile_run_fn(self):
+    def compile_run_fn(self, inference=False):
         """
         This is a helper function to compile the f_run function for computing the model's outputs given inputs.
         Compile and set the f_run function used for `run()`.
@@ -254,24 +263,41 @@ class Model(object):
                                       updates = self.get_updates(),
                                       name    = 'f_run')
 
+        Parameters
+        ----------
+        inference : bool
+            Whether to compile the function for inference only. This replaces the switches from `get_switches()`
+            with constant zeros (see :func:`opendeep.utils.nnet.fold_switches`) so the noise subgraphs are pruned
+            from the compiled function, and random streams are not advanced by default updates. The switches are
+            then never read or set by `run()`.
+
         Returns
         -------
         Theano function
             The compiled theano function for running the model.
         """
-        if not getattr(self, 'f_run', None):
-            log.debug("Compiling f_run...")
+        if getattr(self, 'f_run', None) and getattr(self, 'f_run_inference', False) == inference:
+            log.debug('f_run already exists!')
+        else:
+            log.debug("Compiling f_run%s...", " for inference" if inference else "")
             t = time.time()
-            self.f_run = function(inputs  = raise_to_list(self.get_inputs()),
-                                  outputs = self.get_outputs(),
-                                  updates = self.get_updates(),
-                                  name    = 'f_run')
+            self.f_run = self._compile_run(raise_to_list(self.get_inputs()), self.get_outputs(),
+                                           self.get_updates(), inference)
+            self.f_run_inference = inference
             log.debug("Compilation done. Took %s", make_time_units_string(time.time() - t))
-        else:
-            log.debug('f_run already exists!')
 
         return self.f_run
 
+    def _compile_run(self, inputs, outputs, updates, inference=False):
+        """
+        Compiles the 'f_run' function from the given inputs, outputs, and updates - folding the switches
+        to constants first if this is for `inference`.
+        """
+        if not inference:
+            return function(inputs=inputs, outputs=outputs, updates=updates, name='f_run')
+        outputs, updates = fold_switches(outputs, updates, self.get_switches(), value=0.)
+        return function(inputs=inputs, outputs=outputs, updates=updates, no_default_updates=True, name='f_run')
+
     def run(self, input):
         """
         This method will return the model's output (run through the function), given an input. In the case that
@@ -291,6 +317,10 @@ class Model(object):
         array_like or list(array_like)
             Array_like object that is the output(s) of the model's computation graph run on the given input(s).
         """
+        # an inference f_run has the switches folded in, so they don't need to be touched.
+        if getattr(self, 'f_run_inference', False):
+            return self.f_run(*raise_to_list(input))
+
         # set the noise switches off for running (this only happens the first time)!
         old_switch_vals = []
         if self.switches_on is not False:
@@ -389,6 +419,19 @@ class Model(object):
         # By default, no learning rate scaling.
         return {}
 
+    def get_param_masks(self):
+        """
+        This method returns the binary masks to multiply into the parameters' gradients and updates during training,
+        so masked (pruned) entries stay zero. Default is the `param_masks` set on the model by
+        :func:`opendeep.models.utils.pruning.prune`, or an empty dictionary for no masking.
+
+        Returns
+        -------
+        dict
+            Dictionary mapping the model parameters to their mask {SharedVariable: SharedVariable}.
+        """
+        return getattr(self, 'param_masks', None) or {}
+
     def get_switches(self):
         """
         This method returns a list of shared theano variables representing switches for values in the model that
@@ -450,6 +493,16 @@ class Model(object):
         [switch.set_value(val) for switch, val in zip(switches, values)]
         self.switches_on = None
 
+    def reset_state(self):
+        """
+        Stateful models (like recurrent nets carrying their last hidden values over to the next minibatch for
+        truncated backpropagation through time) should reset that state here, so the next call starts fresh.
+        The :class:`Optimizer` calls this at sequence boundaries and before computing over each dataset subset.
+
+        Most models don't carry state between calls, so this does nothing by default.
+        """
+        pass
+
     @init_optimizer
     def train(self, optimizer, **kwargs):
         """
@@ -458,6 +511,33 @@ class Model(object):
         """
         optimizer.train(**kwargs)
 
+    def get_gradient(self, cost=None, additional_cost=None):
+        """
+        This returns the gradients of the training cost with respect to the parameters from `get_params()`.
+        The :class:`Optimizer` uses them to create the parameter updates. Override this method if your model
+        computes its gradients differently (like with known gradients from a model linked to it).
+
+        Parameters
+        ----------
+        cost : theano expression, optional
+            The cost to differentiate. Defaults to `get_train_cost()`.
+        additional_cost : theano expression, optional
+            Any other cost to add (normally regularization).
+
+        Returns
+        -------
+        tuple
+            (OrderedDict of {SharedVariable: gradient}, OrderedDict of updates) - the gradients, and any updates
+            needed to compute them (none by default).
+        """
+        if cost is None:
+            cost = self.get_train_cost()
+        if additional_cost is not None:
+            cost = cost + additional_cost
+        params = raise_to_list(self.get_params())
+        gradients = T.grad(cost=cost, wrt=params)
+        return OrderedDict(zip(params, gradients)), OrderedDict()
+
     #######################################
     # Methods to do with model parameters #
     #######################################
@@ -20,7 +20,7 @@ from opendeep.models.model import Model
 from opendeep.models.single_layer.convolutional import ConvPoolLayer
 from opendeep.models.single_layer.basic import Dense, SoftmaxLayer
 from opendeep.utils.decorators import inherit_docs
-from opendeep.utils.nnet import mirror_images
+from opendeep.utils.nnet import fold_switches, mirror_images
 from opendeep.utils.misc import make_time_units_string, raise_to_list
 
 log = logging.getLogger(__name__)
@@ -75,7 +75,10 @@ class AlexNet(Model):
             The directory you want outputs (parameters, images, etc.) to save to. If None, nothing will
             be saved.
         use_data_layer : bool
-            Whether or not to mirror the input images before feeding them into the network.
+            Whether or not to mirror and crop the (256x256) input images inside the network. This uses one random
+            crop/mirror for the whole batch and doubles the input tensor, so prefer feeding the network already
+            cropped 227x227 images from :class:`opendeep.data.stream.AugmentStream` (per-example random crops and
+            mirrors, done in worker processes alongside the data iterator) and leave this False.
         rand_crop : bool
             If `use_data_layer`, whether to randomize.
         batch_size : int
@@ -89,6 +92,9 @@ class AlexNet(Model):
             log.error("Inputs_hook and params_hook not implemented yet for AlexNet!")
 
         self.flag_datalayer = use_data_layer
+        if self.flag_datalayer:
+            log.warning("AlexNet use_data_layer crops and mirrors inside the graph with one random crop for the "
+                        "whole batch. Consider AugmentStream to give the network cropped images instead.")
         self.rand_crop = rand_crop
 
         ####################
@@ -254,8 +260,10 @@ class AlexNet(Model):
         log.debug("Compiling functions!")
         t = time.time()
         log.debug("f_run...")
-        # use the actual argmax from the classification
-        self.f_run = function(inputs=[self.x], outputs=softmax_layer8.get_argmax_prediction())
+        # use the actual argmax from the classification, with the dropout switches folded off for inference.
+        prediction, _ = fold_switches(softmax_layer8.get_argmax_prediction(), switches=self.noise_switches)
+        self.f_run = function(inputs=[self.x], outputs=prediction, no_default_updates=True, name='f_run')
+        self.f_run_inference = True
         log.debug("compilation took %s", make_time_units_string(time.time() - t))
 
     def get_inputs(self):
@@ -268,7 +276,7 @@ class AlexNet(Model):
         return self.targets
 
     def get_switches(self):
-        return self.get_switches()
+        return self.noise_switches
 
     def get_train_cost(self):
         return self.train_cost
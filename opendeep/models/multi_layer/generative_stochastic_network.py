@@ -590,75 +590,97 @@ class GSN(Model):
         numpy.save(f_samples, samples)
         log.debug('saved samples')
 
-    def sample(self, initial, n_samples=400, k=1):
+    def compile_sampler(self):
+        """
+        Compiles the multi-step sampling function `f_sample_chain`. It takes the network state (the visible layer
+        and each hidden layer, one row per parallel chain) and a number of steps, and runs that many noisy
+        walkback updates inside a single scan. It returns the p(X|...) expectation for every step, followed by the
+        network state after every step.
+        """
+        log.debug("f_sample_chain...")
+        state_input = [T.matrix("X_chain")] + [T.matrix("H_chain_%d" % (i+1)) for i in range(self.layers)]
+        n_steps = T.iscalar("sample_n_steps")
+
+        def walkback(*state):
+            hiddens = list(state)
+            visible_pX_chain = []
+            self.update_layers(hiddens, visible_pX_chain, add_noise=True, reverse=False)
+            return [visible_pX_chain[-1]] + hiddens
+
+        outputs, updates = theano.scan(fn=walkback,
+                                       outputs_info=[None] + state_input,
+                                       n_steps=n_steps,
+                                       name="gsn_sample_scan")
+        self.f_sample_chain = function(inputs  = state_input + [n_steps],
+                                       outputs = outputs,
+                                       updates = updates,
+                                       name    = 'gsn_f_sample_chain')
+
+    def sample(self, initial, n_samples=400, k=1, chunk_size=1000):
+        """
+        Runs the noisy sampling chain from the `initial` visible inputs.
+
+        Parameters
+        ----------
+        initial : array_like
+            The starting visible inputs, one row per independent chain (all the chains are sampled in parallel).
+        n_samples : int
+            The length of each chain (including the initial inputs).
+        k : int
+            Save the hidden layers every `k` steps.
+        chunk_size : int
+            The number of steps to run per call of the compiled sampler.
+
+        Returns
+        -------
+        tuple
+            The visible chain as an array of (n_samples * n_chains, input_size) - ordered by step, then chain - and
+            the list of saved hiddens for each hidden layer as arrays of (n_saved, n_chains, layer_size).
+        """
         log.debug("Starting sampling...")
-        def sample_some_numbers_single_layer(n_samples):
-            x0 = initial
-            samples = [x0]
-            x = self.f_noise(x0)
-            for _ in iter(range(n_samples-1)):
-                x = self.f_sample(x)
-                samples.append(x)
-                x = self.visible_sampling(n=1, p=x, size=x.shape).astype(theano.config.floatX)
-                x = self.f_noise(x)
-
-            log.debug("Sampling done.")
-            return numpy.vstack(samples), None
-
-        def sampling_wrapper(NSI):
-            # * is the "splat" operator: It takes a list as input, and expands it into actual
-            # positional arguments in the function call.
-            out = self.f_sample(*NSI)
-            NSO = out[:len(self.network_state_output)]
-            vis_pX_chain = out[len(self.network_state_output):]
-            return NSO, vis_pX_chain
-
-        def sample_some_numbers(n_samples):
-            # The network's initial state
-            init_vis       = initial
-            noisy_init_vis = self.f_noise(init_vis)
-
-            network_state  = [
-                [noisy_init_vis] +
-                [
-                    numpy.zeros(shape=(initial.shape[0], self.layer_sizes[i+1]), dtype=theano.config.floatX)
-                    for i in range(len(self.bias_list[1:]))
-                ]
-            ]
-
-            visible_chain  = [init_vis]
-            noisy_h0_chain = [noisy_init_vis]
-            sampled_h = []
-
-            times = []
-            for i in iter(range(n_samples-1)):
-                _t = time.time()
-
-                # feed the last state into the network, run new state, and obtain visible units expectation chain
-                net_state_out, vis_pX_chain = sampling_wrapper(network_state[-1])
-
-                # append to the visible chain
-                visible_chain += vis_pX_chain
-
-                # append state output to the network state chain
-                network_state.append(net_state_out)
-
-                noisy_h0_chain.append(net_state_out[0])
-
-                if i%k == 0:
-                    sampled_h.append(T.stack(net_state_out[1:]))
-                    if i == k:
-                        log.debug("About "+make_time_units_string(numpy.mean(times)*(n_samples-1-i))+" remaining...")
-
-                times.append(time.time() - _t)
-
-            log.DEBUG("Sampling done.")
-            return numpy.vstack(visible_chain), sampled_h
-
-        if self.layers == 1:
-            return sample_some_numbers_single_layer(n_samples)
-        else:
-            return sample_some_numbers(n_samples)
+        if not hasattr(self, 'f_sample_chain'):
+            self.compile_sampler()
+        initial = numpy.asarray(initial, dtype=theano.config.floatX)
+        if initial.ndim == 1:
+            initial = initial.reshape((1, initial.shape[0]))
+        n_chains = initial.shape[0]
+        n_updates = max(n_samples - 1, 0)
+
+        # preallocate the chains
+        visible_chain = numpy.empty((n_samples, n_chains, self.input_size), dtype=theano.config.floatX)
+        visible_chain[0] = initial
+        n_saved = (n_updates + k - 1) // k
+        sampled_h = [numpy.empty((n_saved, n_chains, size), dtype=theano.config.floatX)
+                     for size in self.layer_sizes[1:]]
+
+        # The network's initial state
+        network_state = [self.f_noise(initial)] + [
+            numpy.zeros(shape=(n_chains, size), dtype=theano.config.floatX) for size in self.layer_sizes[1:]
+        ]
+
+        t = time.time()
+        done = 0
+        saved = 0
+        while done < n_updates:
+            steps = min(chunk_size, n_updates - done)
+            outs = self.f_sample_chain(*(network_state + [steps]))
+            pX_chain, state_chain = outs[0], outs[1:]
+            visible_chain[done+1:done+1+steps] = pX_chain
+            # the hiddens from every k-th update overall
+            first = (-done) % k
+            n_picked = len(range(first, steps, k))
+            for h_saved, h_chain in zip(sampled_h, state_chain[1:]):
+                h_saved[saved:saved+n_picked] = h_chain[first::k]
+            saved += n_picked
+            # continue from the last state
+            network_state = [state[-1] for state in state_chain]
+            done += steps
+            if done < n_updates:
+                log.debug("About %s remaining...",
+                          make_time_units_string((time.time() - t) / done * (n_updates - done)))
+
+        log.debug("Sampling done. Took %s", make_time_units_string(time.time() - t))
+        return visible_chain.reshape((n_samples * n_chains, self.input_size)), sampled_h
 
     def create_reconstruction_image(self, input_data):
         """
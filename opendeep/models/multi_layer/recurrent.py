@@ -15,7 +15,8 @@ from opendeep.utils.activation import get_activation_function
 from opendeep.utils.cost import get_cost_function
 from opendeep.utils.decay import get_decay_function
 from opendeep.utils.decorators import inherit_docs
-from opendeep.utils.nnet import get_weights, get_bias
+from opendeep.utils.nnet import (get_weights, get_bias, get_carried_state, reset_carried_state,
+                                 stack_bidirectional_inputs, stack_bidirectional_weights, unstack_bidirectional)
 from opendeep.utils.noise import get_noise
 
 log = logging.getLogger(__name__)
@@ -55,7 +56,9 @@ class RNN(Model):
                  cost_function='mse', cost_args=None,
                  noise='dropout', noise_level=None, noise_decay=False, noise_decay_amount=.99,
                  direction='forward',
-                 clip_recurrent_grads=False):
+                 clip_recurrent_grads=False,
+                 stateful=False,
+                 single_scan=False):
         """
         Initialize a simple recurrent network.
 
@@ -138,12 +141,24 @@ class RNN(Model):
         direction : str
             The direction this recurrent model should go over its inputs. Can be 'forward', 'backward', or
             'bidirectional'. In the case of 'bidirectional', it will make two passes over the sequence,
-            computing two sets of hiddens and merging them before running through the final decoder.
+            computing two sets of hiddens and merging them before running through the final decoder. The hiddens
+            are merged by timestep - the backward hiddens for timestep t (computed over the inputs from t to the
+            end) are added to the forward hiddens for timestep t.
         clip_recurrent_grads : False or float, optional
             Whether to clip the gradients for the parameters that unroll over timesteps (such as the weights
             connecting previous hidden states to the current hidden state, and not the weights from current
             input to hiddens). If it is a float, the gradients for the weights will be hard clipped to the range
             `+-clip_recurrent_grads`.
+        stateful : bool, optional
+            Whether to carry the last hiddens of each layer over as the initial hiddens of the next call, for
+            truncated backpropagation through time over consecutive chunks of long sequences (the data has to be
+            ordered so consecutive minibatches continue the same sequences). Use `reset_state()` at sequence
+            boundaries. Only works with `direction`='forward'.
+        single_scan : bool, optional
+            When bidirectional, whether to compute both directions of each layer in a single scan instead of two.
+            The input projections for the forward and time-reversed sequences are stacked along the feature axis
+            and the recurrent weights for both directions are combined block-diagonally, so each step runs one
+            larger dot product and the per-step scan overhead is only paid once.
 
         Raises
         ------
@@ -162,6 +177,11 @@ class RNN(Model):
         self.backward = (direction == "backward")
         self.layers = layers
         self.noise = noise
+        self.stateful = stateful
+        self.single_scan = single_scan
+        if self.stateful:
+            assert self.direction == 'forward', "A stateful RNN needs to go forward over its inputs, found direction " \
+                                                "%s" % self.direction
 
         self.weights_init = weights_init
         self.weights_mean = weights_mean
@@ -374,23 +394,47 @@ class RNN(Model):
         ###############
         hiddens = self.xs
         updates = dict()
+        # the carried hiddens for each layer if we are stateful (truncated BPTT)
+        self.state_variables = []
         # vanilla case! there will be only 1 hidden layer for each depth layer.
         for layer in range(self.layers):
             log.debug("Updating hidden layer %d" % (layer+1))
-            # normal case - either forward or just backward!
-            hiddens_new, updates = theano.scan(
-                fn=self.recurrent_step,
-                sequences=hiddens,
-                outputs_info=self.h_init,
-                non_sequences=[W_x_h[layer], W_h_h[layer], b_h[layer]],
-                go_backwards=self.backward,
-                name="rnn_scan_normal_%d" % layer,
-                strict=True
-            )
-            updates.update(updates)
+            h_init = self.h_init
+            if self.stateful:
+                h_state, h_init = get_carried_state(self.h_init, name="rnn_h_state_%d" % layer)
+                self.state_variables.append(h_state)
+            # bidirectional case in one pass - stack the forward and reversed input projections along the features
+            if self.bidirectional and self.single_scan:
+                x_h = T.dot(hiddens, W_x_h[layer]) + b_h[layer]
+                hiddens_both, updates_both = theano.scan(
+                    fn=self.projected_recurrent_step,
+                    sequences=stack_bidirectional_inputs(x_h, self.hidden_size),
+                    outputs_info=T.concatenate([h_init, self.h_init], axis=1),
+                    non_sequences=[stack_bidirectional_weights(W_h_h[layer], W_h_hb[layer], self.hidden_size)],
+                    name="rnn_scan_bidirectional_%d" % layer,
+                    strict=True
+                )
+                updates.update(updates_both)
+                hiddens_new, hiddens_opposite = unstack_bidirectional(hiddens_both, self.hidden_size)
+                hiddens_new = hiddens_new + hiddens_opposite
+
+            else:
+                # normal case - either forward or just backward!
+                hiddens_new, updates_normal = theano.scan(
+                    fn=self.recurrent_step,
+                    sequences=hiddens,
+                    outputs_info=h_init,
+                    non_sequences=[W_x_h[layer], W_h_h[layer], b_h[layer]],
+                    go_backwards=self.backward,
+                    name="rnn_scan_normal_%d" % layer,
+                    strict=True
+                )
+                updates.update(updates_normal)
+                if self.stateful:
+                    updates[h_state] = hiddens_new[-1]
 
             # bidirectional case - need to add a backward sequential pass to compute new hiddens!
-            if self.bidirectional:
+            if self.bidirectional and not self.single_scan:
                 # now do the opposite direction for the scan!
                 hiddens_opposite, updates_opposite = theano.scan(
                     fn=self.recurrent_step,
@@ -402,7 +446,8 @@ class RNN(Model):
                     strict=True
                 )
                 updates.update(updates_opposite)
-                hiddens_new = hiddens_new + hiddens_opposite
+                # flip the backward hiddens to be the right direction
+                hiddens_new = hiddens_new + hiddens_opposite[::-1]
 
             # replace the hiddens with the newly computed hiddens (and add noise)!
             hiddens = hiddens_new
@@ -450,12 +495,39 @@ class RNN(Model):
         )
         return h_t
 
+    def projected_recurrent_step(self, x_h_t, h_tm1, W_h_h):
+        """
+        Performs one computation step over time, with the input-to-hidden projection (and bias) already computed
+        outside of scan.
+
+        Parameters
+        ----------
+        x_h_t : tensor
+            The current timestep (t) projected input value.
+        h_tm1 : tensor
+            The previous timestep (t-1) hidden values.
+        W_h_h : tensor
+            The hidden-to-hidden timestep weights matrix to use.
+
+        Returns
+        -------
+        tensor
+            h_t the current timestep (t) hidden values.
+        """
+        h_t = self.hidden_activation_func(
+            x_h_t + T.dot(h_tm1, W_h_h)
+        )
+        return h_t
+
     ###################
     # Model functions #
     ###################
     def get_inputs(self):
         return [self.input]
 
+    def reset_state(self):
+        reset_carried_state(self.state_variables)
+
     def get_hiddens(self):
         return self.hiddens
 
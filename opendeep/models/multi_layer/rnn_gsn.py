@@ -10,6 +10,7 @@ try:
 except ImportError:
     import pickle
 # third party libraries
+import numpy
 import theano
 import theano.tensor as T
 import theano.sandbox.rng_mrg as RNG_MRG
@@ -210,6 +211,8 @@ class RNN_GSN(Model):
 
         # make a symbolic vector for the initial recurrent hiddens value to use during generation for the model
         self.generate_u0 = T.vector("generate_u0")
+        # and a symbolic matrix of initial recurrent hiddens for generating a batch of sequences at once
+        self.generate_u0_batch = T.matrix("generate_u0_batch")
 
         # either grab the hidden's desired size from the parameter directly, or copy n_in
         self.hidden_size = hidden_size or self.input_size
@@ -253,7 +256,7 @@ class RNN_GSN(Model):
         if self.params_hook is not None:
             # if tied weights, expect (layers*2 + 1) params for GSN and (int(layers+1)/int(2) + 3) for RNN
             if self.tied_weights:
-                expected_num = (2*self.layers + 1) + (int(self.layers+1)/2 + 3)
+                expected_num = (2*self.layers + 1) + (int(self.layers+1)//2 + 3)
                 assert len(self.params_hook) == expected_num, \
                     "Tied weights: expected {0!s} params, found {1!s}!".format(expected_num, len(self.params_hook))
                 gsn_len = (2*self.layers + 1)
@@ -262,14 +265,14 @@ class RNN_GSN(Model):
 
             # if untied weights, expect layers*3 + 1 params
             else:
-                expected_num = (3*self.layers + 1) + (int(self.layers + 1)/2 + 3)
+                expected_num = (3*self.layers + 1) + (int(self.layers + 1)//2 + 3)
                 assert len(self.params_hook) == expected_num, \
                     "Untied weights: expected {0!s} params, found {1!s}!".format(expected_num, len(self.params_hook))
                 gsn_len = (3*self.layers + 1)
                 self.weights_list = self.params_hook[:2*self.layers]
                 self.bias_list = self.params_hook[2*self.layers:gsn_len]
 
-            rnn_len = gsn_len + int(self.layers + 1) / 2
+            rnn_len = gsn_len + int(self.layers + 1) // 2
             self.recurrent_to_gsn_weights_list = self.params_hook[gsn_len:rnn_len]
             self.W_u_u = self.params_hook[rnn_len:rnn_len + 1]
             self.W_x_u = self.params_hook[rnn_len + 1:rnn_len + 2]
@@ -374,7 +377,7 @@ class RNN_GSN(Model):
             if layer % 2 != 0:
                 h_list.append(T.zeros_like(T.dot(h_list[-1], w)))
             else:
-                h_list.append((h_ts.T[(layer/2) * self.hidden_size:(layer/2 + 1) * self.hidden_size]).T)
+                h_list.append((h_ts.T[(layer//2) * self.hidden_size:(layer//2 + 1) * self.hidden_size]).T)
 
         gsn = GSN(
             inputs_hook        = (self.input_size, self.input),
@@ -424,7 +427,8 @@ class RNN_GSN(Model):
         x_t : tensor
             The input at time t.
         u_tm1 : tensor
-            The previous timestep (t-1) recurrent hiddens.
+            The previous timestep (t-1) recurrent hiddens. When generating, this can be a matrix with the
+            recurrent hiddens for a batch of sequences (one per row).
 
         Returns
         -------
@@ -432,21 +436,23 @@ class RNN_GSN(Model):
             Current generated visible x_t and recurrent u_t if generating (no x_t given as parameter),
             otherwise current recurrent u_t and hiddens h_t.
         """
+        batch = u_tm1.ndim == 2
         # If `x_t` is given, deterministic recurrence to compute the u_t. Otherwise, first generate.
         # Make current guess for hiddens based on U
         h_list = []
         for i in range(self.layers):
             if i % 2 == 0:
                 log.debug("Using {0!s} and {1!s}".format(
-                    self.recurrent_to_gsn_weights_list[(i+1) / 2], self.bias_list[i+1]))
-                h = T.dot(u_tm1, self.recurrent_to_gsn_weights_list[(i+1) / 2]) + self.bias_list[i+1]
+                    self.recurrent_to_gsn_weights_list[(i+1) // 2], self.bias_list[i+1]))
+                h = T.dot(u_tm1, self.recurrent_to_gsn_weights_list[(i+1) // 2]) + self.bias_list[i+1]
                 h = self.hidden_activation_func(h)
                 h_list.append(h)
-        h_t = T.concatenate(h_list, axis=0)
+        h_t = T.concatenate(h_list, axis=u_tm1.ndim - 1)
 
         generate = x_t is None
         if generate:
-            h_list_generate = [T.shape_padleft(h) for h in h_list]
+            # the GSN hiddens need a batch dimension (which is already there when generating a batch)
+            h_list_generate = h_list if batch else [T.shape_padleft(h) for h in h_list]
             # create a GSN to generate x_t
             assert self.input_size, self
             gsn = GSN(
@@ -476,7 +482,9 @@ class RNN_GSN(Model):
                 image_height       = self.image_height
             )
 
-            x_t = gsn.get_outputs().flatten()
+            x_t = gsn.get_outputs()
+            if not batch:
+                x_t = x_t.flatten()
 
         ua_t = T.dot(x_t, self.W_x_u) + T.dot(u_tm1, self.W_u_u) + self.recurrent_bias
         u_t = self.rnn_hidden_activation_func(ua_t)
@@ -530,22 +538,51 @@ class RNN_GSN(Model):
     def get_outputs(self):
         return self.x_sample
 
-    def generate(self, initial=None, n_steps=None):
+    def generate(self, initial=None, n_steps=None, n_sequences=None):
         """
         Generate visible inputs from the model for `n_steps` and starting at recurrent hidden state `initial`.
 
+        If `initial` is a matrix (one recurrent hidden state per row) or `n_sequences` is given, a batch of
+        independent sequences is generated at once in the same scan. Every sequence gets its own random draws.
+
         Parameters
         ----------
-        initial : tensor
-            Recurrent hidden state to start generation from.
+        initial : array_like
+            Recurrent hidden state (or matrix of states) to start generation from.
         n_steps : int
             Number of generation steps to do.
+        n_sequences : int, optional
+            Number of sequences to generate at once when starting from the default initial state.
 
         Returns
         -------
         tuple(array_like, array_like)
-            The generated inputs and the ending recurrent hidden states.
+            The generated inputs and the ending recurrent hidden states. For a batch, the inputs are
+            (n_sequences, n_steps, input_size) and the states are (n_sequences, rnn_hidden_size).
         """
+        if initial is None:
+            initial = self.u0.eval()
+            if n_sequences is not None:
+                initial = numpy.tile(initial, (n_sequences, 1))
+        initial = numpy.asarray(initial, dtype=theano.config.floatX)
+        n_steps = n_steps or self.generate_n_steps
+
+        if initial.ndim == 2:
+            # compile the batch generate function!
+            if not hasattr(self, 'f_generate_batch'):
+                log.debug("compiling f_generate_batch...")
+                (x_ts, u_ts), updates_generate = theano.scan(lambda u_tm1: self.recurrent_step(None, u_tm1),
+                                                             outputs_info=[None, self.generate_u0_batch],
+                                                             n_steps=self.n_steps,
+                                                             name="rnngsn_generate_batch_scan")
+                # put the sequences first: (n_sequences, n_steps, input_size)
+                self.f_generate_batch = function(inputs=[self.generate_u0_batch, self.n_steps],
+                                                 outputs=[x_ts.dimshuffle(1, 0, 2), u_ts[-1]],
+                                                 updates=updates_generate,
+                                                 name="rnngsn_f_generate_batch")
+                log.debug("compilation done!")
+            return self.f_generate_batch(initial, n_steps)
+
         # compile the generate function!
         if not hasattr(self, 'f_generate'):
             log.debug("compiling f_generate...")
@@ -553,10 +590,39 @@ class RNN_GSN(Model):
                                        outputs=[self.x_ts, self.u_t],
                                        updates=self.updates_generate)
             log.debug("compilation done!")
+        return self.f_generate(initial, n_steps)
+
+    def generate_stream(self, initial=None, n_steps=None, chunk_size=100, n_sequences=None):
+        """
+        Generate visible inputs like `generate`, yielding them in chunks of timesteps so long generations
+        don't have to be kept in memory (or waited on) all at once. Each chunk continues from the recurrent
+        hidden state where the previous chunk ended.
 
-        initial = initial or self.u0.eval()
+        Parameters
+        ----------
+        initial : array_like
+            Recurrent hidden state (or matrix of states) to start generation from.
+        n_steps : int
+            Total number of generation steps to do.
+        chunk_size : int
+            Number of generation steps per chunk.
+        n_sequences : int, optional
+            Number of sequences to generate at once when starting from the default initial state.
+
+        Yields
+        ------
+        array_like
+            The next chunk of generated inputs (along the time axis - axis 1 for a batch).
+        """
+        assert chunk_size > 0, "chunk_size needs to be > 0, found %s" % str(chunk_size)
         n_steps = n_steps or self.generate_n_steps
-        return self.f_generate(initial, n_steps)
+        u = initial
+        done = 0
+        while done < n_steps:
+            steps = min(chunk_size, n_steps - done)
+            x_ts, u = self.generate(initial=u, n_steps=steps, n_sequences=n_sequences)
+            done += steps
+            yield x_ts
 
     def get_train_cost(self):
         return self.cost
@@ -10,6 +10,7 @@ try:
 except ImportError:
     import pickle
 # third party libraries
+import numpy
 import theano
 import theano.tensor as T
 import theano.sandbox.rng_mrg as RNG_MRG
@@ -40,7 +41,8 @@ class RNN_RBM(Model):
                  rnn_weights_init='identity',
                  rnn_weights_mean=0, rnn_weights_std=5e-3, rnn_weights_interval='montreal',
                  rnn_bias_init=0,
-                 generate_n_steps=200):
+                 generate_n_steps=200,
+                 persistent=False):
         """
         Initialize the RNN-RBM.
 
@@ -108,6 +110,10 @@ class RNN_RBM(Model):
             The initial value to use for the recurrent bias parameter. Most often, the default of 0.0 is preferred.
         generate_n_steps : int
             When generating from the model, how many steps to generate.
+        persistent : bool
+            Whether to train the conditional RBMs with persistent contrastive divergence (PCD-k). The persistent
+            chains have one row per timestep (lined up with the per-timestep biases) and continue from the last
+            update as long as the sequence length stays the same; they restart from the input when it changes.
         """
         super(RNN_RBM, self).__init__(**{arg: val for (arg, val) in locals().items() if arg is not 'self'})
 
@@ -117,6 +123,7 @@ class RNN_RBM(Model):
         self.mrg = mrg
         self.k = k
         self.generate_n_steps = generate_n_steps
+        self.persistent = persistent
 
         # grab info from the inputs_hook, hiddens_hook, or from parameters
         if self.inputs_hook is not None:  # inputs_hook is a tuple of (Shape, Input)
@@ -130,6 +137,8 @@ class RNN_RBM(Model):
 
         # make a symbolic vector for the initial recurrent hiddens value to use during generation for the model
         self.generate_u0 = T.vector("generate_u0")
+        # and a symbolic matrix of initial recurrent hiddens for generating a batch of sequences at once
+        self.generate_u0_batch = T.matrix("generate_u0_batch")
 
         # either grab the hidden's desired size from the parameter directly, or copy n_in
         self.hidden_size = hidden_size or self.input_size
@@ -271,8 +280,10 @@ class RNN_RBM(Model):
                   visible_activation=self.visible_activation_func,
                   hidden_activation=self.hidden_activation_func,
                   k=self.k,
+                  persistent=self.persistent,
                   outdir=os.path.join(self.outdir, 'rbm'),
                   mrg=self.mrg)
+        self.rbm = rbm
         v_sample    = rbm.get_outputs()
         cost        = rbm.get_train_cost()
         monitors    = rbm.get_monitors()
@@ -328,7 +339,8 @@ class RNN_RBM(Model):
         generate = v_t is None
         updates = None
         if generate:
-            rbm = RBM(inputs_hook=(self.input_size, T.zeros((self.input_size,))),
+            # (a matrix of biases when generating a batch of sequences - one row per sequence)
+            rbm = RBM(inputs_hook=(self.input_size, T.zeros_like(bv_t)),
                       params_hook=(self.W, bv_t, bh_t),
                       visible_activation=self.visible_activation_func,
                       hidden_activation=self.hidden_activation_func,
@@ -384,31 +396,93 @@ class RNN_RBM(Model):
     def get_inputs(self):
         return self.input
 
+    def reset_chains(self):
+        """
+        Restarts the persistent PCD chains of the conditional RBM (see `persistent`).
+        """
+        self.rbm.reset_chains()
+
     def get_outputs(self):
         return self.v_sample
 
-    def generate(self, initial=None, n_steps=None):
+    def generate(self, initial=None, n_steps=None, n_sequences=None):
         """
-        Generate visible inputs from the model for n_steps and starting at recurrent hidden state initial
+        Generate visible inputs from the model for n_steps and starting at recurrent hidden state initial.
 
-        :param initial: recurrent hidden state to start generation from
-        :type initial: tensor
+        If `initial` is a matrix (one recurrent hidden state per row) or `n_sequences` is given, a batch of
+        independent sequences is generated at once in the same scan. Every sequence gets its own random draws.
+
+        :param initial: recurrent hidden state (or matrix of states) to start generation from
+        :type initial: array_like
 
         :param n_steps: number of generation steps to do
         :type n_steps: int
 
-        :return: the generated inputs and the ending recurrent hidden state
-        :rtype: matrix, matrix
+        :param n_sequences: number of sequences to generate at once when starting from the default initial state
+        :type n_sequences: int
+
+        :return: the generated inputs and the ending recurrent hidden state - for a batch, the inputs are
+            (n_sequences, n_steps, input_size) and the states are (n_sequences, rnn_hidden_size)
+        :rtype: array, array
         """
+        if initial is None:
+            initial = self.u0.eval()
+            if n_sequences is not None:
+                initial = numpy.tile(initial, (n_sequences, 1))
+        initial = numpy.asarray(initial, dtype=theano.config.floatX)
+        n_steps = n_steps or self.generate_n_steps
+
+        if initial.ndim == 2:
+            # compile the batch generate function!
+            if not hasattr(self, 'f_generate_batch'):
+                (v_ts, u_ts), updates_generate = theano.scan(lambda u_tm1: self.recurrence(None, u_tm1),
+                                                             outputs_info=[None, self.generate_u0_batch],
+                                                             n_steps=self.n_steps,
+                                                             name="rnnrbm_generate_batch_scan")
+                # put the sequences first: (n_sequences, n_steps, input_size)
+                self.f_generate_batch = function(inputs=[self.generate_u0_batch, self.n_steps],
+                                                 outputs=[v_ts.dimshuffle(1, 0, 2), u_ts[-1]],
+                                                 updates=updates_generate,
+                                                 name="rnnrbm_f_generate_batch")
+            return self.f_generate_batch(initial, n_steps)
+
         # compile the generate function!
         if not hasattr(self, 'f_generate'):
-            self.f_generate = function(inputs=[self. generate_u0, self.n_steps],
+            self.f_generate = function(inputs=[self.generate_u0, self.n_steps],
                                        outputs=[self.v_ts, self.u_t],
                                        updates=self.updates_generate)
+        return self.f_generate(initial, n_steps)
 
-        initial = initial or self.u0.eval()
+    def generate_stream(self, initial=None, n_steps=None, chunk_size=100, n_sequences=None):
+        """
+        Generate visible inputs like `generate`, yielding them in chunks of timesteps so long generations
+        don't have to be kept in memory (or waited on) all at once. Each chunk continues from the recurrent
+        hidden state where the previous chunk ended.
+
+        :param initial: recurrent hidden state (or matrix of states) to start generation from
+        :type initial: array_like
+
+        :param n_steps: total number of generation steps to do
+        :type n_steps: int
+
+        :param chunk_size: number of generation steps per chunk
+        :type chunk_size: int
+
+        :param n_sequences: number of sequences to generate at once when starting from the default initial state
+        :type n_sequences: int
+
+        :return: generator over the chunks of generated inputs (along the time axis - axis 1 for a batch)
+        :rtype: generator
+        """
+        assert chunk_size > 0, "chunk_size needs to be > 0, found %s" % str(chunk_size)
         n_steps = n_steps or self.generate_n_steps
-        return self.f_generate(initial, n_steps)
+        u = initial
+        done = 0
+        while done < n_steps:
+            steps = min(chunk_size, n_steps - done)
+            v_ts, u = self.generate(initial=u, n_steps=steps, n_sequences=n_sequences)
+            done += steps
+            yield v_ts
 
     def get_train_cost(self):
         return self.cost
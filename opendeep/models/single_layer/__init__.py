@@ -5,4 +5,5 @@ from .basic import *
 from .convolutional import *
 from .restricted_boltzmann_machine import *
 from .gru import GRU
-from .lstm import LSTM
\ No newline at end of file
+from .lstm import LSTM
+from .normalization import BatchNormalization
\ No newline at end of file
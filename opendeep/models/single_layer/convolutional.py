@@ -301,8 +301,8 @@ class Conv2D(Model):
             assert len(self.inputs_hook) == 2, "expecting inputs_hook to be tuple of (shape, input)"
             self.input = inputs_hook[1]
         else:
-            # make the input a symbolic matrix
-            self.input = T.ftensor4('X')
+            # make the input a symbolic 4D tensor (of floatX, like the weights)
+            self.input = T.tensor4('X')
 
         # activation function!
         activation_func = get_activation_function(activation)
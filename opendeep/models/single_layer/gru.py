@@ -7,6 +7,7 @@ import logging
 import theano
 import theano.tensor as T
 import theano.sandbox.rng_mrg as RNG_MRG
+from theano.compat.python2x import OrderedDict
 # internal references
 from opendeep.utils.constructors import sharedX
 from opendeep.models.model import Model
@@ -14,7 +15,8 @@ from opendeep.utils.activation import get_activation_function
 from opendeep.utils.cost import get_cost_function
 from opendeep.utils.decay import get_decay_function
 from opendeep.utils.decorators import inherit_docs
-from opendeep.utils.nnet import get_weights, get_bias
+from opendeep.utils.nnet import (get_weights, get_bias, get_carried_state, reset_carried_state,
+                                 fuse_weights, slice_gate, fuse_gate_values, split_gate_values)
 from opendeep.utils.noise import get_noise
 
 log = logging.getLogger(__name__)
@@ -40,7 +42,9 @@ class GRU(Model):
                  cost_function='mse', cost_args=None,
                  noise='dropout', noise_level=None, noise_decay=False, noise_decay_amount=.99,
                  forward=True,
-                 clip_recurrent_grads=False):
+                 clip_recurrent_grads=False,
+                 stateful=False,
+                 fused_gates=False):
         """
         Initialize a simple recurrent network.
 
@@ -129,6 +133,15 @@ class GRU(Model):
             connecting previous hidden states to the current hidden state, and not the weights from current
             input to hiddens). If it is a float, the gradients for the weights will be hard clipped to the range
             `+-clip_recurrent_grads`.
+        stateful : bool, optional
+            Whether to carry the last hiddens over as the initial state of the next call, for truncated
+            backpropagation through time over consecutive chunks of long sequences. Use `reset_state()` at
+            sequence boundaries.
+        fused_gates : bool, optional
+            Whether to keep the weights and biases for the three gates concatenated in one parameter each
+            ('W_x_gates', 'U_h_gates', and 'b_gates'), so every timestep does a single hidden-to-hidden dot product
+            instead of three smaller ones. Parameters saved with either layout can be loaded into the other.
+            With a `params_hook`, the parameters need to be in this fused layout.
         """
         initial_parameters = locals().copy()
         initial_parameters.pop('self')
@@ -229,12 +242,27 @@ class GRU(Model):
         ####################################################
         # parameters - make sure to deal with params_hook! #
         ####################################################
+        self.fused_gates = fused_gates
+        gates = ['z', 'r', 'h']
+        # the names of the fused gate parameters and their split parts, for converting saved parameters.
+        self.gate_layout = OrderedDict([
+            ("W_x_gates", ["W_x_%s" % sub for sub in gates]),
+            ("U_h_gates", ["U_h_%s" % sub for sub in gates]),
+            ("b_gates", ["b_%s" % sub for sub in gates])
+        ])
+
         if self.params_hook is not None:
-            (W_x_z, W_x_r, W_x_h,
-             U_h_z, U_h_r, U_h_h,
-             W_h_y, b_z, b_r, b_h,
-             b_y) = self.params_hook
-            recurrent_params = [U_h_z, U_h_r, U_h_h]
+            if fused_gates:
+                (W_x, U_h,
+                 W_h_y, b,
+                 b_y) = self.params_hook
+                recurrent_params = [U_h]
+            else:
+                (W_x_z, W_x_r, W_x_h,
+                 U_h_z, U_h_r, U_h_h,
+                 W_h_y, b_z, b_r, b_h,
+                 b_y) = self.params_hook
+                recurrent_params = [U_h_z, U_h_r, U_h_h]
         # otherwise, construct our params
         else:
             # all input-to-hidden weights
@@ -247,7 +275,7 @@ class GRU(Model):
                             std=weights_std,
                             # if uniform
                             interval=weights_interval)
-                for sub in ['z', 'r', 'h']
+                for sub in gates
             ]
             # all hidden-to-hidden weights
             U_h_z, U_h_r, U_h_h = [
@@ -259,7 +287,7 @@ class GRU(Model):
                             std=r_weights_std,
                             # if uniform
                             interval=r_weights_interval)
-                for sub in ['z', 'r', 'h']
+                for sub in gates
             ]
             # hidden-to-output weights
             W_h_y = get_weights(weights_init=weights_init,
@@ -275,44 +303,78 @@ class GRU(Model):
                 get_bias(shape=(self.hidden_size,),
                          name="b_%s" % sub,
                          init_values=r_bias_init)
-                for sub in ['z', 'r', 'h']
+                for sub in gates
             ]
             # output bias
             b_y = get_bias(shape=(self.output_size,),
                            name="b_y",
                            init_values=bias_init)
-            # clip gradients if we are doing that
-            recurrent_params = [U_h_z, U_h_r, U_h_h]
-            if clip_recurrent_grads:
-                clip = abs(clip_recurrent_grads)
-                U_h_z, U_h_r, U_h_h = [theano.gradient.grad_clip(p, -clip, clip) for p in recurrent_params]
+            if fused_gates:
+                # concatenate the (separately initialized) gate parameters
+                W_x = fuse_weights([W_x_z, W_x_r, W_x_h], name="W_x_gates")
+                U_h = fuse_weights([U_h_z, U_h_r, U_h_h], name="U_h_gates")
+                b = fuse_weights([b_z, b_r, b_h], name="b_gates")
+                # clip gradients if we are doing that
+                recurrent_params = [U_h]
+                if clip_recurrent_grads:
+                    clip = abs(clip_recurrent_grads)
+                    U_h = theano.gradient.grad_clip(U_h, -clip, clip)
+            else:
+                # clip gradients if we are doing that
+                recurrent_params = [U_h_z, U_h_r, U_h_h]
+                if clip_recurrent_grads:
+                    clip = abs(clip_recurrent_grads)
+                    U_h_z, U_h_r, U_h_h = [theano.gradient.grad_clip(p, -clip, clip) for p in recurrent_params]
 
         # put all the parameters into our list, and make sure it is in the same order as when we try to load
         # them from a params_hook!!!
-        self.params = [W_x_z, W_x_r, W_x_h] + recurrent_params + [W_h_y, b_z, b_r, b_h, b_y]
+        if fused_gates:
+            self.params = [W_x] + recurrent_params + [W_h_y, b, b_y]
+            # the input projection to use for sizing the initial hiddens
+            W_x_h = slice_gate(W_x, 2, self.hidden_size)
+        else:
+            self.params = [W_x_z, W_x_r, W_x_h] + recurrent_params + [W_h_y, b_z, b_r, b_h, b_y]
 
         # make h_init the right sized tensor
         if not self.hiddens_hook:
             h_init = T.zeros_like(T.dot(xs[0], W_x_h))
 
+        # carry the last hiddens over from the previous call if we are stateful (truncated BPTT)
+        self.state_variables = []
+        if stateful:
+            assert forward, "A stateful GRU needs to go forward over its inputs!"
+            h_state, h_init = get_carried_state(h_init, name="gru_h_state")
+            self.state_variables = [h_state]
+
         ###############
         # computation #
         ###############
         # move some computation outside of scan to speed it up!
-        x_z = T.dot(xs, W_x_z) + b_z
-        x_r = T.dot(xs, W_x_r) + b_r
-        x_h = T.dot(xs, W_x_h) + b_h
+        if fused_gates:
+            # one input projection for all the gates, and one hidden-to-hidden dot product per step
+            step = self.fused_recurrent_step
+            sequences = [T.dot(xs, W_x) + b]
+            non_sequences = [U_h]
+        else:
+            step = self.recurrent_step
+            x_z = T.dot(xs, W_x_z) + b_z
+            x_r = T.dot(xs, W_x_r) + b_r
+            x_h = T.dot(xs, W_x_h) + b_h
+            sequences = [x_z, x_r, x_h]
+            non_sequences = [U_h_z, U_h_r, U_h_h]
 
         # now do the recurrent stuff
         self.hiddens, self.updates = theano.scan(
-            fn=self.recurrent_step,
-            sequences=[x_z, x_r, x_h],
+            fn=step,
+            sequences=sequences,
             outputs_info=[h_init],
-            non_sequences=[U_h_z, U_h_r, U_h_h],
+            non_sequences=non_sequences,
             go_backwards=not forward,
             name="gru_scan",
             strict=True
         )
+        if stateful:
+            self.updates[h_state] = self.hiddens[-1]
 
         # add noise (like dropout) if we wanted it!
         if noise:
@@ -350,6 +412,28 @@ class GRU(Model):
         # return the hiddens
         return h_t
 
+    def fused_recurrent_step(self, x_t, h_tm1, U_h):
+        """
+        Performs one computation step over time with the fused gate parameters (see `fused_gates`).
+        """
+        # all the hidden-to-hidden products at once, in the order z, r, h
+        h_dot = T.dot(h_tm1, U_h)
+        # update gate
+        z_t = self.inner_hidden_activation_func(
+            slice_gate(x_t, 0, self.hidden_size) + slice_gate(h_dot, 0, self.hidden_size)
+        )
+        # reset gate
+        r_t = self.inner_hidden_activation_func(
+            slice_gate(x_t, 1, self.hidden_size) + slice_gate(h_dot, 1, self.hidden_size)
+        )
+        # new memory content
+        h_tilde = self.hidden_activation_func(
+            slice_gate(x_t, 2, self.hidden_size) + r_t*slice_gate(h_dot, 2, self.hidden_size)
+        )
+        h_t = (1 - z_t)*h_tm1 + z_t*h_tilde
+        # return the hiddens
+        return h_t
+
     ###################
     # Model functions #
     ###################
@@ -388,5 +472,27 @@ class GRU(Model):
         else:
             return super(GRU, self).get_switches()
 
+    def reset_state(self):
+        reset_carried_state(self.state_variables)
+
     def get_params(self):
         return self.params
+
+    def get_param_values(self, borrow=True):
+        # the values by parameter name, so they can be converted between the gate layouts
+        return OrderedDict([(param.name, param.get_value(borrow=borrow)) for param in self.params])
+
+    def set_param_values(self, param_values, borrow=True):
+        # accept parameters saved with either the split or the fused gate layout
+        if self.fused_gates:
+            param_values = fuse_gate_values(param_values, self.gate_layout)
+        else:
+            param_values = split_gate_values(param_values, self.gate_layout)
+        success = True
+        for param in self.params:
+            if param.name in param_values:
+                param.set_value(param_values[param.name], borrow=borrow)
+            else:
+                log.warning("No value was supplied for param %s of %s!", param.name, self._classname)
+                success = False
+        return success
@@ -7,6 +7,7 @@ import logging
 import theano
 import theano.tensor as T
 import theano.sandbox.rng_mrg as RNG_MRG
+from theano.compat.python2x import OrderedDict
 # internal references
 from opendeep.utils.constructors import sharedX
 from opendeep.models.model import Model
@@ -14,7 +15,9 @@ from opendeep.utils.activation import get_activation_function
 from opendeep.utils.cost import get_cost_function
 from opendeep.utils.decay import get_decay_function
 from opendeep.utils.decorators import inherit_docs
-from opendeep.utils.nnet import get_weights, get_bias
+from opendeep.utils.nnet import (get_weights, get_bias, get_carried_state, reset_carried_state,
+                                 fuse_weights, slice_gate, fuse_gate_values, split_gate_values,
+                                 stack_bidirectional_inputs, stack_bidirectional_weights, unstack_bidirectional)
 from opendeep.utils.noise import get_noise
 
 log = logging.getLogger(__name__)
@@ -41,7 +44,10 @@ class LSTM(Model):
                  cost_function='mse', cost_args=None,
                  noise='dropout', noise_level=None, noise_decay=False, noise_decay_amount=.99,
                  direction='forward',
-                 clip_recurrent_grads=False):
+                 clip_recurrent_grads=False,
+                 stateful=False,
+                 fused_gates=False,
+                 single_scan=False):
         """
         Initialize a simple recurrent network.
 
@@ -133,6 +139,20 @@ class LSTM(Model):
             connecting previous hidden states to the current hidden state, and not the weights from current
             input to hiddens). If it is a float, the gradients for the weights will be hard clipped to the range
             `+-clip_recurrent_grads`.
+        stateful : bool, optional
+            Whether to carry the last hiddens and memory cells over as the initial state of the next call, for
+            truncated backpropagation through time over consecutive chunks of long sequences. Use `reset_state()`
+            at sequence boundaries. Only the forward pass is carried over.
+        fused_gates : bool, optional
+            Whether to keep the weights and biases for the four gates concatenated in one parameter each
+            ('W_x_gates', 'U_h_gates', 'b_gates', and 'U_h_gates_b' if bidirectional), so every timestep does a single
+            hidden-to-hidden dot product instead of four smaller ones. Parameters saved with either layout can be
+            loaded into the other. With a `params_hook`, the parameters need to be in this fused layout.
+        single_scan : bool, optional
+            When bidirectional, whether to compute both directions in a single scan instead of two. The forward and
+            time-reversed inputs are stacked along the feature axis and the recurrent weights for both directions
+            are combined block-diagonally, so each step runs one larger dot product (per gate, or one in total with
+            `fused_gates`) and the per-step scan overhead is only paid once.
         """
         initial_parameters = locals().copy()
         initial_parameters.pop('self')
@@ -235,8 +255,32 @@ class LSTM(Model):
         ####################################################
         # parameters - make sure to deal with params_hook! #
         ####################################################
+        self.fused_gates = fused_gates
+        gates = ['c', 'i', 'f', 'o']
+        # the names of the fused gate parameters and their split parts, for converting saved parameters.
+        self.gate_layout = OrderedDict([
+            ("W_x_gates", ["W_x_%s" % sub for sub in gates]),
+            ("U_h_gates", ["U_h_%s" % sub for sub in gates]),
+            ("b_gates", ["b_%s" % sub for sub in gates])
+        ])
+        if bidirectional:
+            self.gate_layout["U_h_gates_b"] = ["U_h_%s_b" % sub for sub in gates]
+
         if self.params_hook is not None:
-            if not bidirectional:
+            if fused_gates:
+                if not bidirectional:
+                    (W_x, U_h,
+                     W_h_y, b,
+                     b_y) = self.params_hook
+                    recurrent_params = [U_h]
+                    U_h_b = None
+                else:
+                    (W_x, U_h, U_h_b,
+                     W_h_y, b,
+                     b_y) = self.params_hook
+                    recurrent_params = [U_h, U_h_b]
+
+            elif not bidirectional:
                 (W_x_c, W_x_i, W_x_f, W_x_o,
                  U_h_c, U_h_i, U_h_f, U_h_o,
                  W_h_y, b_c, b_i, b_f, b_o,
@@ -263,7 +307,7 @@ class LSTM(Model):
                             std=weights_std,
                             # if uniform
                             interval=weights_interval)
-                for sub in ['c', 'i', 'f', 'o']
+                for sub in gates
             ]
             # all hidden-to-hidden weights
             U_h_c, U_h_i, U_h_f, U_h_o = [
@@ -275,7 +319,7 @@ class LSTM(Model):
                             std=r_weights_std,
                             # if uniform
                             interval=r_weights_interval)
-                for sub in ['c', 'i', 'f', 'o']
+                for sub in gates
             ]
             # hidden-to-output weights
             W_h_y = get_weights(weights_init=weights_init,
@@ -291,17 +335,12 @@ class LSTM(Model):
                 get_bias(shape=(self.hidden_size,),
                          name="b_%s" % sub,
                          init_values=r_bias_init)
-                for sub in ['c', 'i', 'f', 'o']
+                for sub in gates
             ]
             # output bias
             b_y = get_bias(shape=(self.output_size,),
                            name="b_y",
                            init_values=bias_init)
-            # clip gradients if we are doing that
-            recurrent_params = [U_h_c, U_h_i, U_h_f, U_h_o]
-            if clip_recurrent_grads:
-                clip = abs(clip_recurrent_grads)
-                U_h_c, U_h_i, U_h_f, U_h_o = [theano.gradient.grad_clip(p, -clip, clip) for p in recurrent_params]
             # bidirectional params
             if bidirectional:
                 # all hidden-to-hidden weights
@@ -314,19 +353,49 @@ class LSTM(Model):
                                 std=r_weights_std,
                                 # if uniform
                                 interval=r_weights_interval)
-                    for sub in ['c', 'i', 'f', 'o']
+                    for sub in gates
                 ]
-                recurrent_params += [U_h_c_b, U_h_i_b, U_h_f_b, U_h_o_b]
+            else:
+                U_h_c_b, U_h_i_b, U_h_f_b, U_h_o_b = None, None, None, None
+
+            if fused_gates:
+                # concatenate the (separately initialized) gate parameters
+                W_x = fuse_weights([W_x_c, W_x_i, W_x_f, W_x_o], name="W_x_gates")
+                U_h = fuse_weights([U_h_c, U_h_i, U_h_f, U_h_o], name="U_h_gates")
+                b = fuse_weights([b_c, b_i, b_f, b_o], name="b_gates")
+                recurrent_params = [U_h]
+                U_h_b = None
+                if bidirectional:
+                    U_h_b = fuse_weights([U_h_c_b, U_h_i_b, U_h_f_b, U_h_o_b], name="U_h_gates_b")
+                    recurrent_params.append(U_h_b)
+                # clip gradients if we are doing that
                 if clip_recurrent_grads:
                     clip = abs(clip_recurrent_grads)
-                    U_h_c_b, U_h_i_b, U_h_f_b, U_h_o_b = [theano.gradient.grad_clip(p, -clip, clip) for p in
-                                                          [U_h_c_b, U_h_i_b, U_h_f_b, U_h_o_b]]
+                    U_h = theano.gradient.grad_clip(U_h, -clip, clip)
+                    if bidirectional:
+                        U_h_b = theano.gradient.grad_clip(U_h_b, -clip, clip)
             else:
-                U_h_c_b, U_h_i_b, U_h_f_b, U_h_o_b = None, None, None, None
+                # clip gradients if we are doing that
+                recurrent_params = [U_h_c, U_h_i, U_h_f, U_h_o]
+                if clip_recurrent_grads:
+                    clip = abs(clip_recurrent_grads)
+                    U_h_c, U_h_i, U_h_f, U_h_o = [theano.gradient.grad_clip(p, -clip, clip)
+                                                  for p in recurrent_params]
+                if bidirectional:
+                    recurrent_params += [U_h_c_b, U_h_i_b, U_h_f_b, U_h_o_b]
+                    if clip_recurrent_grads:
+                        clip = abs(clip_recurrent_grads)
+                        U_h_c_b, U_h_i_b, U_h_f_b, U_h_o_b = [theano.gradient.grad_clip(p, -clip, clip) for p in
+                                                              [U_h_c_b, U_h_i_b, U_h_f_b, U_h_o_b]]
 
         # put all the parameters into our list, and make sure it is in the same order as when we try to load
         # them from a params_hook!!!
-        self.params = [W_x_c, W_x_i, W_x_f, W_x_o] + recurrent_params + [W_h_y, b_c, b_i, b_f, b_o, b_y]
+        if fused_gates:
+            self.params = [W_x] + recurrent_params + [W_h_y, b, b_y]
+            # the input projection to use for sizing the initial hiddens
+            W_x_c = slice_gate(W_x, 0, self.hidden_size)
+        else:
+            self.params = [W_x_c, W_x_i, W_x_f, W_x_o] + recurrent_params + [W_h_y, b_c, b_i, b_f, b_o, b_y]
 
         # make h_init the right sized tensor
         if not self.hiddens_hook:
@@ -334,33 +403,76 @@ class LSTM(Model):
 
         c_init = T.zeros_like(T.dot(xs[0], W_x_c))
 
+        # carry the last hiddens and memory over from the previous call if we are stateful (truncated BPTT)
+        self.state_variables = []
+        h_init_forward, c_init_forward = h_init, c_init
+        if stateful:
+            assert not backward, "A stateful LSTM needs to go forward over its inputs, found direction %s" % direction
+            h_state, h_init_forward = get_carried_state(h_init, name="lstm_h_state")
+            c_state, c_init_forward = get_carried_state(c_init, name="lstm_c_state")
+            self.state_variables = [h_state, c_state]
+
         ###############
         # computation #
         ###############
         # move some computation outside of scan to speed it up!
-        x_c = T.dot(xs, W_x_c) + b_c
-        x_i = T.dot(xs, W_x_i) + b_i
-        x_f = T.dot(xs, W_x_f) + b_f
-        x_o = T.dot(xs, W_x_o) + b_o
-
-        # now do the recurrent stuff
-        (self.hiddens, _), self.updates = theano.scan(
-            fn=self.recurrent_step,
-            sequences=[x_c, x_i, x_f, x_o],
-            outputs_info=[h_init, c_init],
-            non_sequences=[U_h_c, U_h_i, U_h_f, U_h_o],
-            go_backwards=backward,
-            name="lstm_scan",
-            strict=True
-        )
+        if fused_gates:
+            # one input projection for all the gates, and one hidden-to-hidden dot product per step
+            step = self.fused_recurrent_step
+            sequences = [T.dot(xs, W_x) + b]
+            non_sequences, non_sequences_b = [U_h], [U_h_b]
+        else:
+            step = self.recurrent_step
+            x_c = T.dot(xs, W_x_c) + b_c
+            x_i = T.dot(xs, W_x_i) + b_i
+            x_f = T.dot(xs, W_x_f) + b_f
+            x_o = T.dot(xs, W_x_o) + b_o
+            sequences = [x_c, x_i, x_f, x_o]
+            non_sequences, non_sequences_b = [U_h_c, U_h_i, U_h_f, U_h_o], [U_h_c_b, U_h_i_b, U_h_f_b, U_h_o_b]
+
+        if bidirectional and single_scan:
+            # go over the forward and reversed sequences at once, with the directions stacked along the features
+            n_gates = 4 if fused_gates else 1
+            sequences = [stack_bidirectional_inputs(x, self.hidden_size, n_gates) for x in sequences]
+            non_sequences = [stack_bidirectional_weights(U, U_b, self.hidden_size, n_gates)
+                             for U, U_b in zip(non_sequences, non_sequences_b)]
+            (hiddens, cells), self.updates = theano.scan(
+                fn=step,
+                sequences=sequences,
+                outputs_info=[T.concatenate([h_init_forward, h_init], axis=1),
+                              T.concatenate([c_init_forward, c_init], axis=1)],
+                non_sequences=non_sequences,
+                name="lstm_scan_bidirectional",
+                strict=True
+            )
+            hiddens_f, hiddens_b = unstack_bidirectional(hiddens, self.hidden_size)
+            if stateful:
+                self.updates[h_state] = hiddens_f[-1]
+                self.updates[c_state] = slice_gate(cells, 0, self.hidden_size)[-1]
+            self.hiddens = hiddens_f + hiddens_b
+
+        else:
+            # now do the recurrent stuff
+            (self.hiddens, cells), self.updates = theano.scan(
+                fn=step,
+                sequences=sequences,
+                outputs_info=[h_init_forward, c_init_forward],
+                non_sequences=non_sequences,
+                go_backwards=backward,
+                name="lstm_scan",
+                strict=True
+            )
+            if stateful:
+                self.updates[h_state] = self.hiddens[-1]
+                self.updates[c_state] = cells[-1]
 
         # if bidirectional, do the same in reverse!
-        if bidirectional:
+        if bidirectional and not single_scan:
             (hiddens_b, _), updates_b = theano.scan(
-                fn=self.recurrent_step,
-                sequences=[x_c, x_i, x_f, x_o],
+                fn=step,
+                sequences=sequences,
                 outputs_info=[h_init, c_init],
-                non_sequences=[U_h_c_b, U_h_i_b, U_h_f_b, U_h_o_b],
+                non_sequences=non_sequences_b,
                 go_backwards=not backward,
                 name="lstm_scan_back",
                 strict=True
@@ -414,6 +526,29 @@ class LSTM(Model):
         # return the hiddens and memory content
         return h_t, c_t
 
+    def fused_recurrent_step(self, x_t, h_tm1, c_tm1, U_h):
+        """
+        Performs one computation step over time with the fused gate parameters (see `fused_gates`).
+        """
+        # all the gate pre-activations at once, in the order c, i, f, o
+        gates = x_t + T.dot(h_tm1, U_h)
+        # the gate size comes from the hiddens (it is doubled when both directions are stacked in one scan)
+        size = h_tm1.shape[-1]
+        # new memory content c_tilde
+        c_tilde = self.hidden_activation_func(slice_gate(gates, 0, size))
+        # input gate
+        i_t = self.inner_hidden_activation_func(slice_gate(gates, 1, size))
+        # forget gate
+        f_t = self.inner_hidden_activation_func(slice_gate(gates, 2, size))
+        # new memory content
+        c_t = f_t*c_tm1 + i_t*c_tilde
+        # output gate
+        o_t = self.inner_hidden_activation_func(slice_gate(gates, 3, size))
+        # new hiddens
+        h_t = o_t*self.hidden_activation_func(c_t)
+        # return the hiddens and memory content
+        return h_t, c_t
+
     ###################
     # Model functions #
     ###################
@@ -452,5 +587,27 @@ class LSTM(Model):
         else:
             return super(LSTM, self).get_switches()
 
+    def reset_state(self):
+        reset_carried_state(self.state_variables)
+
     def get_params(self):
         return self.params
+
+    def get_param_values(self, borrow=True):
+        # the values by parameter name, so they can be converted between the gate layouts
+        return OrderedDict([(param.name, param.get_value(borrow=borrow)) for param in self.params])
+
+    def set_param_values(self, param_values, borrow=True):
+        # accept parameters saved with either the split or the fused gate layout
+        if self.fused_gates:
+            param_values = fuse_gate_values(param_values, self.gate_layout)
+        else:
+            param_values = split_gate_values(param_values, self.gate_layout)
+        success = True
+        for param in self.params:
+            if param.name in param_values:
+                param.set_value(param_values[param.name], borrow=borrow)
+            else:
+                log.warning("No value was supplied for param %s of %s!", param.name, self._classname)
+                success = False
+        return success
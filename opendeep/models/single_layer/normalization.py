@@ -0,0 +1,203 @@
+"""
+This module provides normalization layers, which normalize their inputs with statistics of the data.
+"""
+# standard libraries
+import logging
+# third party libraries
+import numpy
+import theano
+import theano.tensor as T
+from theano.compat.python2x import OrderedDict
+# internal references
+from opendeep.models.single_layer.basic import Dense
+from opendeep.models.single_layer.convolutional import Conv2D
+from opendeep.models.utils.modify_layer import ModifyLayer
+from opendeep.utils.activation import get_activation_function, linear
+from opendeep.utils.constructors import sharedX
+from opendeep.utils.decorators import inherit_docs
+from opendeep.utils.nnet import get_bias
+
+log = logging.getLogger(__name__)
+
+
+@inherit_docs
+class BatchNormalization(ModifyLayer):
+    """
+    Batch normalization: each feature (or channel, for images) is normalized to zero mean and unit variance over
+    the minibatch, then scaled and shifted by the learned `gamma` and `beta`.
+
+    While training (the switch from `get_switches()` is on), the minibatch statistics are used and the running
+    mean and variance are updated through `get_updates()`. With the switch off (running, validating, testing),
+    the running statistics are used. When a :class:`Prototype` is compiled for inference, a batch normalization
+    following a :class:`Dense` or :class:`Conv2D` layer with a linear activation is folded into that layer's
+    weights and biases, so it doesn't need its own pass over the outputs. Put the nonlinearity on the batch
+    normalization instead::
+
+        mlp = Prototype()
+        mlp.add(Dense(input_size=28*28, output_size=1000, activation='linear'))
+        mlp.add(BatchNormalization(input_size=1000, activation='relu'))
+        mlp.add(SoftmaxLayer(output_size=10))
+
+    "Batch Normalization: Accelerating Deep Network Training by Reducing Internal Covariate Shift"
+    Sergey Ioffe, Christian Szegedy
+    http://arxiv.org/abs/1502.03167
+    """
+    def __init__(self, inputs_hook=None, params_hook=None, input_size=None, outdir=None,
+                 activation='linear', momentum=0.1, epsilon=1e-5,
+                 **kwargs):
+        """
+        Initialize a batch normalization layer.
+
+        Parameters
+        ----------
+        inputs_hook : Tuple of (shape, variable)
+            Routing information for the model to accept inputs from elsewhere. For now, it needs to include the
+            shape information (normally the dimensionality of the input i.e. input_size).
+        params_hook : List(theano shared variable)
+            The [gamma, beta] parameters to use instead of initializing new ones.
+        input_size : int or tuple
+            The number of features of (batch, features) inputs, or the (batch, channels, rows, cols) shape of
+            image inputs (normalized per channel). If shape is provided in `inputs_hook`, this is optional.
+        outdir : str
+            The directory you want outputs (parameters, images, etc.) to save to. If None, nothing will
+            be saved.
+        activation : str or callable
+            The activation function to apply after normalizing. See opendeep.utils.activation for options.
+        momentum : float
+            How much of each minibatch's statistics goes into the running mean and variance.
+        epsilon : float
+            Added to the variance to avoid dividing by zero.
+        """
+        # init ModifyLayer to combine the defaults and config dictionaries with the initial parameters.
+        initial_parameters = locals().copy()
+        initial_parameters.pop('self')
+        super(BatchNormalization, self).__init__(**initial_parameters)
+
+        ##################
+        # specifications #
+        ##################
+        if self.input.ndim == 2:
+            # normalize each feature over the batch
+            axes, pattern = (0,), ('x', 0)
+            size = self.input_size[-1] if isinstance(self.input_size, (list, tuple)) else self.input_size
+        elif self.input.ndim == 4:
+            # normalize each channel over the batch and image
+            axes, pattern = (0, 2, 3), ('x', 0, 'x', 'x')
+            size = self.input_size[1]
+        else:
+            raise NotImplementedError("BatchNormalization input with %d dimensions not supported!" % self.input.ndim)
+        self.activation_func = get_activation_function(activation)
+
+        ####################################################
+        # parameters - make sure to deal with params_hook! #
+        ####################################################
+        if params_hook is not None:
+            assert len(params_hook) == 2, \
+                "Expected 2 params (gamma and beta) for BatchNormalization, found {0!s}!".format(len(params_hook))
+            gamma, beta = params_hook
+        else:
+            gamma = get_bias(shape=(size,), name="gamma", init_values=1.)
+            beta = get_bias(shape=(size,), name="beta", init_values=0.)
+        self.params = [gamma, beta]
+        # the running statistics aren't trained by the optimizer, they are updated from the minibatches
+        self.running_mean = sharedX(numpy.zeros((size,)), name="running_mean")
+        self.running_var = sharedX(numpy.ones((size,)), name="running_var")
+        self.statistics = [self.running_mean, self.running_var]
+
+        ###############
+        # computation #
+        ###############
+        # use the minibatch statistics while training, and the running statistics otherwise.
+        self.switch = sharedX(value=1, name="batchnorm_switch")
+        batch_mean = self.input.mean(axis=axes)
+        batch_var = self.input.var(axis=axes)
+        mean = T.switch(self.switch, batch_mean, self.running_mean)
+        var = T.switch(self.switch, batch_var, self.running_var)
+        # the scale and shift are only computed per feature, and broadcast over the input once
+        scale = gamma / T.sqrt(var + epsilon)
+        shift = beta - mean * scale
+        self.output = self.activation_func(self.input * scale.dimshuffle(*pattern) + shift.dimshuffle(*pattern))
+
+        # only update the running statistics while training
+        n = T.cast(self.input.size // batch_mean.size, theano.config.floatX)
+        unbiased_var = batch_var * n / T.maximum(n - 1., 1.)
+        self.updates = OrderedDict([
+            (self.running_mean, T.switch(self.switch,
+                                         (1. - momentum) * self.running_mean + momentum * batch_mean,
+                                         self.running_mean)),
+            (self.running_var, T.switch(self.switch,
+                                        (1. - momentum) * self.running_var + momentum * unbiased_var,
+                                        self.running_var))
+        ])
+
+        log.debug("Initialized a batch normalization layer with size %s and activation: %s",
+                  str(size), str(activation))
+
+    def get_updates(self):
+        return self.updates
+
+    def get_switches(self):
+        return [self.switch]
+
+    def get_params(self):
+        return self.params
+
+    def get_param_values(self, borrow=True):
+        # the running statistics are needed for inference, so they are saved with the parameters
+        return OrderedDict([(variable.name, variable.get_value(borrow=borrow))
+                            for variable in self.params + self.statistics])
+
+    def set_param_values(self, param_values, borrow=True):
+        success = True
+        for variable in self.params + self.statistics:
+            if variable.name in param_values:
+                variable.set_value(param_values[variable.name], borrow=borrow)
+            else:
+                log.warning("No value was supplied for param %s of %s!", variable.name, self._classname)
+                success = False
+        return success
+
+    def fold_values(self, W, b):
+        """
+        Folds the normalization with the running statistics into the (linear) weights and biases before it.
+
+        Parameters
+        ----------
+        W : array_like
+            The (input_size, output_size) weights of a :class:`Dense` layer, or the
+            (filters, channels, rows, cols) weights of a :class:`Conv2D` layer.
+        b : array_like
+            The bias vector.
+
+        Returns
+        -------
+        tuple
+            (W, b) computing the normalized output directly.
+        """
+        gamma, beta = [param.get_value() for param in self.params]
+        scale = gamma / numpy.sqrt(self.running_var.get_value() + self.epsilon)
+        shift = beta - self.running_mean.get_value() * scale
+        W = numpy.asarray(W)
+        # the output features are the last axis of Dense weights, and the first of convolution filters
+        W_scale = scale if W.ndim == 2 else scale.reshape((-1,) + (1,) * (W.ndim - 1))
+        return (W * W_scale).astype(W.dtype), (numpy.asarray(b) * scale + shift).astype(W.dtype)
+
+    def get_folded_outputs(self, previous):
+        if not isinstance(previous, (Dense, Conv2D)) or \
+                get_activation_function(previous.args.get('activation')) is not linear or \
+                previous.get_outputs() is not self.input:
+            log.debug("Can't fold %s into %s, keeping it in the graph.", self._classname, previous._classname)
+            return None
+        W, b = previous.get_params()[:2]
+        # the fold is an expression of the live parameters and running statistics (not a copy of their values),
+        # so a compiled inference function stays correct after more training or loading new parameters. It costs
+        # one elementwise pass over W per call, which is small next to the product with a batch of inputs.
+        gamma, beta = self.params
+        scale = gamma / T.sqrt(self.running_var + self.epsilon)
+        shift = beta - self.running_mean * scale
+        # the output features are the last axis of Dense weights, and the first of convolution filters
+        W_scale = scale.dimshuffle('x', 0) if W.ndim == 2 else scale.dimshuffle(0, 'x', 'x', 'x')
+        # (cast back, since the statistics can be a wider float type than the weights)
+        replace = OrderedDict([(W, T.cast(W * W_scale, W.dtype)), (b, T.cast(b * scale + shift, b.dtype))])
+        # the previous layer's linear output, computed with the folded parameters
+        return self.activation_func(theano.clone(self.input, replace=replace))
@@ -14,7 +14,9 @@ from opendeep.utils.activation import get_activation_function
 from opendeep.utils.cost import get_cost_function
 from opendeep.utils.decay import get_decay_function
 from opendeep.utils.decorators import inherit_docs
-from opendeep.utils.nnet import get_weights, get_bias
+from opendeep.utils.nnet import (get_weights, get_bias, get_carried_state, reset_carried_state,
+                                 stack_bidirectional_inputs, stack_bidirectional_weights, unstack_bidirectional,
+                                 slice_gate)
 from opendeep.utils.noise import get_noise
 
 log = logging.getLogger(__name__)
@@ -36,7 +38,9 @@ class Recurrent(Model):
                  cost_function='mse', cost_args=None,
                  noise='dropout', noise_level=None, noise_decay=False, noise_decay_amount=.99,
                  direction='forward',
-                 clip_recurrent_grads=False):
+                 clip_recurrent_grads=False,
+                 stateful=False,
+                 single_scan=False):
         """
         Initialize a simple recurrent network.
 
@@ -128,6 +132,13 @@ class Recurrent(Model):
             connecting previous hidden states to the current hidden state, and not the weights from current
             input to hiddens). If it is a float, the gradients for the weights will be hard clipped to the range
             `+-clip_recurrent_grads`.
+        stateful : bool, optional
+            Whether to carry the last hiddens and memory cells over as the initial state of the next call, for
+            truncated backpropagation through time over consecutive chunks of long sequences. Use `reset_state()`
+            at sequence boundaries. Only the forward pass is carried over.
+        single_scan : bool, optional
+            When bidirectional, whether to compute both directions in a single scan instead of two (with the
+            directions stacked along the feature axis and block-diagonal recurrent weights).
         """
         initial_parameters = locals().copy()
         initial_parameters.pop('self')
@@ -325,6 +336,16 @@ class Recurrent(Model):
 
         c_init = T.zeros_like(T.dot(xs[0], W_x_c))
 
+        # carry the last hiddens and memory over from the previous call if we are stateful (truncated BPTT)
+        self.state_variables = []
+        h_init_forward, c_init_forward = h_init, c_init
+        if stateful:
+            assert not backward, "A stateful Recurrent layer needs to go forward over its inputs, found direction %s" \
+                                 % direction
+            h_state, h_init_forward = get_carried_state(h_init, name="recurrent_h_state")
+            c_state, c_init_forward = get_carried_state(c_init, name="recurrent_c_state")
+            self.state_variables = [h_state, c_state]
+
         ###############
         # computation #
         ###############
@@ -334,19 +355,41 @@ class Recurrent(Model):
         x_f = T.dot(xs, W_x_f) + b_f
         x_o = T.dot(xs, W_x_o) + b_o
 
-        # now do the recurrent stuff
-        (self.hiddens, _), self.updates = theano.scan(
-            fn=self.recurrent_step,
-            sequences=[x_c, x_i, x_f, x_o],
-            outputs_info=[h_init, c_init],
-            non_sequences=[U_h_c, U_h_i, U_h_f, U_h_o],
-            go_backwards=backward,
-            name="lstm_scan",
-            strict=True
-        )
+        if bidirectional and single_scan:
+            # go over the forward and reversed sequences at once, with the directions stacked along the features
+            (hiddens, cells), self.updates = theano.scan(
+                fn=self.recurrent_step,
+                sequences=[stack_bidirectional_inputs(x, self.hidden_size) for x in [x_c, x_i, x_f, x_o]],
+                outputs_info=[T.concatenate([h_init_forward, h_init], axis=1),
+                              T.concatenate([c_init_forward, c_init], axis=1)],
+                non_sequences=[stack_bidirectional_weights(U, U_b, self.hidden_size)
+                               for U, U_b in zip([U_h_c, U_h_i, U_h_f, U_h_o], [U_h_c_b, U_h_i_b, U_h_f_b, U_h_o_b])],
+                name="lstm_scan_bidirectional",
+                strict=True
+            )
+            hiddens_f, hiddens_b = unstack_bidirectional(hiddens, self.hidden_size)
+            if stateful:
+                self.updates[h_state] = hiddens_f[-1]
+                self.updates[c_state] = slice_gate(cells, 0, self.hidden_size)[-1]
+            self.hiddens = hiddens_f + hiddens_b
+
+        else:
+            # now do the recurrent stuff
+            (self.hiddens, cells), self.updates = theano.scan(
+                fn=self.recurrent_step,
+                sequences=[x_c, x_i, x_f, x_o],
+                outputs_info=[h_init_forward, c_init_forward],
+                non_sequences=[U_h_c, U_h_i, U_h_f, U_h_o],
+                go_backwards=backward,
+                name="lstm_scan",
+                strict=True
+            )
+            if stateful:
+                self.updates[h_state] = self.hiddens[-1]
+                self.updates[c_state] = cells[-1]
 
         # if bidirectional, do the same in reverse!
-        if bidirectional:
+        if bidirectional and not single_scan:
             (hiddens_b, _), updates_b = theano.scan(
                 fn=self.recurrent_step,
                 sequences=[x_c, x_i, x_f, x_o],
@@ -443,5 +486,8 @@ class Recurrent(Model):
         else:
             return super(LSTM, self).get_noise_switch()
 
+    def reset_state(self):
+        reset_carried_state(self.state_variables)
+
     def get_params(self):
         return self.params
@@ -12,13 +12,15 @@ for optimization tips and tricks.
 # standard libraries
 import logging
 # third party libraries
+import numpy
 import theano
 import theano.tensor as T
 import theano.sandbox.rng_mrg as RNG_MRG
 # internal references
 from opendeep.utils.decorators import inherit_docs
 from opendeep.models.model import Model
-from opendeep.utils.nnet import get_weights, get_bias
+from opendeep.utils.constructors import sharedX
+from opendeep.utils.nnet import get_weights, get_bias, get_carried_state, reset_carried_state
 from opendeep.utils.activation import get_activation_function, is_binary
 from opendeep.utils.cost import binary_crossentropy
 
@@ -44,7 +46,7 @@ class RBM(Model):
                  weights_init='uniform', weights_mean=0, weights_std=5e-3, weights_interval='montreal',
                  bias_init=0.0,
                  mrg=RNG_MRG.MRG_RandomStreams(1),
-                 k=15, persistent=True):
+                 k=15, persistent=False, n_chains=None):
         """
         RBM constructor. Defines the parameters of the model along with
         basic operations for inferring hidden from visible (and vice-versa),
@@ -97,6 +99,15 @@ class RBM(Model):
         k : int
             The k number of steps used for CD-k or PCD-k with Gibbs sampling. Basically, the number of samples
             generated from the model to train against reconstructing the original input.
+        persistent : bool
+            Whether to train with persistent contrastive divergence (PCD-k). Instead of starting the Gibbs chain
+            from the input every update, the chains (fantasy particles) are kept in a shared variable and continue
+            from where the last update left them. PCD with a small `k` (like 1) usually gives gradients as good as
+            CD with a much larger `k`.
+        n_chains : int, optional
+            The number of persistent chains for PCD, independent of the minibatch size. If None, the chains are
+            sized like the input and start from the input whenever its shape changes (needed when the biases are
+            per-example matrices, like the conditional RBMs in the RNN-RBM).
         """
         # init Model to combine the defaults and config dictionaries with the initial parameters.
         super(RBM, self).__init__(**{arg: val for (arg, val) in locals().items() if arg is not 'self'})
@@ -117,6 +128,8 @@ class RBM(Model):
 
         # get the number of steps k
         self.k = k
+        self.persistent = persistent
+        self.n_chains = n_chains
 
         # deal with hiddens_hook
         if hiddens_hook is not None:
@@ -212,9 +225,28 @@ class RBM(Model):
                                                             outputs_info=[None, None, None, self.hiddens_init],
                                                             n_steps=self.k)
 
+        # the outputs are always the reconstructions of the input (or samples from the given hiddens)
         v_sample = v_chain[-1]
         h_sample = h_chain[-1]
 
+        # persistent chains for PCD - the negative phase continues the Gibbs chain from the last update's
+        # fantasy particles instead of from the input
+        if self.persistent and self.hiddens_init is None:
+            if self.n_chains is None:
+                # chains sized like the input, starting from the input when its shape changes
+                self.persistent_chain, v_init = get_carried_state(self.input, name="rbm_persistent_chain")
+            else:
+                self.persistent_chain = sharedX(self._random_chains(), name="rbm_persistent_chain")
+                v_init = self.persistent_chain
+            [_, fantasy_chain, _, _], chain_updates = theano.scan(fn=lambda v: self._gibbs_step_vhv(v),
+                                                                  outputs_info=[None, v_init, None, None],
+                                                                  n_steps=self.k)
+            updates.update(chain_updates)
+            updates[self.persistent_chain] = fantasy_chain[-1]
+            negative_sample = fantasy_chain[-1]
+        else:
+            negative_sample = v_sample
+
         mean_v, _, _, _ = self._gibbs_step_vhv(v_sample)
 
         # some monitors
@@ -231,15 +263,33 @@ class RBM(Model):
         monitors = {'pseudo-log': pseudo_log, 'crossentropy': crossentropy}
 
         # the free-energy cost function!
-        # consider v_sample constant when computing gradients on the cost function
-        # this actually keeps v_sample from being considered in the gradient, to set gradient to 0 instead,
+        # consider the negative sample constant when computing gradients on the cost function
+        # this actually keeps it from being considered in the gradient, to set gradient to 0 instead,
         # use theano.gradient.zero_grad
-        v_sample_constant = theano.gradient.disconnected_grad(v_sample)
-        # v_sample_constant = v_sample
-        cost = (self.free_energy(self.input) - self.free_energy(v_sample_constant)) / self.input.shape[0]
+        negative_constant = theano.gradient.disconnected_grad(negative_sample)
+        # (normalize each term by its own number of examples - the persistent chains can differ from the batch size)
+        cost = self.free_energy(self.input) / self.input.shape[0] - \
+            self.free_energy(negative_constant) / negative_constant.shape[0]
 
         return cost, monitors, updates, v_sample, h_sample
 
+    def _random_chains(self):
+        """
+        Returns random binary starting values of shape (n_chains, input_size) for the persistent chains.
+        """
+        return numpy.random.binomial(n=1, p=0.5, size=(self.n_chains, self.input_size))
+
+    def reset_chains(self):
+        """
+        Restarts the persistent PCD chains (from the next input if `n_chains` is None, otherwise randomly).
+        """
+        if not self.persistent:
+            return
+        if self.n_chains is None:
+            reset_carried_state(self.persistent_chain)
+        else:
+            self.persistent_chain.set_value(numpy.asarray(self._random_chains(), dtype=theano.config.floatX))
+
     def _gibbs_step_vhv(self, v):
         """
         Single step in the Gibbs chain computing visible -> hidden -> visible.
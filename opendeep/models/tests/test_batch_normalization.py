@@ -0,0 +1,110 @@
+import unittest
+import shutil
+import tempfile
+import numpy
+import theano
+from opendeep.models.container import Prototype
+from opendeep.models.single_layer.basic import Dense
+from opendeep.models.single_layer.convolutional import Conv2D
+from opendeep.models.single_layer.normalization import BatchNormalization
+from opendeep.models.utils.numpy_export import export_numpy
+from opendeep.utils import numpy_runtime
+from opendeep.utils.constructors import function
+
+class TestBatchNormalization(unittest.TestCase):
+    def setUp(self):
+        self.rng = numpy.random.RandomState(1)
+        self.inputs = (self.rng.randn(20, 8) * 3 + 1).astype(theano.config.floatX)
+
+    def _randomize(self, bn):
+        # non-trivial scale, shift, and running statistics
+        size = bn.running_mean.get_value().shape[0]
+        gamma, beta = bn.get_params()
+        gamma.set_value(self.rng.uniform(.5, 2, size).astype(theano.config.floatX))
+        beta.set_value(self.rng.randn(size).astype(theano.config.floatX))
+        bn.running_mean.set_value(self.rng.randn(size).astype(theano.config.floatX))
+        bn.running_var.set_value(self.rng.uniform(.5, 2, size).astype(theano.config.floatX))
+
+    def _normalize(self, x, bn, mean, var, axes):
+        # the batch normalization of x in numpy, with the statistics broadcast over the axes
+        shape = [1 if axis in axes else size for axis, size in enumerate(x.shape)]
+        gamma, beta = [param.get_value().reshape(shape) for param in bn.get_params()]
+        return (x - mean.reshape(shape)) / numpy.sqrt(var.reshape(shape) + bn.epsilon) * gamma + beta
+
+    def _running(self, x, bn, axes):
+        return self._normalize(x, bn, bn.running_mean.get_value(), bn.running_var.get_value(), axes)
+
+    def testOutputs(self):
+        bn = BatchNormalization(input_size=8, outdir=None)
+        self._randomize(bn)
+        f = function(inputs=bn.get_inputs(), outputs=bn.get_outputs())
+        # training uses the minibatch statistics
+        expected = self._normalize(self.inputs, bn, self.inputs.mean(axis=0), self.inputs.var(axis=0), (0,))
+        numpy.testing.assert_allclose(f(self.inputs), expected, rtol=1e-4, atol=1e-5)
+        # with the switch off, the running statistics
+        bn.switch.set_value(0.)
+        numpy.testing.assert_allclose(f(self.inputs), self._running(self.inputs, bn, (0,)), rtol=1e-4, atol=1e-5)
+
+    def testRunningStatistics(self):
+        bn = BatchNormalization(input_size=8, momentum=.1, outdir=None)
+        f = function(inputs=bn.get_inputs(), outputs=bn.get_outputs(), updates=bn.get_updates())
+        f(self.inputs)
+        numpy.testing.assert_allclose(bn.running_mean.get_value(), .1 * self.inputs.mean(axis=0),
+                                      rtol=1e-4, atol=1e-5)
+        numpy.testing.assert_allclose(bn.running_var.get_value(), .9 + .1 * self.inputs.var(axis=0, ddof=1),
+                                      rtol=1e-4, atol=1e-5)
+        # the running statistics stay put with the switch off
+        mean, var = bn.running_mean.get_value(), bn.running_var.get_value()
+        bn.switch.set_value(0.)
+        f(self.inputs)
+        numpy.testing.assert_array_equal(bn.running_mean.get_value(), mean)
+        numpy.testing.assert_array_equal(bn.running_var.get_value(), var)
+
+    def _check_folding(self, prototype, layer, bn, inputs, axes):
+        f_layer = function(inputs=layer.get_inputs(), outputs=layer.get_outputs())
+        self._randomize(bn)
+        unfolded = prototype.run(inputs)
+        numpy.testing.assert_allclose(unfolded, self._running(f_layer(inputs), bn, axes), rtol=1e-4, atol=1e-5)
+        prototype.compile_run_fn(inference=True)
+        numpy.testing.assert_allclose(prototype.run(inputs), unfolded, rtol=1e-4, atol=1e-5)
+        # the compiled fold follows new parameter values and statistics
+        self._randomize(bn)
+        layer.get_params()[0].set_value(layer.get_params()[0].get_value() * 2)
+        numpy.testing.assert_allclose(prototype.run(inputs), self._running(f_layer(inputs), bn, axes),
+                                      rtol=1e-4, atol=1e-5)
+
+    def testFoldDense(self):
+        prototype = Prototype(outdir=None)
+        prototype.add(Dense(input_size=8, output_size=5, activation='linear', outdir=None))
+        prototype.add(BatchNormalization(input_size=5, outdir=None))
+        dense, bn = prototype.models
+        self._check_folding(prototype, dense, bn, self.inputs, (0,))
+
+    def testFoldConv2D(self):
+        inputs = self.rng.randn(4, 2, 6, 6).astype(theano.config.floatX)
+        conv = Conv2D(input_size=(4, 2, 6, 6), filter_shape=(3, 2, 3, 3), activation='linear', outdir=None)
+        bn = BatchNormalization(inputs_hook=((4, 3, 4, 4), conv.get_outputs()), outdir=None)
+        prototype = Prototype(outdir=None)
+        prototype.add(conv)
+        prototype.add(bn)
+        self._check_folding(prototype, conv, bn, inputs, (0, 2, 3))
+
+    def testExportFold(self):
+        prototype = Prototype(outdir=None)
+        prototype.add(Dense(input_size=8, output_size=5, activation='linear', outdir=None))
+        prototype.add(BatchNormalization(input_size=5, activation='tanh', outdir=None))
+        self._randomize(prototype.models[1])
+        path = tempfile.mkdtemp()
+        try:
+            export_numpy(prototype, path)
+            exported = numpy_runtime.load(path)
+            # the normalization is folded into the Dense layer
+            assert len(exported.layers) == 1
+            numpy.testing.assert_allclose(exported.run(self.inputs), prototype.run(self.inputs),
+                                          rtol=1e-4, atol=1e-5)
+        finally:
+            shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
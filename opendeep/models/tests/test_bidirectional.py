@@ -0,0 +1,59 @@
+import unittest
+import numpy
+import theano
+from opendeep.models.multi_layer.recurrent import RNN
+from opendeep.models.single_layer.lstm import LSTM
+
+class TestBidirectional(unittest.TestCase):
+    def setUp(self):
+        # two sequences of 6 timesteps, as (batch, timesteps, data)
+        self.inputs = numpy.random.RandomState(1).randn(2, 6, 3).astype(theano.config.floatX)
+
+    def _rnn(self, single_scan, params_hook=None):
+        return RNN(input_size=3, hidden_size=4, output_size=2, layers=2, hidden_activation='tanh',
+                   r_weights_init='uniform', noise=None, direction='bidirectional', single_scan=single_scan,
+                   params_hook=params_hook, outdir=None)
+
+    def _lstm(self, single_scan, fused_gates):
+        return LSTM(input_size=3, hidden_size=4, output_size=2, hidden_activation='tanh',
+                    r_weights_init='uniform', noise=None, direction='bidirectional', single_scan=single_scan,
+                    fused_gates=fused_gates, outdir=None)
+
+    def _check_time_reversal(self, model, reversed_model):
+        # with the forward and backward weights swapped, the reversed sequences give the reversed outputs
+        # (so the backward hiddens line up with the forward hiddens of the same timestep)
+        numpy.testing.assert_allclose(reversed_model.run(self.inputs[:, ::-1]), model.run(self.inputs)[::-1],
+                                      rtol=1e-5, atol=1e-6)
+
+    def testRNN(self):
+        two_scans = self._rnn(single_scan=False)
+        params = two_scans.get_params()
+        single_scan = self._rnn(single_scan=True, params_hook=params)
+        numpy.testing.assert_allclose(single_scan.run(self.inputs), two_scans.run(self.inputs), rtol=1e-5, atol=1e-6)
+        # params are W_x_h, W_h_h, b_h for each layer, then W_h_y, b_y, and the backward W_h_hb for each layer
+        swapped = params[:2] + params[-2:] + params[4:8] + params[2:4]
+        for single in (False, True):
+            self._check_time_reversal(two_scans, self._rnn(single_scan=single, params_hook=swapped))
+
+    def testLSTM(self):
+        for fused_gates in (False, True):
+            two_scans = self._lstm(single_scan=False, fused_gates=fused_gates)
+            values = two_scans.get_param_values()
+            single_scan = self._lstm(single_scan=True, fused_gates=fused_gates)
+            single_scan.set_param_values(values)
+            numpy.testing.assert_allclose(single_scan.run(self.inputs), two_scans.run(self.inputs),
+                                          rtol=1e-5, atol=1e-6)
+            # the backward recurrent weights have the same names as the forward ones, with a '_b' suffix
+            swapped = dict(values)
+            for name in values:
+                if name + '_b' in values:
+                    swapped[name], swapped[name + '_b'] = values[name + '_b'], values[name]
+            assert len(swapped) == len(values) and any(name.endswith('_b') for name in swapped)
+            for single in (False, True):
+                reversed_model = self._lstm(single_scan=single, fused_gates=fused_gates)
+                reversed_model.set_param_values(swapped)
+                self._check_time_reversal(two_scans, reversed_model)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+import numpy
+import theano
+from opendeep.models.single_layer.gru import GRU
+from opendeep.models.single_layer.lstm import LSTM
+
+class TestFusedGates(unittest.TestCase):
+    def setUp(self):
+        # two sequences of 6 timesteps, as (batch, timesteps, data)
+        self.inputs = numpy.random.RandomState(1).randn(2, 6, 3).astype(theano.config.floatX)
+
+    def _model(self, cls, fused_gates, kwargs):
+        return cls(input_size=3, hidden_size=5, output_size=2, hidden_activation='tanh', noise=None,
+                   fused_gates=fused_gates, outdir=None, **kwargs)
+
+    def _check(self, cls, **kwargs):
+        split = self._model(cls, False, kwargs)
+        fused = self._model(cls, True, kwargs)
+        # give the split layout non-trivial biases too
+        rng = numpy.random.RandomState(2)
+        for param in split.get_params():
+            param.set_value((param.get_value() + rng.randn(*param.get_value().shape) * .1)
+                            .astype(theano.config.floatX))
+        assert set(split.get_param_values().keys()) != set(fused.get_param_values().keys())
+
+        # split -> fused
+        assert fused.set_param_values(split.get_param_values())
+        expected = split.run(self.inputs)
+        numpy.testing.assert_allclose(fused.run(self.inputs), expected, rtol=1e-5, atol=1e-6)
+
+        # and back again: fused -> split
+        other = self._model(cls, False, kwargs)
+        assert other.set_param_values(fused.get_param_values())
+        numpy.testing.assert_allclose(other.run(self.inputs), expected, rtol=1e-5, atol=1e-6)
+        for name, value in split.get_param_values().items():
+            numpy.testing.assert_array_equal(other.get_param_values()[name], value)
+
+    def testLSTM(self):
+        self._check(LSTM)
+
+    def testGRU(self):
+        self._check(GRU)
+
+    def testBidirectionalLSTM(self):
+        self._check(LSTM, direction='bidirectional')
+
+    def testBackwardGRU(self):
+        self._check(GRU, forward=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
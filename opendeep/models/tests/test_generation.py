@@ -0,0 +1,56 @@
+import unittest
+import shutil
+import tempfile
+import numpy
+import theano.sandbox.rng_mrg as RNG_MRG
+from opendeep.models.multi_layer.rnn_gsn import RNN_GSN
+from opendeep.models.multi_layer.rnn_rbm import RNN_RBM
+
+
+class TestBatchedGeneration(unittest.TestCase):
+    def setUp(self):
+        self.outdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.outdir)
+
+    def _check_generation(self, make_model):
+        # two models with the same parameters and random streams
+        model, other = make_model(), make_model()
+        sequences, states = model.generate(n_steps=4, n_sequences=3)
+        assert sequences.shape == (3, 4, 6)
+        assert states.shape == (3, 5)
+        # every sequence gets its own random draws
+        assert not numpy.array_equal(sequences[0], sequences[1])
+        assert not numpy.array_equal(sequences[0], sequences[2])
+
+        # the same seed gives the same sequences, also when streamed in chunks
+        chunks = list(other.generate_stream(n_steps=4, chunk_size=3, n_sequences=3))
+        assert [chunk.shape for chunk in chunks] == [(3, 3, 6), (3, 1, 6)]
+        numpy.testing.assert_array_equal(numpy.concatenate(chunks, axis=1), sequences)
+
+        # continuing from a matrix of states, and a single sequence from a vector state
+        sequences, states = model.generate(initial=states[:2], n_steps=5)
+        assert sequences.shape == (2, 5, 6)
+        assert states.shape == (2, 5)
+        sequence, state = model.generate(initial=states[0], n_steps=5)
+        assert sequence.shape == (5, 6)
+        assert state.shape == (5,)
+
+    def testRNNGSN(self):
+        def make_model():
+            numpy.random.seed(3)
+            return RNN_GSN(input_size=6, hidden_size=8, layers=2, walkbacks=4, rnn_hidden_size=5,
+                           mrg=RNG_MRG.MRG_RandomStreams(3), outdir=self.outdir)
+        self._check_generation(make_model)
+
+    def testRNNRBM(self):
+        def make_model():
+            numpy.random.seed(3)
+            return RNN_RBM(input_size=6, hidden_size=8, rnn_hidden_size=5, k=2,
+                           mrg=RNG_MRG.MRG_RandomStreams(3), outdir=self.outdir)
+        self._check_generation(make_model)
+
+
+if __name__ == '__main__':
+    unittest.main()
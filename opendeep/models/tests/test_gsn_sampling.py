@@ -0,0 +1,62 @@
+import unittest
+import shutil
+import tempfile
+import numpy
+import theano
+import theano.sandbox.rng_mrg as RNG_MRG
+from opendeep.models.multi_layer.generative_stochastic_network import GSN
+
+
+class TestGSNSampling(unittest.TestCase):
+    def setUp(self):
+        self.outdir = tempfile.mkdtemp()
+        self.initial = numpy.random.RandomState(1).binomial(1, .5, (3, 6)).astype(theano.config.floatX)
+
+    def tearDown(self):
+        shutil.rmtree(self.outdir)
+
+    def _gsn(self, **kwargs):
+        # the weights come from numpy's global random state, the noise from the MRG streams
+        numpy.random.seed(3)
+        return GSN(input_size=6, hidden_size=8, layers=2, walkbacks=4, mrg=RNG_MRG.MRG_RandomStreams(3),
+                   outdir=self.outdir, **kwargs)
+
+    def _step_by_step(self, gsn, n_samples, k):
+        # the old sampler - one f_sample call per update
+        network_state = [gsn.f_noise(self.initial)] + [
+            numpy.zeros((self.initial.shape[0], size), dtype=theano.config.floatX) for size in gsn.layer_sizes[1:]
+        ]
+        visible_chain = [self.initial]
+        sampled_h = []
+        for i in range(n_samples - 1):
+            out = gsn.f_sample(*network_state)
+            network_state = out[:len(network_state)]
+            visible_chain.append(out[len(network_state)])
+            if i % k == 0:
+                sampled_h.append(network_state[1:])
+        return numpy.vstack(visible_chain), [numpy.asarray(h) for h in zip(*sampled_h)]
+
+    def _check_equal(self, samples, expected):
+        numpy.testing.assert_allclose(samples[0], expected[0], rtol=1e-5, atol=1e-6)
+        assert len(samples[1]) == len(expected[1]) == 2
+        for h, h_expected in zip(samples[1], expected[1]):
+            numpy.testing.assert_allclose(h, h_expected, rtol=1e-5, atol=1e-6)
+
+    def testMatchesStepByStep(self):
+        # f_sample and the compiled sampler draw from different random streams, so compare them without noise
+        gsn = self._gsn(input_sampling=False, hidden_noise_level=0, input_noise_level=0)
+        samples = gsn.sample(self.initial, n_samples=8, k=3, chunk_size=2)
+        assert samples[0].shape == (8 * 3, 6)
+        assert [h.shape for h in samples[1]] == [(3, 3, 8), (3, 3, 8)]
+        self._check_equal(samples, self._step_by_step(gsn, n_samples=8, k=3))
+
+    def testChunksFixedSeed(self):
+        # with the noise on, the same seed gives the same chains however the steps are chunked
+        step_by_step = self._gsn().sample(self.initial, n_samples=8, k=3, chunk_size=1)
+        chunked = self._gsn().sample(self.initial, n_samples=8, k=3, chunk_size=2)
+        self._check_equal(chunked, step_by_step)
+        assert not numpy.allclose(chunked[0][3:6], chunked[0][6:9])
+
+
+if __name__ == '__main__':
+    unittest.main()
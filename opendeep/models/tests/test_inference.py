@@ -0,0 +1,64 @@
+import unittest
+import numpy
+import theano
+from opendeep.models.container import Prototype
+from opendeep.models.single_layer.basic import Dense, SoftmaxLayer
+from opendeep.utils.constructors import function
+from opendeep.utils.misc import raise_to_list
+from opendeep.utils.nnet import fold_switches
+
+
+class TestInference(unittest.TestCase):
+    def setUp(self):
+        self.inputs = numpy.random.RandomState(1).randn(20, 8).astype(theano.config.floatX)
+
+    def _switch_values(self, model):
+        return [switch.get_value() for switch in raise_to_list(model.get_switches())]
+
+    def _check_inference(self, model):
+        # dropout is on, so the training outputs are noisy
+        f_noisy = function(inputs=model.get_inputs(), outputs=model.get_outputs())
+        assert not numpy.allclose(f_noisy(self.inputs), f_noisy(self.inputs))
+        # running with the switches turned off (and back on) is the reference
+        expected = model.run(self.inputs)
+        switches = self._switch_values(model)
+        assert all(value == 1 for value in switches)
+
+        del model.f_run
+        model.compile_run_fn(inference=True)
+        outputs = model.run(self.inputs)
+        numpy.testing.assert_allclose(outputs, expected, rtol=1e-5)
+        numpy.testing.assert_array_equal(model.run(self.inputs), outputs)
+        assert self._switch_values(model) == switches
+        # the switches are folded in, so turning them off doesn't change anything
+        model.turn_off_switches()
+        numpy.testing.assert_array_equal(model.run(self.inputs), outputs)
+
+    def testModel(self):
+        dense = Dense(input_size=8, output_size=50, activation='tanh', noise='dropout', outdir=None)
+        self._check_inference(dense)
+
+    def testPrototype(self):
+        prototype = Prototype(outdir=None)
+        prototype.add(Dense(input_size=8, output_size=50, activation='tanh', noise='dropout', outdir=None))
+        prototype.add(Dense(input_size=50, output_size=30, activation='tanh', noise='dropout', outdir=None))
+        assert len(prototype.get_switches()) == 2
+        self._check_inference(prototype)
+
+    def testFoldedPrediction(self):
+        # the way AlexNet compiles its f_run: the argmax prediction with the dropout switches folded off
+        dense = Dense(input_size=8, output_size=50, activation='tanh', noise='dropout', outdir=None)
+        softmax = SoftmaxLayer(inputs_hook=(50, dense.get_outputs()), input_size=50, output_size=10, outdir=None)
+        prediction, _ = fold_switches(softmax.get_argmax_prediction(), switches=dense.get_switches())
+        f_run = function(inputs=dense.get_inputs(), outputs=prediction, no_default_updates=True)
+        predictions = f_run(self.inputs)
+        numpy.testing.assert_array_equal(f_run(self.inputs), predictions)
+        assert dense.switch.get_value() == 1
+
+        dense.switch.set_value(0.)
+        f_off = function(inputs=dense.get_inputs(), outputs=softmax.get_argmax_prediction())
+        numpy.testing.assert_array_equal(f_off(self.inputs), predictions)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+import shutil
+import tempfile
+import numpy
+import theano
+from opendeep.models.single_layer.restricted_boltzmann_machine import RBM
+from opendeep.models.multi_layer.rnn_rbm import RNN_RBM
+from opendeep.utils.constructors import function, sharedX
+
+
+def _identity_params(size):
+    # weights and biases that make a Gibbs step copy the visibles (up to a ~1e-9 chance of flipping a unit)
+    return sharedX(numpy.eye(size) * 40, name="W"), sharedX(-20 * numpy.ones(size), name="bv"), \
+        sharedX(-20 * numpy.ones(size), name="bh")
+
+
+class TestPersistentChains(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(1)
+        self.size = 6
+        self.a, self.b = [rng.binomial(1, .5, (5, self.size)).astype(theano.config.floatX) for _ in range(2)]
+
+    def _compile(self, model):
+        # the outputs and the chain updates, like a training step
+        return function(inputs=[model.input], outputs=model.get_outputs(), updates=model.get_updates())
+
+    def testRBMOutputsReconstructInput(self):
+        rbm = RBM(input_size=self.size, k=1, persistent=True, n_chains=3, outdir=None,
+                  params_hook=_identity_params(self.size))
+        f = self._compile(rbm)
+        # the outputs line up with the input, not the (differently sized) fantasy particles
+        numpy.testing.assert_array_equal(f(self.a), self.a)
+        assert rbm.persistent_chain.get_value().shape == (3, self.size)
+
+    def testRBMChainsCarry(self):
+        rbm = RBM(input_size=self.size, k=1, persistent=True, outdir=None,
+                  params_hook=_identity_params(self.size))
+        f = self._compile(rbm)
+        f(self.a)
+        numpy.testing.assert_array_equal(rbm.persistent_chain.get_value(), self.a)
+        # the chain continues from the last update instead of restarting from the new input
+        numpy.testing.assert_array_equal(f(self.b), self.b)
+        numpy.testing.assert_array_equal(rbm.persistent_chain.get_value(), self.a)
+        # restarting takes the next input
+        rbm.reset_chains()
+        f(self.b)
+        numpy.testing.assert_array_equal(rbm.persistent_chain.get_value(), self.b)
+        # and so does a change of batch size
+        f(self.a[:3])
+        numpy.testing.assert_array_equal(rbm.persistent_chain.get_value(), self.a[:3])
+
+    def testRBMRandomChainsCarry(self):
+        rbm = RBM(input_size=self.size, k=1, persistent=True, n_chains=4, outdir=None,
+                  params_hook=_identity_params(self.size))
+        f = self._compile(rbm)
+        chains = rbm.persistent_chain.get_value()
+        f(self.a)
+        f(self.b)
+        numpy.testing.assert_array_equal(rbm.persistent_chain.get_value(), chains)
+        numpy.random.seed(2)
+        rbm.reset_chains()
+        assert rbm.persistent_chain.get_value().shape == (4, self.size)
+        assert not numpy.array_equal(rbm.persistent_chain.get_value(), chains)
+
+    def testRNNRBMChainsCarry(self):
+        outdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, outdir)
+        W, bv, bh = _identity_params(self.size)
+        # no recurrent influence on the biases, so every conditional RBM copies its visibles
+        zeros = lambda shape, name: sharedX(numpy.zeros(shape), name=name)
+        params = [W, bv, bh, zeros((3, self.size), "Wuh"), zeros((3, self.size), "Wuv"),
+                  zeros((self.size, 3), "Wvu"), zeros((3, 3), "Wuu"), zeros(3, "bu")]
+        rnnrbm = RNN_RBM(input_size=self.size, hidden_size=self.size, rnn_hidden_size=3, k=1, persistent=True,
+                         params_hook=params, outdir=outdir)
+        f = self._compile(rnnrbm)
+        numpy.testing.assert_array_equal(f(self.a), self.a)
+        chain = rnnrbm.rbm.persistent_chain
+        numpy.testing.assert_array_equal(chain.get_value(), self.a)
+        numpy.testing.assert_array_equal(f(self.b), self.b)
+        numpy.testing.assert_array_equal(chain.get_value(), self.a)
+        rnnrbm.reset_chains()
+        f(self.b)
+        numpy.testing.assert_array_equal(chain.get_value(), self.b)
+
+
+if __name__ == '__main__':
+    unittest.main()
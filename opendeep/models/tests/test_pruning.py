@@ -0,0 +1,72 @@
+import unittest
+import numpy
+import theano
+from opendeep.data.dataset_memory import NumpyDataset
+from opendeep.models.single_layer.basic import Dense
+from opendeep.models.utils.pruning import magnitude_masks, prune, prune_and_finetune, SparseModel
+from opendeep.optimization.stochastic_gradient_descent import SGD
+
+class TestPruning(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(1)
+        self.weights = [rng.randn(50, 20), rng.randn(20, 10) * .1]
+
+    def testLayerScope(self):
+        masks = magnitude_masks(self.weights, .9, scope='layer')
+        for W, mask in zip(self.weights, masks):
+            assert mask.shape == W.shape
+            numpy.testing.assert_allclose(mask.mean(), .1)
+            # everything kept is at least as large as everything pruned
+            assert numpy.abs(W[mask == 1]).min() >= numpy.abs(W[mask == 0]).max()
+
+    def testGlobalScope(self):
+        masks = magnitude_masks(self.weights, .5, scope='global')
+        kept = sum(mask.sum() for mask in masks)
+        numpy.testing.assert_allclose(kept, .5 * sum(W.size for W in self.weights))
+        # the layer with the small weights gets pruned more
+        assert masks[1].mean() < masks[0].mean()
+
+    def testSparseOutputs(self):
+        layer = Dense(input_size=50, output_size=20, activation='linear', outdir=None)
+        prune(layer, .8)
+        sparse = SparseModel(layer, density_threshold=.3)
+        assert list(sparse.sparse_params.keys()) == [0]
+        inputs = numpy.random.RandomState(2).randn(30, 50).astype(theano.config.floatX)
+        numpy.testing.assert_allclose(sparse.run(inputs), layer.run(inputs), rtol=1e-4, atol=1e-5)
+
+    def testMaskedTraining(self):
+        rng = numpy.random.RandomState(2)
+        inputs = rng.randn(100, 50).astype(theano.config.floatX)
+        targets = rng.randn(100, 20).astype(theano.config.floatX)
+        layer = Dense(input_size=50, output_size=20, activation='linear', outdir=None)
+        prune(layer, .5)
+        W = layer.params[0]
+        W_before = W.get_value()
+        pruned = W_before == 0
+        optimizer = SGD(dataset=NumpyDataset(train_inputs=inputs, train_targets=targets), model=layer,
+                        epochs=2, batch_size=10, learning_rate=.1, momentum=.9, nesterov_momentum=False)
+        optimizer.train()
+        W_after = W.get_value()
+        # the momentum moved the kept weights, but every pruned weight is still exactly zero
+        assert numpy.any(W_after[~pruned] != W_before[~pruned])
+        numpy.testing.assert_array_equal(W_after[pruned], 0)
+
+    def testPruneAndFinetune(self):
+        rng = numpy.random.RandomState(3)
+        inputs = rng.randn(100, 50).astype(theano.config.floatX)
+        targets = rng.randn(100, 20).astype(theano.config.floatX)
+        layer = Dense(input_size=50, output_size=20, activation='linear', outdir=None)
+        W = layer.params[0]
+        W_initial = W.get_value()
+        optimizer = SGD(dataset=NumpyDataset(train_inputs=inputs, train_targets=targets), model=layer,
+                        epochs=1, batch_size=10, learning_rate=.1, momentum=.9)
+        densities = prune_and_finetune(layer, optimizer, sparsities=(.5, .75))
+        numpy.testing.assert_allclose(densities[0], .25)
+        mask = layer.get_param_masks()[W].get_value()
+        W_final = W.get_value()
+        numpy.testing.assert_array_equal(W_final[mask == 0], 0)
+        assert numpy.all(W_final[mask == 1] != W_initial[mask == 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+import unittest
+import numpy
+from opendeep.models.utils.quantization import quantize_weights, calibrate_clipping
+
+class TestQuantization(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(1)
+        self.W = rng.standard_t(3, size=(64, 16)) * .05
+        self.inputs = rng.randn(200, 64)
+
+    def testPerChannel(self):
+        W_q, scale = quantize_weights(self.W)
+        assert W_q.dtype == numpy.int8 and scale.shape == (16,)
+        # each column uses its full range, and rounding error is at most half a step
+        numpy.testing.assert_array_equal(numpy.abs(W_q).max(axis=0), 127)
+        assert numpy.all(numpy.abs(W_q * scale - self.W) <= scale / 2 + 1e-6)
+
+    def testCalibration(self):
+        clip = calibrate_clipping(self.W, self.inputs)
+        assert clip.shape == (16,)
+        errors = []
+        for ratio in [1., clip]:
+            W_q, scale = quantize_weights(self.W, ratio)
+            errors.append(numpy.mean(numpy.dot(self.inputs, self.W - W_q * scale) ** 2))
+        assert errors[1] <= errors[0]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+import numpy
+import theano
+from opendeep.models.multi_layer.recurrent import RNN
+from opendeep.models.single_layer.gru import GRU
+from opendeep.models.single_layer.lstm import LSTM
+from opendeep.utils.constructors import function
+
+
+class TestStateful(unittest.TestCase):
+    def setUp(self):
+        # three sequences of 6 timesteps, as (batch, timesteps, data)
+        self.inputs = numpy.random.RandomState(1).randn(3, 6, 2).astype(theano.config.floatX)
+
+    def _check_stateful(self, model):
+        # the outputs (as (timesteps, batch, output)), carrying the state over between calls
+        f = function(inputs=model.get_inputs(), outputs=model.get_outputs(), updates=model.get_updates())
+        full = f(self.inputs)
+        # running the sequences in two chunks continues from where the first chunk ended
+        model.reset_state()
+        first, second = f(self.inputs[:, :4]), f(self.inputs[:, 4:])
+        numpy.testing.assert_allclose(numpy.concatenate([first, second]), full, rtol=1e-5, atol=1e-6)
+        # after a reset, the second chunk starts from zeros like the first one did
+        model.reset_state()
+        fresh = f(self.inputs[:, 4:])
+        assert not numpy.allclose(fresh, second)
+        model.reset_state()
+        f(self.inputs[:, :4])
+        numpy.testing.assert_allclose(f(self.inputs[:, 4:]), second, rtol=1e-5, atol=1e-6)
+        # a different batch size also starts from zeros
+        numpy.testing.assert_allclose(f(self.inputs[:2, 4:]), fresh[:, :2], rtol=1e-5, atol=1e-6)
+
+    def testLSTM(self):
+        for fused_gates in (False, True):
+            lstm = LSTM(input_size=2, hidden_size=4, output_size=2, hidden_activation='tanh',
+                        r_weights_init='uniform', noise=None, stateful=True, fused_gates=fused_gates, outdir=None)
+            self._check_stateful(lstm)
+
+    def testGRU(self):
+        gru = GRU(input_size=2, hidden_size=4, output_size=2, hidden_activation='tanh',
+                  r_weights_init='uniform', noise=None, stateful=True, outdir=None)
+        self._check_stateful(gru)
+
+    def testRNN(self):
+        rnn = RNN(input_size=2, hidden_size=4, output_size=2, layers=2, hidden_activation='tanh',
+                  r_weights_init='uniform', noise=None, stateful=True, outdir=None)
+        self._check_stateful(rnn)
+
+
+if __name__ == '__main__':
+    unittest.main()
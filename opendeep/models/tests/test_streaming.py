@@ -0,0 +1,59 @@
+import unittest
+import numpy
+import theano
+from opendeep.models.single_layer.gru import GRU
+from opendeep.models.single_layer.lstm import LSTM
+from opendeep.models.utils.streaming import StreamingModel
+
+class TestStreaming(unittest.TestCase):
+    def setUp(self):
+        # two sequences of 6 timesteps, as (batch, timesteps, data)
+        self.inputs = numpy.random.RandomState(1).randn(2, 6, 3).astype(theano.config.floatX)
+        self.models = [cls(input_size=3, hidden_size=5, output_size=2, hidden_activation='tanh', noise=None,
+                           stateful=True, outdir=None)
+                       for cls in (LSTM, GRU)]
+
+    def _full_outputs(self, model):
+        # the outputs of run() over the whole sequences, as (timesteps, batch, data)
+        model.reset_state()
+        return model.run(self.inputs)
+
+    def testSteps(self):
+        for model in self.models:
+            expected = self._full_outputs(model)
+            streams = StreamingModel(model)
+            for t in range(self.inputs.shape[1]):
+                numpy.testing.assert_allclose(streams.step(['a', 'b'], self.inputs[:, t]), expected[t],
+                                              rtol=1e-5, atol=1e-6)
+
+    def testInterleaved(self):
+        for model in self.models:
+            expected = self._full_outputs(model)
+            streams = StreamingModel(model)
+            for t in range(self.inputs.shape[1]):
+                if t % 3 == 0:
+                    outputs = streams.step(['b', 'a'], self.inputs[::-1, t])[::-1]
+                elif t % 3 == 1:
+                    outputs = streams.step(['a', 'b'], self.inputs[:, t])
+                else:
+                    # one stream at a time
+                    outputs = [streams.step(['b'], self.inputs[1:, t])[0], streams.step(['a'], self.inputs[:1, t])[0]]
+                    outputs = numpy.asarray(outputs[::-1])
+                numpy.testing.assert_allclose(outputs, expected[t], rtol=1e-5, atol=1e-6)
+
+    def testReset(self):
+        for model in self.models:
+            expected = self._full_outputs(model)
+            streams = StreamingModel(model)
+            for t in range(3):
+                streams.step(['a', 'b'], self.inputs[:, t])
+            # 'a' starts its sequence over, 'b' keeps going
+            streams.reset('a')
+            for t in range(3, self.inputs.shape[1]):
+                outputs = streams.step(['a', 'b'], numpy.asarray([self.inputs[0, t - 3], self.inputs[1, t]]))
+                numpy.testing.assert_allclose(outputs[0], expected[t - 3][0], rtol=1e-5, atol=1e-6)
+                numpy.testing.assert_allclose(outputs[1], expected[t][1], rtol=1e-5, atol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,40 +1,94 @@
 """
 This module defines the generic ModifyLayer class -
-which doesn't have learnable parameters but takes inputs and modifies
-them to outputs.
+which doesn't learn a transformation of its own but takes inputs and modifies
+them to outputs (like normalizing them with statistics of the data).
 """
 # standard libraries
 import logging
-import os
-import time
 # third party libraries
-import theano
 import theano.tensor as T
-from theano.compat.python2x import OrderedDict  # use this compatibility OrderedDict
 # internal references
-from opendeep.utils.decorators import init_optimizer
-from opendeep.utils import file_ops
-from opendeep.utils.constructors import function
-from opendeep.utils.misc import set_shared_values, get_shared_values, \
-    make_time_units_string, raise_to_list, add_kwargs_to_dict
-from opendeep.utils.file_ops import mkdir_p
-
-try:
-    import cPickle as pickle
-except ImportError:
-    import pickle
+from opendeep.models.model import Model
+from opendeep.utils.decorators import inherit_docs
 
 log = logging.getLogger(__name__)
 
 
-class ModifyLayer(object):
+@inherit_docs
+class ModifyLayer(Model):
     """
     The :class:`ModifyLayer` is a generic class for a neural net layer that doesn't have
-    learnable parameters. This includes things like batch normalization and dropout.
+    learnable transformation weights. This includes things like batch normalization and dropout - at most they have
+    a few elementwise parameters (like a scale and shift) and statistics of the data they have seen.
+
+    The output has the same shape as the input, so a :class:`ModifyLayer` can be added between any layers
+    of a :class:`Prototype`. Layers whose inference computation can be merged into the parameters of the layer
+    before them implement `get_folded_outputs()`, which :class:`Prototype` uses when compiling for inference.
     """
+    def __init__(self, inputs_hook=None, input_size=None, output_size=None, outdir=None, **kwargs):
+        """
+        Initialize the input of a ModifyLayer.
+
+        Parameters
+        ----------
+        inputs_hook : Tuple of (shape, variable)
+            Routing information for the model to accept inputs from elsewhere. This is used for linking
+            different models together. For now, it needs to include the shape information (normally the
+            dimensionality of the input i.e. input_size).
+        input_size : int or tuple
+            The size (dimensionality) of the input to the layer - an int for (batch, features) matrices, or the
+            (batch, channels, rows, cols) shape for images. If shape is provided in `inputs_hook`, this is optional.
+        output_size : int or tuple
+            The size of the output. This is always the same as the input size.
+        outdir : str
+            The directory you want outputs (parameters, images, etc.) to save to. If None, nothing will
+            be saved.
+        """
+        # init Model to combine the defaults and config dictionaries with the initial parameters.
+        initial_parameters = locals().copy()
+        initial_parameters.pop('self')
+        super(ModifyLayer, self).__init__(**initial_parameters)
+
+        # grab info from the inputs_hook, or from parameters
+        if inputs_hook is not None:  # inputs_hook is a tuple of (Shape, Input)
+            assert len(inputs_hook) == 2, 'Expected inputs_hook to be tuple!'  # make sure inputs_hook is a tuple
+            self.input_size = inputs_hook[0]
+            self.input = inputs_hook[1]
+        else:
+            assert input_size is not None, "%s needs an input_size or inputs_hook!" % self._classname
+            self.input_size = input_size
+            # a symbolic matrix, or a 4D tensor for images
+            if isinstance(input_size, (list, tuple)) and len(input_size) == 4:
+                self.input = T.tensor4('X')
+            else:
+                self.input = T.matrix('X')
+
+        # modifying doesn't change the size
+        self.output_size = self.input_size
+
+    def get_inputs(self):
+        return [self.input]
+
+    def get_outputs(self):
+        return self.output
+
+    def get_params(self):
+        return []
+
+    def get_folded_outputs(self, previous):
+        """
+        Computes this layer's inference outputs directly from the previous layer with its parameters folded
+        (like the normalization statistics merged into its weights), so this layer can be dropped from the graph.
+        By default, the layer can't be folded.
+
+        Parameters
+        ----------
+        previous : :class:`Model`
+            The layer whose outputs are this layer's input.
 
-    def __init__(self, inputs_hook=None,
-                 input_size=None, output_size=None,
-                 outdir=None,
-                 **kwargs):
-        raise NotImplementedError("ModifyLayer is in development.")
+        Returns
+        -------
+        tensor or None
+            The expression to replace this layer's outputs with, or None if it can't be folded.
+        """
+        return None
@@ -0,0 +1,185 @@
+"""
+This module exports trained models to a standalone NumPy inference artifact - the parameters in one '.npz' file and
+the layer specifications in JSON - that runs with :mod:`opendeep.utils.numpy_runtime` without Theano.
+
+Supported layers are :class:`Dense`, :class:`SoftmaxLayer`, :class:`Conv2D`, :class:`ConvPoolLayer`, :class:`LSTM`,
+and :class:`GRU`, either alone or stacked in sequence in a :class:`Prototype`. A :class:`BatchNormalization` following
+a linear :class:`Dense` or :class:`Conv2D` layer is folded into that layer's parameters::
+
+    from opendeep.models.utils.numpy_export import export_numpy
+    export_numpy(prototype, 'outputs/export/')
+    # then, in a process without Theano:
+    import numpy_runtime
+    predictions = numpy_runtime.load('outputs/export/').run(inputs)
+"""
+# standard libraries
+import logging
+import json
+import os
+import shutil
+# third party libraries
+import numpy
+import theano.compat.six as six
+from theano.compat.python2x import OrderedDict
+# internal references
+from opendeep.models.container import Prototype
+from opendeep.models.single_layer.basic import Dense, SoftmaxLayer
+from opendeep.models.single_layer.convolutional import Conv2D, ConvPoolLayer
+from opendeep.models.single_layer.gru import GRU
+from opendeep.models.single_layer.lstm import LSTM
+from opendeep.models.single_layer.normalization import BatchNormalization
+from opendeep.utils import numpy_runtime
+from opendeep.utils.file_ops import mkdir_p
+from opendeep.utils.misc import raise_to_list
+from opendeep.utils.nnet import fuse_gate_values
+
+log = logging.getLogger(__name__)
+
+
+def _activation_name(activation):
+    if activation is None:
+        return None
+    if not isinstance(activation, six.string_types):
+        raise NotImplementedError("Can't export the callable activation %s, only activations by name!" %
+                                  str(activation))
+    # make sure the runtime knows it
+    numpy_runtime.get_activation(activation)
+    return activation
+
+def _param_values(layer, names):
+    params = raise_to_list(layer.get_params())
+    assert len(params) == len(names), "Expected %d params for %s, found %d!" % (len(names), layer._classname,
+                                                                                len(params))
+    return OrderedDict([(name, param.get_value()) for name, param in zip(names, params)])
+
+def _gate_names(layer, gates, bidirectional=False):
+    if layer.fused_gates:
+        return ["W_x_gates", "U_h_gates"] + (["U_h_gates_b"] if bidirectional else []) + \
+               ["W_h_y", "b_gates", "b_y"]
+    names = ["W_x_%s" % sub for sub in gates] + ["U_h_%s" % sub for sub in gates]
+    if bidirectional:
+        names += ["U_h_%s_b" % sub for sub in gates]
+    return names + ["W_h_y"] + ["b_%s" % sub for sub in gates] + ["b_y"]
+
+def _recurrent_spec(layer):
+    if layer.args.get('hiddens_hook') is not None:
+        raise NotImplementedError("Can't export a %s with a hiddens_hook!" % layer._classname)
+    return {'time_major': layer.args.get('inputs_hook') is not None,
+            'hidden_size': int(layer.hidden_size),
+            'activation': _activation_name(layer.args.get('activation')),
+            'hidden_activation': _activation_name(layer.args.get('hidden_activation')),
+            'inner_hidden_activation': _activation_name(layer.args.get('inner_hidden_activation'))}
+
+def layer_spec(layer):
+    """
+    Describes one layer for the NumPy runtime.
+
+    Parameters
+    ----------
+    layer : :class:`Model`
+        The layer to export.
+
+    Returns
+    -------
+    tuple
+        (spec dict, OrderedDict of {param name: value}) for the layer.
+
+    Raises
+    ------
+    NotImplementedError
+        If the layer (or one of its settings) doesn't have a NumPy implementation.
+    """
+    if isinstance(layer, Dense):
+        spec = {'type': 'Dense', 'activation': _activation_name(layer.args.get('activation'))}
+        if isinstance(layer, SoftmaxLayer):
+            spec['argmax'] = not layer.out_as_probs
+        return spec, _param_values(layer, ['W', 'b'])
+
+    elif isinstance(layer, Conv2D):
+        spec = {'type': 'Conv2D',
+                'activation': _activation_name(layer.args.get('activation')),
+                'strides': [int(s) for s in layer.args.get('strides')],
+                'border_mode': layer.args.get('border_mode')}
+        return spec, _param_values(layer, ['W', 'b'])
+
+    elif isinstance(layer, ConvPoolLayer):
+        spec = {'type': 'ConvPoolLayer',
+                'activation': _activation_name(layer.args.get('activation')),
+                'convstride': int(layer.convstride),
+                'padsize': int(layer.padsize),
+                'group': int(layer.group),
+                'poolsize': int(layer.poolsize),
+                'poolstride': int(layer.poolstride),
+                'local_response_normalization': bool(layer.args.get('local_response_normalization'))}
+        names = ['W', 'b'] if layer.group == 1 else ['W0', 'b0', 'W1', 'b1']
+        return spec, _param_values(layer, names)
+
+    elif isinstance(layer, LSTM):
+        direction = layer.args.get('direction').lower()
+        spec = _recurrent_spec(layer)
+        spec.update({'type': 'LSTM', 'direction': direction})
+        values = _param_values(layer, _gate_names(layer, ['c', 'i', 'f', 'o'], direction == 'bidirectional'))
+        # the runtime always computes with the fused gate layout
+        return spec, fuse_gate_values(values, layer.gate_layout)
+
+    elif isinstance(layer, GRU):
+        spec = _recurrent_spec(layer)
+        spec.update({'type': 'GRU', 'forward': bool(layer.args.get('forward'))})
+        values = _param_values(layer, _gate_names(layer, ['z', 'r', 'h']))
+        return spec, fuse_gate_values(values, layer.gate_layout)
+
+    raise NotImplementedError("No NumPy export for %s!" % layer._classname)
+
+def _fold_batch_normalization(layer, previous_spec, params):
+    if previous_spec is None or previous_spec['type'] not in ['Dense', 'Conv2D'] or \
+            previous_spec['activation'] not in [None, 'linear'] or previous_spec.get('argmax'):
+        raise NotImplementedError("Can only export a BatchNormalization following a Dense or Conv2D layer with a "
+                                  "linear activation!")
+    W_key, b_key = previous_spec['params']['W'], previous_spec['params']['b']
+    params[W_key], params[b_key] = layer.fold_values(params[W_key], params[b_key])
+    previous_spec['activation'] = _activation_name(layer.args.get('activation'))
+
+def export_numpy(model, path):
+    """
+    Exports a model (or the sequence of layers in a :class:`Prototype`) to a directory with 'params.npz',
+    'model.json', and a copy of the runtime module 'numpy_runtime.py' to load them with.
+
+    Parameters
+    ----------
+    model : :class:`Model` or :class:`Prototype`
+        The trained model. For a :class:`Prototype`, each layer's input has to be the previous layer's output.
+    path : str
+        The directory to export to.
+
+    Returns
+    -------
+    str
+        The path to the 'model.json' specification.
+    """
+    layers = model.models if isinstance(model, Prototype) else [model]
+    specs = []
+    params = OrderedDict()
+    for i, layer in enumerate(layers):
+        if isinstance(layer, BatchNormalization):
+            _fold_batch_normalization(layer, specs[-1] if specs else None, params)
+            continue
+        spec, values = layer_spec(layer)
+        spec['params'] = OrderedDict()
+        for name, value in values.items():
+            key = "layer%d_%s" % (i, name)
+            spec['params'][name] = key
+            params[key] = numpy.asarray(value)
+        specs.append(spec)
+
+    path = os.path.realpath(path)
+    mkdir_p(path)
+    numpy.savez(os.path.join(path, numpy_runtime.PARAMS_FILE), **params)
+    spec_file = os.path.join(path, numpy_runtime.SPEC_FILE)
+    with open(spec_file, 'w') as f:
+        json.dump({'format': numpy_runtime.FORMAT_VERSION, 'layers': specs}, f, indent=2)
+    # copy the runtime source so the export can be loaded without opendeep
+    runtime_source = os.path.splitext(numpy_runtime.__file__)[0] + '.py'
+    shutil.copy(runtime_source, os.path.join(path, 'numpy_runtime.py'))
+
+    log.info("Exported %d layers (%d parameters) for NumPy inference to %s", len(specs), len(params), path)
+    return spec_file
@@ -0,0 +1,264 @@
+"""
+This module provides magnitude pruning of the weights of :class:`Dense` and :class:`SoftmaxLayer` models, and an
+inference mode that runs the pruned layers as sparse-dense products.
+
+Pruning zeros the smallest weights (by absolute value) of each layer, or of all the layers together with one global
+threshold, and keeps binary masks on the layers so an :class:`Optimizer` finetuning the model afterwards keeps the
+pruned weights at zero::
+
+    from opendeep.models.utils.pruning import prune_and_finetune, SparseModel
+    prune_and_finetune(prototype, optimizer, sparsities=(.5, .75, .9), scope='layer')
+    sparse = SparseModel(prototype, density_threshold=.3)
+    predictions = sparse.run(inputs)
+    print(sparse.compare(test_inputs, test_targets))
+"""
+# standard libraries
+import logging
+import time
+# third party libraries
+import numpy
+import scipy.sparse
+import theano
+import theano.sparse
+from theano.compat.python2x import OrderedDict
+# internal references
+from opendeep.models.container import Prototype
+from opendeep.models.single_layer.basic import Dense
+from opendeep.utils.constructors import function, sharedX
+from opendeep.utils.misc import make_time_units_string, raise_to_list
+from opendeep.utils.nnet import find_dot, fold_switches
+
+log = logging.getLogger(__name__)
+
+
+def _dense_layers(model):
+    layers = model.models if isinstance(model, Prototype) else [model]
+    dense_layers = [(idx, layer) for idx, layer in enumerate(layers) if isinstance(layer, Dense)]
+    assert len(dense_layers) > 0, "%s doesn't have any Dense layers to prune!" % model._classname
+    return dense_layers
+
+def magnitude_masks(weights, sparsity, scope='layer'):
+    """
+    Computes the binary masks that keep the largest magnitude weights.
+
+    Parameters
+    ----------
+    weights : list(array_like)
+        The weights matrices.
+    sparsity : float
+        The fraction of the weights to prune (between 0 and 1).
+    scope : str
+        'layer' to prune `sparsity` of each matrix, or 'global' to prune `sparsity` of all the weights together
+        with one magnitude threshold (so layers with many small weights get pruned more).
+
+    Returns
+    -------
+    list(array_like)
+        The masks (1 to keep, 0 to prune) for each weights matrix.
+    """
+    assert 0. <= sparsity < 1., "Sparsity has to be in [0, 1), found %s" % str(sparsity)
+    weights = [numpy.abs(numpy.asarray(W)) for W in weights]
+    scope = scope.lower()
+    if scope == 'layer':
+        thresholds = [_threshold(W.ravel(), sparsity) for W in weights]
+    elif scope == 'global':
+        thresholds = [_threshold(numpy.concatenate([W.ravel() for W in weights]), sparsity)] * len(weights)
+    else:
+        raise NotImplementedError("Pruning scope %s not recognized! Please use 'layer' or 'global'." % scope)
+    return [(W > threshold).astype(theano.config.floatX) for W, threshold in zip(weights, thresholds)]
+
+def _threshold(magnitudes, sparsity):
+    # the magnitude at or under which `sparsity` of the entries fall
+    n_prune = int(round(sparsity * magnitudes.size))
+    if n_prune == 0:
+        return -1.
+    return numpy.partition(magnitudes, n_prune - 1)[n_prune - 1]
+
+def prune(model, sparsity=.9, scope='layer'):
+    """
+    Prunes the smallest magnitude weights of the :class:`Dense` layers of a model in place, and sets their masks
+    as the layers' `param_masks` for any further training. Already pruned weights stay pruned.
+
+    Parameters
+    ----------
+    model : :class:`Model` or :class:`Prototype`
+        The model to prune.
+    sparsity : float
+        The fraction of the weights to prune.
+    scope : str
+        'layer' for a threshold per layer, or 'global' for one threshold over all the layers.
+
+    Returns
+    -------
+    OrderedDict
+        {layer index: density} - the fraction of the weights left in each pruned layer.
+    """
+    dense_layers = _dense_layers(model)
+    weights = [layer.params[0].get_value() for _, layer in dense_layers]
+    masks = magnitude_masks(weights, sparsity, scope)
+    densities = OrderedDict()
+    for (idx, layer), W_value, mask in zip(dense_layers, weights, masks):
+        W = layer.params[0]
+        old_masks = layer.get_param_masks()
+        if W in old_masks:
+            mask *= old_masks[W].get_value()
+            old_masks[W].set_value(mask)
+        else:
+            layer.param_masks = {W: sharedX(mask, name="%s_mask" % W.name)}
+        W.set_value((W_value * mask).astype(W.dtype))
+        densities[idx] = float(mask.mean())
+    log.info("Pruned %s to %s sparsity (%s): layer densities %s", model._classname, str(sparsity), scope,
+             str(list(densities.values())))
+    return densities
+
+def prune_and_finetune(model, optimizer, sparsities=(.5, .75, .9), scope='layer', **train_kwargs):
+    """
+    Iteratively prunes the model to increasing sparsities, finetuning it with a fresh copy of the optimizer (same
+    arguments) after each step. The pruned weights are masked out of the optimizer's updates.
+
+    Parameters
+    ----------
+    model : :class:`Model` or :class:`Prototype`
+        The trained model to prune.
+    optimizer : :class:`Optimizer`
+        The optimizer (with its dataset and settings like epochs and learning_rate) to finetune with.
+    sparsities : list(float)
+        The sparsity to prune to at each step.
+    scope : str
+        'layer' for a threshold per layer, or 'global' for one threshold over all the layers.
+    train_kwargs : dict
+        Arguments for the optimizer's `train()`, like monitor_channels.
+
+    Returns
+    -------
+    OrderedDict
+        {layer index: density} after the last step.
+    """
+    densities = None
+    if not isinstance(sparsities, (list, tuple)):
+        sparsities = [sparsities]
+    for step, sparsity in enumerate(sparsities):
+        densities = prune(model, sparsity, scope)
+        log.info("Finetuning pruning step %d (%s sparsity)...", step + 1, str(sparsity))
+        args = optimizer.args.copy()
+        args['model'] = model
+        # the optimizer collects the model's masks when it is created
+        type(optimizer)(**args).train(**train_kwargs)
+    return densities
+
+
+class SparseModel(object):
+    """
+    An inference-only version of a pruned model (or :class:`Prototype`), where the weights of each :class:`Dense`
+    layer with a density under the threshold are stored in CSR form and multiplied as sparse-dense products.
+    Denser layers are faster with the regular dense product, so they are left as they are.
+
+    Parameters
+    ----------
+    model : :class:`Model` or :class:`Prototype`
+        The pruned model.
+    density_threshold : float
+        The maximum fraction of nonzero weights for a layer to run sparse.
+
+    Attributes
+    ----------
+    sparse_params : OrderedDict
+        {layer index: transposed CSR weights SharedVariable} for the sparse layers.
+    f_run : function
+        The compiled sparse inference function.
+    """
+    def __init__(self, model, density_threshold=.3):
+        self.model = model
+        inputs = raise_to_list(model.get_inputs())
+        # everything is computed for inference, with the noise switches off
+        outputs, _ = fold_switches(raise_to_list(model.get_outputs()), switches=model.get_switches())
+
+        self.sparse_params = OrderedDict()
+        for idx, layer in _dense_layers(model):
+            W = layer.params[0]
+            W_value = W.get_value()
+            density = numpy.count_nonzero(W_value) / float(W_value.size)
+            if density > density_threshold:
+                log.debug("Layer %d (%s) has density %.3f, keeping it dense.", idx, layer._classname, density)
+                continue
+            # W.T in CSR so the product is the sparse-by-dense structured dot: dot(x, W) = dot(W.T, x.T).T
+            W_sparse = theano.sparse.shared(scipy.sparse.csr_matrix(W_value.T), name="%s_csr" % W.name)
+            self.sparse_params[idx] = W_sparse
+
+            dot = find_dot(outputs, W)
+            if dot is None:
+                raise NotImplementedError("Couldn't find the dot product with the weights of layer %d (%s)!" %
+                                          (idx, layer._classname))
+            x = dot.owner.inputs[0]
+            sparse_dot = theano.sparse.structured_dot(W_sparse, x.T).T
+            outputs = theano.clone(outputs, replace={dot: sparse_dot})
+
+        if len(outputs) == 1:
+            outputs = outputs[0]
+        t = time.time()
+        self.f_run = function(inputs=inputs, outputs=outputs, no_default_updates=True, name='f_run_sparse')
+        log.info("Running %d Dense layers of %s sparse (%s of weights instead of %s). Compiling took %s",
+                 len(self.sparse_params), model._classname, self._bytes(sparse=True), self._bytes(sparse=False),
+                 make_time_units_string(time.time() - t))
+
+    def _bytes(self, sparse=True):
+        if sparse:
+            total = 0
+            for W_sparse in self.sparse_params.values():
+                csr = W_sparse.get_value(borrow=True)
+                total += csr.data.nbytes + csr.indices.nbytes + csr.indptr.nbytes
+            return total
+        layers = self.model.models if isinstance(self.model, Prototype) else [self.model]
+        return sum(layers[idx].params[0].get_value(borrow=True).nbytes for idx in self.sparse_params)
+
+    def run(self, input):
+        """
+        Computes the sparse model's output.
+
+        Parameters
+        ----------
+        input : array_like or list(array_like)
+            The input(s) to the model.
+
+        Returns
+        -------
+        array_like or list(array_like)
+            The output(s) of the sparse model.
+        """
+        return self.f_run(*raise_to_list(input))
+
+    def compare(self, inputs, targets=None):
+        """
+        Reports the output difference and speed of the sparse model against the dense model.
+
+        Parameters
+        ----------
+        inputs : array_like or list(array_like)
+            The inputs to compare the models on.
+        targets : array_like, optional
+            The true labels (class indices) for classifiers that output their argmax prediction.
+
+        Returns
+        -------
+        dict
+            With the 'max_abs_error' between the outputs, the 'dense_time' and 'sparse_time' in seconds, the
+            'dense_error' and 'sparse_error' rates (if targets are given), and the 'dense_bytes' and
+            'sparse_bytes' of the sparse layers' weights.
+        """
+        t = time.time()
+        dense_outputs = numpy.asarray(raise_to_list(self.model.run(inputs))[0])
+        dense_time = time.time() - t
+        t = time.time()
+        sparse_outputs = numpy.asarray(raise_to_list(self.run(inputs))[0])
+        sparse_time = time.time() - t
+        report = {'max_abs_error': float(numpy.abs(dense_outputs.astype('float64') - sparse_outputs).max()),
+                  'dense_time': dense_time,
+                  'sparse_time': sparse_time,
+                  'dense_bytes': self._bytes(sparse=False),
+                  'sparse_bytes': self._bytes(sparse=True)}
+        if targets is not None and dense_outputs.dtype.kind in 'iu':
+            targets = numpy.asarray(targets)
+            report['dense_error'] = float(numpy.mean(dense_outputs != targets))
+            report['sparse_error'] = float(numpy.mean(sparse_outputs != targets))
+        log.info("Sparse vs. dense model: %s", str(report))
+        return report
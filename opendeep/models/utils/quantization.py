@@ -0,0 +1,237 @@
+"""
+This module provides post-training int8 quantization of the weights of :class:`Dense` and :class:`SoftmaxLayer` models
+for inference.
+
+Each output unit (column of W) gets its own scale, so the weights are stored as int8 - 4x smaller than float32 -
+and every layer computes ``dot(x, float(W_int8)) * scale + b``. The per-column scale is applied to the (much smaller)
+product instead of the weights. The clipping range of each column is calibrated on a sample of inputs to minimize the
+error of the layer's pre-activations.
+
+This is storage compression only: Theano has no int8 matrix multiply, so the int8 weights are cast back to a
+float matrix on every call and the product runs as the usual float GEMM. The cast isn't constant-folded (the weights
+are shared variables), so each call reads the int8 weights and writes and reads a temporary float copy - inference
+isn't faster than the float model, and is usually a little slower (see the timings from `compare()`). The float
+model is also kept as `QuantizedModel.model` for `compare()`, so its float weights stay in memory as long as the
+:class:`QuantizedModel` does - only the saved or shipped int8 weights are smaller::
+
+    from opendeep.models.utils.quantization import QuantizedModel
+    quantized = QuantizedModel(prototype, dataset=mnist, n_samples=1000)
+    predictions = quantized.run(inputs)
+    print(quantized.compare(test_inputs, test_targets))
+"""
+# standard libraries
+import logging
+import itertools
+import time
+# third party libraries
+import numpy
+import theano
+import theano.tensor as T
+from theano.compat.python2x import OrderedDict
+# internal references
+from opendeep.models.container import Prototype
+from opendeep.models.single_layer.basic import Dense
+from opendeep.utils.constructors import function, sharedX
+from opendeep.utils.misc import make_time_units_string, raise_to_list
+from opendeep.utils.nnet import find_dot, fold_switches
+
+log = logging.getLogger(__name__)
+
+# the candidate fractions of each column's max absolute weight to clip to during calibration
+DEFAULT_CLIP_RATIOS = (1., .99, .98, .96, .94, .92, .9, .85, .8)
+
+
+def quantize_weights(W, clip=1.):
+    """
+    Symmetric per-output-channel int8 quantization of a (input_size, output_size) weights matrix.
+
+    Parameters
+    ----------
+    W : array_like
+        The weights matrix.
+    clip : float or array_like
+        The fraction(s) of the max absolute value of each column to use as its quantization range (values outside
+        are clipped).
+
+    Returns
+    -------
+    tuple
+        (int8 weights, float scale per column) where W ~= W_int8 * scale.
+    """
+    W = numpy.asarray(W)
+    scale = numpy.abs(W).max(axis=0) * clip / 127.
+    scale[scale == 0] = 1.
+    W_q = numpy.clip(numpy.round(W / scale), -127, 127).astype('int8')
+    return W_q, scale.astype(theano.config.floatX)
+
+def calibrate_clipping(W, inputs, clip_ratios=DEFAULT_CLIP_RATIOS):
+    """
+    Picks the clipping ratio of each column of the weights that minimizes the mean squared error of the quantized
+    layer's pre-activations over the sample of inputs.
+
+    Parameters
+    ----------
+    W : array_like
+        The (input_size, output_size) weights matrix.
+    inputs : array_like
+        The (n_samples, input_size) sample of inputs to the layer.
+    clip_ratios : list(float)
+        The candidate clipping ratios.
+
+    Returns
+    -------
+    array_like
+        The best clipping ratio for each column.
+    """
+    W = numpy.asarray(W)
+    errors = []
+    for ratio in clip_ratios:
+        W_q, scale = quantize_weights(W, ratio)
+        errors.append(numpy.mean(numpy.dot(inputs, W - W_q * scale) ** 2, axis=0))
+    best = numpy.argmin(numpy.asarray(errors), axis=0)
+    return numpy.asarray(clip_ratios)[best]
+
+def _sample(data, n_samples):
+    if isinstance(data, numpy.ndarray):
+        return data[:n_samples]
+    return numpy.asarray(list(itertools.islice(iter(data), n_samples)))
+
+
+class QuantizedModel(object):
+    """
+    An inference-only version of a model (or :class:`Prototype`) with the weights of its :class:`Dense` and
+    :class:`SoftmaxLayer` layers quantized to int8.
+
+    Parameters
+    ----------
+    model : :class:`Model` or :class:`Prototype`
+        The trained float model.
+    dataset : :class:`Dataset`, optional
+        The dataset to take the calibration sample from (its train inputs). If None, the weights are quantized
+        over their full range without calibration.
+    n_samples : int
+        The number of examples to calibrate over.
+    clip_ratios : list(float)
+        The candidate clipping ratios for calibration (see `calibrate_clipping`).
+
+    Attributes
+    ----------
+    quantized_params : OrderedDict
+        {layer index: (int8 weights SharedVariable, scale SharedVariable)} for the quantized layers.
+    f_run : function
+        The compiled quantized inference function.
+    """
+    def __init__(self, model, dataset=None, n_samples=1000, clip_ratios=DEFAULT_CLIP_RATIOS):
+        self.model = model
+        layers = model.models if isinstance(model, Prototype) else [model]
+        dense_layers = [(idx, layer) for idx, layer in enumerate(layers) if isinstance(layer, Dense)]
+        assert len(dense_layers) > 0, "%s doesn't have any Dense layers to quantize!" % model._classname
+
+        inputs = raise_to_list(model.get_inputs())
+        # everything is computed for inference, with the noise switches off
+        outputs, _ = fold_switches(raise_to_list(model.get_outputs()), switches=model.get_switches())
+
+        layer_inputs = None
+        if dataset is not None:
+            t = time.time()
+            sample = [_sample(data, n_samples) for data in raise_to_list(dataset.train_inputs)]
+            layer_input_vars, _ = fold_switches([layer.input for _, layer in dense_layers],
+                                                switches=model.get_switches())
+            f_layer_inputs = function(inputs=inputs, outputs=layer_input_vars, no_default_updates=True,
+                                      name='f_quantize_calibration')
+            layer_inputs = f_layer_inputs(*sample)
+            log.debug("Computed calibration inputs over %d examples, took %s",
+                      len(sample[0]), make_time_units_string(time.time() - t))
+
+        self.quantized_params = OrderedDict()
+        for n, (idx, layer) in enumerate(dense_layers):
+            W = layer.params[0]
+            W_value = W.get_value()
+            clip = 1.
+            if layer_inputs is not None:
+                layer_input = numpy.asarray(layer_inputs[n]).reshape((-1, W_value.shape[0]))
+                clip = calibrate_clipping(W_value, layer_input, clip_ratios)
+            W_q, scale = quantize_weights(W_value, clip)
+            W_q = theano.shared(W_q, name="%s_int8" % W.name)
+            scale = sharedX(scale, name="%s_scale" % W.name)
+            self.quantized_params[idx] = (W_q, scale)
+
+            # swap the layer's float dot product for the int8 weights, cast back to float for the product
+            dot = find_dot(outputs, W)
+            if dot is None:
+                raise NotImplementedError("Couldn't find the dot product with the weights of layer %d (%s)!" %
+                                          (idx, layer._classname))
+            quantized_dot = T.dot(dot.owner.inputs[0], T.cast(W_q, theano.config.floatX)) * scale
+            outputs = theano.clone(outputs, replace={dot: quantized_dot})
+
+        if len(outputs) == 1:
+            outputs = outputs[0]
+        t = time.time()
+        self.f_run = function(inputs=inputs, outputs=outputs, no_default_updates=True, name='f_run_quantized')
+        log.info("Quantized %d Dense layers of %s to int8 (%s of weights instead of %s). Compiling took %s",
+                 len(self.quantized_params), model._classname, self._bytes(quantized=True),
+                 self._bytes(quantized=False), make_time_units_string(time.time() - t))
+
+    def _bytes(self, quantized=True):
+        if quantized:
+            return sum(W_q.get_value(borrow=True).nbytes for W_q, _ in self.quantized_params.values())
+        layers = self.model.models if isinstance(self.model, Prototype) else [self.model]
+        return sum(layers[idx].params[0].get_value(borrow=True).nbytes for idx in self.quantized_params)
+
+    def run(self, input):
+        """
+        Computes the quantized model's output.
+
+        Parameters
+        ----------
+        input : array_like or list(array_like)
+            The input(s) to the model.
+
+        Returns
+        -------
+        array_like or list(array_like)
+            The output(s) of the quantized model.
+        """
+        return self.f_run(*raise_to_list(input))
+
+    def compare(self, inputs, targets=None):
+        """
+        Reports the accuracy and speed of the quantized model against the float model.
+
+        Parameters
+        ----------
+        inputs : array_like or list(array_like)
+            The inputs to compare the models on.
+        targets : array_like, optional
+            The true labels (class indices) for classifiers that output their argmax prediction.
+
+        Returns
+        -------
+        dict
+            With the 'max_abs_error', 'mean_abs_error', and 'relative_error' of the quantized outputs, the
+            'agreement' between the predicted classes (if the outputs are class indices), the 'float_error' and
+            'quantized_error' rates (if targets are given), the 'float_time' and 'quantized_time' in seconds, and
+            the 'float_bytes' and 'quantized_bytes' of the quantized weights.
+        """
+        t = time.time()
+        float_outputs = numpy.asarray(raise_to_list(self.model.run(inputs))[0])
+        float_time = time.time() - t
+        t = time.time()
+        quantized_outputs = numpy.asarray(raise_to_list(self.run(inputs))[0])
+        quantized_time = time.time() - t
+        diff = numpy.abs(float_outputs.astype('float64') - quantized_outputs)
+        report = {'max_abs_error': float(diff.max()),
+                  'mean_abs_error': float(diff.mean()),
+                  'relative_error': float(numpy.linalg.norm(diff) / max(numpy.linalg.norm(float_outputs), 1e-12)),
+                  'float_time': float_time,
+                  'quantized_time': quantized_time,
+                  'float_bytes': self._bytes(quantized=False),
+                  'quantized_bytes': self._bytes(quantized=True)}
+        if float_outputs.dtype.kind in 'iu':
+            report['agreement'] = float(numpy.mean(float_outputs == quantized_outputs))
+            if targets is not None:
+                targets = numpy.asarray(targets)
+                report['float_error'] = float(numpy.mean(float_outputs != targets))
+                report['quantized_error'] = float(numpy.mean(quantized_outputs != targets))
+        log.info("Quantized vs. float model: %s", str(report))
+        return report
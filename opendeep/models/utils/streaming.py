@@ -0,0 +1,147 @@
+"""
+This module provides step-wise streaming inference for stateful recurrent models (:class:`LSTM`, :class:`GRU`,
+:class:`Recurrent`, and :class:`RNN` created with `stateful=True`, alone or stacked in a :class:`Prototype`).
+
+Instead of re-running `run()` over the whole prefix of a sequence for every new frame, a single-step function is
+compiled once with the carried states as explicit inputs and outputs. The states are kept in NumPy for each stream,
+so any set of concurrent streams can be advanced together in one batched call::
+
+    from opendeep.models.utils.streaming import StreamingModel
+    streams = StreamingModel(lstm)
+    outputs = streams.step(['call_1', 'call_2'], frames)  # frames is (2, input_size)
+    streams.reset('call_1')  # the next step of 'call_1' starts a new sequence
+"""
+# standard libraries
+import logging
+import threading
+import time
+# third party libraries
+import numpy
+import theano
+from theano.compat.python2x import OrderedDict
+# internal references
+from opendeep.models.container import Prototype
+from opendeep.utils.constructors import function
+from opendeep.utils.misc import make_time_units_string, raise_to_list
+from opendeep.utils.nnet import fold_switches
+
+log = logging.getLogger(__name__)
+
+
+class StreamingModel(object):
+    """
+    Runs a stateful recurrent model one timestep at a time over many independent streams, keeping the hidden (and
+    memory cell) state of each stream between calls.
+
+    Parameters
+    ----------
+    model : :class:`Model` or :class:`Prototype`
+        The recurrent model (or Prototype of layers) created with `stateful=True`.
+
+    Attributes
+    ----------
+    states : OrderedDict
+        {stream id: list of state arrays (one row each)} for the open streams.
+    f_step : function
+        The compiled function from (input for one timestep, states) to (outputs, new states).
+    """
+    def __init__(self, model):
+        self.model = model
+        layers = model.models if isinstance(model, Prototype) else [model]
+        state_variables = []
+        for layer in layers:
+            state_variables.extend(getattr(layer, 'state_variables', None) or [])
+        assert len(state_variables) > 0, "%s needs carried states for streaming - create the recurrent layers " \
+                                         "with stateful=True!" % model._classname
+        # the input of layers linked with an inputs_hook is (timesteps, batch, data), otherwise (batch, timesteps, data)
+        inputs_hook = layers[0].args.get('inputs_hook')
+        self.time_major = inputs_hook is not None
+        self.input_ndim = (inputs_hook[1] if self.time_major else raise_to_list(model.get_inputs())[0]).ndim
+        # 1D and 2D inputs_hook variables are a single sequence, so they can't hold a batch of streams
+        assert self.input_ndim >= 3, "%s needs a (timesteps, batch, data) input to step a batch of streams, " \
+                                     "found an inputs_hook with %d dimensions!" % (model._classname, self.input_ndim)
+
+        updates = model.get_updates() or {}
+        new_states = [updates[state] for state in state_variables]
+        outputs = raise_to_list(model.get_outputs())
+        self.n_outputs = len(outputs)
+        # inference with the noise switches off
+        step_outputs, _ = fold_switches(outputs + new_states, switches=model.get_switches())
+        # the carried shared states become explicit inputs, so they can hold a different batch of streams each call
+        state_inputs = [state.type(name="%s_in" % state.name) for state in state_variables]
+        step_outputs = theano.clone(step_outputs, replace=OrderedDict(zip(state_variables, state_inputs)))
+
+        t = time.time()
+        self.f_step = function(inputs=raise_to_list(model.get_inputs()) + state_inputs,
+                               outputs=step_outputs, no_default_updates=True, name='f_step')
+        log.info("Compiled the streaming step function for %s with %d carried states, took %s",
+                 model._classname, len(state_variables), make_time_units_string(time.time() - t))
+
+        self.n_states = len(state_variables)
+        self.state_dtypes = [state.dtype for state in state_variables]
+        # the size of each state, known after the first step
+        self.state_sizes = None
+        self.states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _initial_states(self, stream_ids):
+        if all(stream_id not in self.states for stream_id in stream_ids):
+            # empty states make the model start from its own initial (zero) states for the whole batch
+            return [numpy.zeros((0, 0), dtype=dtype) for dtype in self.state_dtypes]
+        states = []
+        for i in range(self.n_states):
+            zeros = numpy.zeros((self.state_sizes[i],), dtype=self.state_dtypes[i])
+            states.append(numpy.asarray([self.states[stream_id][i] if stream_id in self.states else zeros
+                                         for stream_id in stream_ids]))
+        return states
+
+    def step(self, stream_ids, x_t):
+        """
+        Computes one timestep for each of the streams, and carries their states over to the next step.
+
+        Parameters
+        ----------
+        stream_ids : list
+            The (hashable) ids of the streams to advance. New ids start new streams.
+        x_t : array_like
+            The (n_streams, input_size) inputs for this timestep, in the same order as `stream_ids`.
+
+        Returns
+        -------
+        array_like or list(array_like)
+            The (n_streams, output_size) output(s) of the model for this timestep.
+        """
+        stream_ids = list(stream_ids)
+        assert len(set(stream_ids)) == len(stream_ids), "Can't step the same stream twice in one call!"
+        x_t = numpy.asarray(x_t)
+        assert x_t.ndim == self.input_ndim - 1, "Expected (n_streams, data) inputs with %d dimensions, found shape " \
+                                                "%s!" % (self.input_ndim - 1, str(x_t.shape))
+        assert x_t.shape[0] == len(stream_ids), "Found %d inputs for %d streams!" % (x_t.shape[0], len(stream_ids))
+        x = x_t[None] if self.time_major else x_t[:, None]
+        with self._lock:
+            results = self.f_step(x, *self._initial_states(stream_ids))
+            outputs, new_states = results[:self.n_outputs], results[self.n_outputs:]
+            if self.state_sizes is None:
+                self.state_sizes = [state.shape[-1] for state in new_states]
+            for idx, stream_id in enumerate(stream_ids):
+                self.states[stream_id] = [state[idx] for state in new_states]
+        # the outputs are (timesteps, batch, data) - take the single timestep
+        outputs = [output[0] for output in outputs]
+        if len(outputs) == 1:
+            return outputs[0]
+        return outputs
+
+    def reset(self, stream_id=None):
+        """
+        Forgets the state of a stream, so its next step starts a new sequence.
+
+        Parameters
+        ----------
+        stream_id : hashable, optional
+            The stream to reset. If None, all the streams are reset.
+        """
+        with self._lock:
+            if stream_id is None:
+                self.states.clear()
+            else:
+                self.states.pop(stream_id, None)
@@ -2,6 +2,7 @@ from __future__ import division, absolute_import, print_function
 
 from .adadelta import AdaDelta
 from .adasecant import AdaSecant
+from .batch_size_tuner import tune_batch_size
 from .optimizer import *
 from .rmsprop import RMSProp
 from .stochastic_gradient_descent import SGD
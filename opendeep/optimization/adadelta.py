@@ -29,7 +29,9 @@ class AdaDelta(Optimizer):
                  save_freq=None, stop_threshold=None, stop_patience=None,
                  learning_rate=1e-6, lr_decay=None, lr_decay_factor=None,
                  decay=0.95,
-                 grad_clip=None, hard_clip=False):
+                 grad_clip=None, hard_clip=False,
+                 stop_monitor=None, best_params_dir=None, accumulate_steps=1,
+                 flat_updates=False, reset_state_every=None):
         """
         Initialize AdaDelta.
 
@@ -65,6 +67,20 @@ class AdaDelta(Optimizer):
             Whether to clip gradients. This will clip with a maximum of grad_clip or the parameter norm.
         hard_clip : bool
             Whether to use a hard cutoff or rescaling for clipping gradients.
+        stop_monitor : str, optional
+            The name of a validation monitor channel to use for early stopping and keeping the best parameters.
+            Defaults to using the training cost.
+        best_params_dir : str, optional
+            If given, the best parameters for early stopping are kept in memmap files inside this directory
+            instead of in memory (useful for very large models).
+        accumulate_steps : int, optional
+            The number of minibatches to accumulate gradients over before applying a parameter update. This gives
+            an effective batch size of `batch_size * accumulate_steps` while only using the memory of `batch_size`.
+        flat_updates : bool, optional
+            Whether to compute the update rule over all the parameters at once, as a single flattened vector
+            (one contiguous buffer per accumulator).
+        reset_state_every : int, optional
+            For stateful (truncated BPTT) models, reset the carried model state every this many minibatches.
         """
         # need to call the SGD constructor after parameters are extracted because the constructor calls get_updates()!
         initial_parameters = locals().copy()
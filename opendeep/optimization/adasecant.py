@@ -52,7 +52,9 @@ class AdaSecant(Optimizer):
                  learning_rate=1e-6, lr_decay=None, lr_decay_factor=None,
                  decay=0.95, gamma_clip=1.8, damping=1e-7, grad_clip=None, hard_clip=False, start_var_reduction=0,
                  delta_clip=None, use_adagrad=False, skip_nan_inf=False,
-                 upper_bound_tau=1e8, lower_bound_tau=1.5, use_corrected_grad=True):
+                 upper_bound_tau=1e8, lower_bound_tau=1.5, use_corrected_grad=True,
+                 stop_monitor=None, best_params_dir=None, accumulate_steps=1,
+                 flat_updates=False, reset_state_every=None):
         """
         Initialize AdaSecant.
 
@@ -102,6 +104,20 @@ class AdaSecant(Optimizer):
         use_corrected_grad: bool, optional
             Either to use correction for gradients (referred as variance
             reduction in the workshop paper).
+        stop_monitor : str, optional
+            The name of a validation monitor channel to use for early stopping and keeping the best parameters.
+            Defaults to using the training cost.
+        best_params_dir : str, optional
+            If given, the best parameters for early stopping are kept in memmap files inside this directory
+            instead of in memory (useful for very large models).
+        accumulate_steps : int, optional
+            The number of minibatches to accumulate gradients over before applying a parameter update. This gives
+            an effective batch size of `batch_size * accumulate_steps` while only using the memory of `batch_size`.
+        flat_updates : bool, optional
+            Whether to compute the update rule over all the parameters at once, as a single flattened vector
+            (one contiguous buffer per accumulator).
+        reset_state_every : int, optional
+            For stateful (truncated BPTT) models, reset the carried model state every this many minibatches.
         """
         # get everything together with the Optimizer class
         initial_parameters = locals().copy()
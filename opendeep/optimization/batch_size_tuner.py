@@ -0,0 +1,232 @@
+"""
+Measures training throughput across candidate batch sizes for a given Model, Dataset, and Optimizer, so the batch
+size can be picked from data instead of guessed.
+
+The training functions are built and compiled through the Optimizer (so gradient accumulation, parameter masks,
+flat updates and noise switches behave like in training) once - the batch dimension of the inputs is symbolic, so
+the same functions run every batch size. Each candidate is timed on a sample of real minibatches in (by default) a
+forked process, which measures the peak memory of that candidate on its own and leaves the model and optimizer
+state untouched.
+"""
+# standard libraries
+import logging
+import time
+import ctypes
+import ctypes.util
+import multiprocessing
+try:
+    from Queue import Empty
+except ImportError:  # python 3
+    from queue import Empty
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+# third party libraries
+import numpy
+from theano.compat.python2x import OrderedDict
+# internal references
+from opendeep.utils.constructors import as_floatX
+from opendeep.utils.batch import minibatch
+from opendeep.utils.misc import raise_to_list, min_normalized_izip, get_shared_values, set_shared_values
+
+log = logging.getLogger(__name__)
+
+# the learning rate scaling policies when changing the batch size.
+_lr_policies = {
+    None: lambda ratio: 1.,
+    'linear': lambda ratio: ratio,
+    'sqrt': lambda ratio: numpy.sqrt(ratio)
+}
+
+
+def _peak_memory():
+    """
+    Returns the peak resident memory of this process so far in megabytes (None if it can't be determined).
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+def _time_batch_size(optimizer, f_learn, f_apply, data, batch_size, n_batches, warmup_batches):
+    """
+    Runs the training functions over minibatches of `batch_size` like an epoch of training does, and returns the
+    result dictionary for it (see `tune_batch_size()`).
+    """
+    result = OrderedDict([('batch_size', batch_size), ('examples_per_sec', 0.), ('peak_memory_mb', None),
+                          ('error', None)])
+    peak_before = _peak_memory()
+    batches = min_normalized_izip(*[minibatch(subset, batch_size, optimizer.min_batch_size) for subset in data])
+    optimizer.model.reset_state()
+    n_examples = 0
+    timed = 0
+    accumulated = 0
+    t = None
+    for i, batch in enumerate(batches):
+        if i == warmup_batches:
+            t = time.time()
+        f_learn(*batch)
+        if f_apply is not None:
+            accumulated += 1
+            if accumulated == optimizer.accumulate_steps:
+                f_apply()
+                accumulated = 0
+        if i >= warmup_batches:
+            n_examples += len(batch[0])
+            timed += 1
+            if timed >= n_batches:
+                break
+    if t is None or n_examples == 0:
+        result['error'] = "Not enough minibatches in the dataset to time."
+    else:
+        result['examples_per_sec'] = n_examples / max(time.time() - t, 1e-12)
+    peak_after = _peak_memory()
+    if peak_after is not None:
+        result['peak_memory_mb'] = peak_after - peak_before
+    return result
+
+
+def _reset_peak_memory():
+    """
+    Starts the peak resident memory of this (forked) process over from its current memory. The freed heap memory
+    inherited from the parent is handed back to the operating system first (with glibc), so reusing it shows up
+    in the peak, and then the high water mark is reset (Linux >= 4.0). Either step is skipped where unsupported.
+    """
+    try:
+        ctypes.CDLL(ctypes.util.find_library('c')).malloc_trim(0)
+    except (OSError, AttributeError, TypeError):
+        pass
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except (IOError, OSError):
+        pass
+
+
+def _trial_worker(results, *args):
+    """
+    Times one batch size in a forked process, and sends back its result (or the error it ran into).
+    """
+    _reset_peak_memory()
+    try:
+        results.put(_time_batch_size(*args))
+    except Exception as e:
+        results.put(str(e))
+
+
+def tune_batch_size(optimizer, batch_sizes=None, n_batches=10, warmup_batches=1, apply=False, lr_policy=None,
+                    isolate=True):
+    """
+    Times the optimizer's training function over candidate batch sizes (from smallest to largest) and reports the
+    examples/second and memory for each.
+
+    Parameters
+    ----------
+    optimizer : Optimizer
+        The Optimizer (with its Model and Dataset) to tune.
+    batch_sizes : list(int), optional
+        The candidate batch sizes. Defaults to powers of two around the optimizer's current `batch_size`. They are
+        run in increasing order.
+    n_batches : int
+        The number of minibatches to time for each batch size.
+    warmup_batches : int
+        The number of minibatches to run (untimed) before timing each batch size.
+    apply : bool
+        Whether to set the optimizer's `batch_size` to the fastest setting.
+    lr_policy : str, optional
+        How to scale the learning rate when applying a new batch size: None (unchanged), 'linear'
+        (proportional to the batch size), or 'sqrt' (proportional to its square root).
+    isolate : bool
+        Whether to time each batch size in its own forked process (this needs the 'fork' start method, and isn't
+        safe when Theano is using a GPU). That way its peak memory is measured on its own, and a batch size that
+        runs out of memory doesn't take down the tuning. Otherwise, the batch sizes run in this process, the
+        model and optimizer state is restored after each, and the peak memory is only the increase of this
+        process's high water mark.
+
+    Returns
+    -------
+    list(dict)
+        The results for each batch size, with keys 'batch_size', 'examples_per_sec', 'peak_memory_mb' (how
+        much the peak resident memory grew while running this batch size, in megabytes), and 'error' (the
+        exception message if that batch size failed, like running out of memory).
+    """
+    assert getattr(optimizer, 'model', None) is not None, "Optimizer needs to be initialized with a Model to tune!"
+    assert lr_policy in _lr_policies, "lr_policy needs to be one of %s, found %s" % \
+                                      (str(list(_lr_policies.keys())), str(lr_policy))
+    model = optimizer.model
+    dataset = optimizer.dataset
+    if batch_sizes is None:
+        batch_sizes = [max(optimizer.min_batch_size, int(optimizer.batch_size * 2 ** power))
+                       for power in range(-2, 4)]
+    # without isolation the peak memory only goes up, so go from the smallest batch size to the largest
+    batch_sizes = sorted(set(batch_sizes))
+
+    # build and compile the (first) training function the same way training does - it works for any batch size.
+    log.info("Compiling training function for batch size tuning...")
+    train_costs = raise_to_list(model.get_train_cost())[:1]
+    train_updates, apply_updates = optimizer._build_train_updates(train_costs)
+    function_input = raise_to_list(model.get_inputs()) + raise_to_list(model.get_targets())
+    optimizer.train_monitors_dict = OrderedDict()
+    f_learn, f_apply = optimizer._compile_train_functions(0, 1, function_input, train_costs[0],
+                                                          train_updates[0], apply_updates[0])
+
+    # everything the training functions change, so it can be put back afterwards.
+    state_variables = optimizer.params + optimizer.training_state_variables[0] + optimizer.noise_switches
+    initial_state = get_shared_values(state_variables)
+    # the noise switches are on during training
+    [switch.set_value(1.) for switch in optimizer.noise_switches]
+
+    data = raise_to_list(dataset.train_inputs)
+    if dataset.train_targets is not None and not optimizer.unsupervised:
+        data += raise_to_list(dataset.train_targets)
+
+    results = []
+    for batch_size in batch_sizes:
+        args = (optimizer, f_learn, f_apply, data, batch_size, n_batches, warmup_batches)
+        if isolate:
+            queue = multiprocessing.Queue()
+            worker = multiprocessing.Process(target=_trial_worker, args=(queue,) + args)
+            worker.daemon = True
+            worker.start()
+            worker.join()
+            try:
+                result = queue.get(timeout=1.)
+            except Empty:
+                # the process died without a result (like being killed for running out of memory)
+                result = "Worker process exited with code %s." % str(worker.exitcode)
+        else:
+            try:
+                result = _time_batch_size(*args)
+            except (MemoryError, RuntimeError) as e:
+                result = str(e)
+            finally:
+                set_shared_values(state_variables, initial_state)
+                [switch.set_value(1.) for switch in optimizer.noise_switches]
+        if not isinstance(result, dict):
+            log.warning("Batch size %d failed: %s", batch_size, result)
+            result = OrderedDict([('batch_size', batch_size), ('examples_per_sec', 0.), ('peak_memory_mb', None),
+                                  ('error', result)])
+        results.append(result)
+        log.info("Batch size %d: %s examples/sec, peak memory +%s MB%s",
+                 batch_size, '%.1f' % result['examples_per_sec'], str(result['peak_memory_mb']),
+                 (" (%s)" % result['error']) if result['error'] else "")
+    set_shared_values(state_variables, initial_state)
+
+    successful = [result for result in results if result['error'] is None]
+    if len(successful) == 0:
+        log.warning("No batch sizes could be timed!")
+        return results
+    best = max(successful, key=lambda result: result['examples_per_sec'])
+    log.info("Fastest batch size: %d (%.1f examples/sec)", best['batch_size'], best['examples_per_sec'])
+
+    if apply and best['batch_size'] != optimizer.batch_size:
+        scale = _lr_policies[lr_policy](float(best['batch_size']) / optimizer.batch_size)
+        log.info("Setting optimizer batch size to %d (learning rate scaled by %s)", best['batch_size'], str(scale))
+        optimizer.batch_size = best['batch_size']
+        if scale != 1.:
+            optimizer.learning_rate.set_value(as_floatX(optimizer.learning_rate.get_value() * scale))
+            if optimizer.learning_rate_decay:
+                optimizer.learning_rate_decay.initial = optimizer.learning_rate_decay.initial * scale
+    return results
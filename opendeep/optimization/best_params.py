@@ -0,0 +1,150 @@
+"""
+Keeps a copy of the best model parameters found during training (for early stopping) without allocating a fresh
+copy of every parameter each time the cost improves.
+
+The buffers are allocated once (the first time parameters are recorded) and every later improvement copies the
+current parameter values into them in place. For models too big to comfortably hold a second copy in memory, the
+buffers can be spilled to numpy memmaps on disk instead.
+"""
+# standard libraries
+import logging
+import os
+import tempfile
+# third party libraries
+import numpy
+
+log = logging.getLogger(__name__)
+
+
+class BestParams(object):
+    """
+    Preallocated storage for the best values of a list of shared variables.
+
+    Attributes
+    ----------
+    params : list
+        The shared variables to track.
+    buffers : list or None
+        The numpy (or numpy.memmap) arrays holding the best values, or None if they haven't been allocated yet.
+    recorded : bool
+        Whether the buffers currently hold recorded values.
+    """
+    def __init__(self, params, memmap_dir=None):
+        """
+        Parameters
+        ----------
+        params : list
+            The list of shared variables to track (normally the model parameters).
+        memmap_dir : str, optional
+            If given, the buffers are stored as memmaps inside this directory instead of in memory.
+        """
+        self.params = list(params)
+        self.memmap_dir = memmap_dir
+        self.buffers = None
+        self.recorded = False
+        self._memmap_files = []
+
+    def _allocate(self, values):
+        """
+        Creates one buffer per parameter matching the shape and dtype of the given values.
+        """
+        if self.memmap_dir is not None:
+            if not os.path.exists(self.memmap_dir):
+                os.makedirs(self.memmap_dir)
+            log.debug("Allocating best parameter memmaps in %s", self.memmap_dir)
+            self.buffers = []
+            for value in values:
+                fd, fname = tempfile.mkstemp(suffix='.memmap', prefix='best_params_', dir=self.memmap_dir)
+                os.close(fd)
+                self._memmap_files.append(fname)
+                # memmaps can't be zero-size, so give empty parameters an in-memory buffer.
+                if value.size == 0:
+                    self.buffers.append(numpy.empty_like(value))
+                else:
+                    self.buffers.append(numpy.memmap(fname, dtype=value.dtype, mode='w+', shape=value.shape))
+        else:
+            self.buffers = [numpy.empty_like(value) for value in values]
+
+    def has_values(self):
+        """
+        Returns
+        -------
+        bool
+            Whether any parameter values have been recorded.
+        """
+        return self.recorded
+
+    def record(self):
+        """
+        Copies the current values of the parameters into the buffers (in place).
+        """
+        # borrow the internal values - they are copied into the buffers immediately.
+        values = [numpy.asarray(param.get_value(borrow=True)) for param in self.params]
+        if self.buffers is None:
+            self._allocate(values)
+        for buffer, value in zip(self.buffers, values):
+            numpy.copyto(buffer, value)
+        self.recorded = True
+
+    def restore(self):
+        """
+        Sets the parameters back to the recorded best values.
+        """
+        if not self.recorded:
+            log.warning("No best parameters were recorded, nothing to restore.")
+            return
+        for param, buffer in zip(self.params, self.buffers):
+            # set_value copies by default, so the buffers stay valid for further improvements.
+            param.set_value(numpy.asarray(buffer))
+
+    def get_values(self):
+        """
+        Returns a (copied) list of the recorded best values, for things like checkpointing.
+
+        Returns
+        -------
+        list or None
+            The list of best values, or None if nothing has been recorded yet.
+        """
+        if not self.recorded:
+            return None
+        return [numpy.array(buffer) for buffer in self.buffers]
+
+    def set_values(self, values):
+        """
+        Fills the buffers from a list of values (the output of `get_values()`).
+
+        Parameters
+        ----------
+        values : list or None
+            The best values to store.
+        """
+        if values is None:
+            self.recorded = False
+            return
+        assert len(values) == len(self.params), \
+            "Found %d values for %d parameters!" % (len(values), len(self.params))
+        if self.buffers is None:
+            self._allocate([numpy.asarray(value) for value in values])
+        for buffer, value in zip(self.buffers, values):
+            numpy.copyto(buffer, value)
+        self.recorded = True
+
+    def clear(self):
+        """
+        Forgets the recorded values (the buffers are kept around to reuse for the next recording).
+        """
+        self.recorded = False
+
+    def close(self):
+        """
+        Releases the buffers and removes any memmap files.
+        """
+        self.buffers = None
+        self.recorded = False
+        for fname in self._memmap_files:
+            try:
+                os.remove(fname)
+            except OSError:
+                log.warning("Couldn't remove best parameter memmap file %s", fname)
+        self._memmap_files = []
@@ -1,4 +1,5 @@
 from __future__ import division, absolute_import, print_function
 
+from .annealed_importance_sampling import *
 from .conservative_sampling_ll import *
 from .log_likelihood import *
\ No newline at end of file
@@ -0,0 +1,176 @@
+"""
+Implements Annealed Importance Sampling (AIS) to estimate the partition function (log Z) of a binary RBM, which
+gives the test log-likelihood for model comparison.
+
+From the paper:
+"On the Quantitative Analysis of Deep Belief Networks"
+Ruslan Salakhutdinov, Iain Murray
+http://www.cs.toronto.edu/~rsalakhu/papers/dbn_ais.pdf
+
+The annealing goes from a base-rate model (independent visibles with biases `base_bv`, no hidden interactions)
+to the RBM through the intermediate distributions
+
+p_k*(v) = exp((1 - beta_k) v.base_bv + beta_k v.bv) * prod_j (1 + exp(beta_k (v.W + bh)_j))
+
+All the annealing runs in a batch go through the temperature schedule together in one compiled scan, and the
+importance weights of each batch are folded into an online log-mean-exp, so any number of runs can be used.
+"""
+# standard libraries
+import logging
+import time
+# third party
+import numpy
+import theano
+import theano.tensor as T
+import theano.sandbox.rng_mrg as RNG_MRG
+# internal
+from opendeep.utils.constructors import function
+from opendeep.utils.misc import make_time_units_string
+from opendeep.optimization.log_likelihood.conservative_sampling_ll import OnlineLogSumExp
+
+log = logging.getLogger(__name__)
+
+
+def default_betas():
+    """
+    The temperature schedule from Salakhutdinov and Murray: 500 steps up to 0.5, 4000 steps up to 0.9, and
+    10000 steps up to 1.
+
+    Returns
+    -------
+    array_like
+        The increasing inverse temperatures from 0 to 1.
+    """
+    return numpy.concatenate([numpy.linspace(0, 0.5, 500, endpoint=False),
+                              numpy.linspace(0.5, 0.9, 4000, endpoint=False),
+                              numpy.linspace(0.9, 1, 10000)]).astype(theano.config.floatX)
+
+
+def _log_p_star(v, beta, W, bv, bh, base_bv):
+    """
+    Unnormalized log probability of the visibles under the intermediate distribution at inverse temperature beta.
+    """
+    return (1. - beta) * T.dot(v, base_bv) + beta * T.dot(v, bv) + \
+        T.sum(T.nnet.softplus(beta * (T.dot(v, W) + bh)), axis=1)
+
+
+def _compile_ais_fn(W, bv, bh, base_bv, mrg):
+    """
+    Compiles the function taking the (n_runs, D) starting visibles sampled from the base-rate model and the
+    vector of inverse temperatures, and returning the log importance weight of each run.
+    """
+    log.debug('building theano fn for RBM AIS')
+    v0 = T.matrix('ais_v0')
+    betas = T.vector('ais_betas')
+    log_w0 = T.zeros_like(v0[:, 0])
+
+    def anneal_step(beta_km1, beta_k, v, log_w):
+        log_w = log_w + _log_p_star(v, beta_k, W, bv, bh, base_bv) - _log_p_star(v, beta_km1, W, bv, bh, base_bv)
+        # one Gibbs transition that leaves p_k invariant
+        mean_h = T.nnet.sigmoid(beta_k * (T.dot(v, W) + bh))
+        h = mrg.binomial(size=mean_h.shape, n=1, p=mean_h, dtype=theano.config.floatX)
+        mean_v = T.nnet.sigmoid((1. - beta_k) * base_bv + beta_k * (T.dot(h, W.T) + bv))
+        v = mrg.binomial(size=mean_v.shape, n=1, p=mean_v, dtype=theano.config.floatX)
+        return v, log_w
+
+    # only the last state is used, so scan doesn't keep the whole annealing path in memory
+    (_, log_ws), updates = theano.scan(fn=anneal_step,
+                                       sequences=[betas[:-1], betas[1:]],
+                                       outputs_info=[v0, log_w0],
+                                       name='rbm_ais_scan')
+    return function(inputs=[v0, betas], outputs=log_ws[-1], updates=updates, name='rbm_ais_fn')
+
+
+def _base_rate_biases(n_visible, base_rate_data=None):
+    """
+    The visible biases of the base-rate model: the log-odds of the mean of the data (smoothed), or zeros.
+    """
+    if base_rate_data is None:
+        return numpy.zeros((n_visible,), dtype=theano.config.floatX)
+    p = (numpy.asarray(base_rate_data).sum(axis=0) + 0.05) / (len(base_rate_data) + 0.1)
+    return numpy.log(p / (1. - p)).astype(theano.config.floatX)
+
+
+def rbm_ais(rbm, n_runs=1000, batch_size=100, betas=None, base_rate_data=None, seed=123):
+    """
+    Estimates log Z of a binary RBM with Annealed Importance Sampling.
+
+    Parameters
+    ----------
+    rbm : RBM
+        The (binary) RBM with vector biases.
+    n_runs : int
+        The total number of annealing runs.
+    batch_size : int
+        The number of annealing runs to do in parallel in one call of the compiled scan.
+    betas : array_like, optional
+        The increasing inverse temperatures from 0 to 1. Defaults to `default_betas()`.
+    base_rate_data : array_like, optional
+        Training data to set the base-rate model's visible biases from (which makes the estimate much better).
+        If None, the base-rate model is uniform.
+    seed : int
+        The seed for the random streams.
+
+    Returns
+    -------
+    float
+        The estimate of log Z.
+    """
+    assert rbm.bv.ndim == 1 and rbm.bh.ndim == 1, "AIS needs an RBM with vector biases (not conditional biases)!"
+    betas = default_betas() if betas is None else numpy.asarray(betas, dtype=theano.config.floatX)
+    assert betas[0] == 0 and betas[-1] == 1, "The betas need to go from 0 to 1."
+
+    n_visible, n_hidden = rbm.W.get_value(borrow=True).shape
+    base_bv = _base_rate_biases(n_visible, base_rate_data)
+    # the base-rate model has no hidden interactions - each hidden unit contributes a factor of 2.
+    log_z_base = numpy.sum(numpy.logaddexp(0, base_bv)) + n_hidden * numpy.log(2.)
+
+    f_ais = _compile_ais_fn(rbm.W, rbm.bv, rbm.bh, theano.shared(base_bv, name='ais_base_bv'),
+                            RNG_MRG.MRG_RandomStreams(seed))
+    rng = numpy.random.RandomState(seed)
+    p_base = 1. / (1. + numpy.exp(-base_bv))
+
+    t = time.time()
+    log_weights = OnlineLogSumExp()
+    while log_weights.count < n_runs:
+        runs = min(batch_size, n_runs - log_weights.count)
+        v0 = rng.binomial(n=1, p=p_base, size=(runs, n_visible)).astype(theano.config.floatX)
+        log_weights.update(numpy.asarray(f_ais(v0, betas)).reshape((1, runs)))
+        log.debug('%d / %d AIS runs done', log_weights.count, n_runs)
+
+    log_z = log_z_base + log_weights.log_sum_exp()[0] - numpy.log(log_weights.count)
+    log.info('AIS log Z estimate %s over %d runs' % (str(log_z), log_weights.count))
+    log.info('--- took %s ---' % make_time_units_string(time.time() - t))
+    return log_z
+
+
+def rbm_log_likelihood(rbm, inputs, log_z, batch_size=1000):
+    """
+    Computes the average log-likelihood of the inputs under a binary RBM given its log partition function.
+
+    Parameters
+    ----------
+    rbm : RBM
+        The (binary) RBM with vector biases.
+    inputs : array_like
+        The (M, D) binary inputs.
+    log_z : float
+        The log partition function (like the estimate from `rbm_ais`).
+    batch_size : int
+        The number of inputs to compute at once.
+
+    Returns
+    -------
+    float
+        The mean log-likelihood of the inputs.
+    """
+    W = rbm.W.get_value(borrow=True)
+    bv = rbm.bv.get_value(borrow=True)
+    bh = rbm.bh.get_value(borrow=True)
+    inputs = numpy.asarray(inputs)
+    total = 0.
+    for start in range(0, inputs.shape[0], batch_size):
+        v = inputs[start:start + batch_size]
+        # negative free energy of each input
+        total += numpy.sum(numpy.dot(v, bv) + numpy.logaddexp(0, numpy.dot(v, W) + bh).sum(axis=1))
+    return total / inputs.shape[0] - log_z
@@ -21,6 +21,9 @@ of h from higher layers mix much faster then x, which is what we usually observe
 # standard libraries
 import logging
 import time
+import multiprocessing
+import itertools
+from collections import deque
 # third party
 import numpy
 import theano.tensor as T
@@ -204,4 +207,203 @@ def compute_CSL_with_minibatches(fn, minibatches, chains):
     mean_LLs = LLs.mean()
     log.info('mean LL %s' % str(mean_LLs))
     log.info('--- took %s ---' % make_time_units_string(time.time() - t))
-    return mean_LLs
\ No newline at end of file
+    return mean_LLs
+
+
+def bernoulli_log_likelihoods(inputs, means):
+    """
+    Computes the log-likelihood of every input under the independent Bernoulli distribution given by every mean.
+    The sum over the data dimension is done as two matrix products, so no (M, K, D) tensor is built.
+
+    Parameters
+    ----------
+    inputs : array_like
+        The (M, D) binary inputs.
+    means : array_like
+        The (K, D) Bernoulli means (like the p(X|H) samples from a GSN chain).
+
+    Returns
+    -------
+    array_like
+        The (M, K) matrix of log p(input_m | mean_k).
+    """
+    means = numpy.clip(means, 1e-10, (1 - (1e-5)))
+    return numpy.dot(inputs, numpy.log(means).T) + numpy.dot(1. - inputs, numpy.log(1. - means).T)
+
+
+class OnlineLogSumExp(object):
+    """
+    Accumulates log(sum(exp(values))) along the second axis of chunks of values, keeping only a running max and
+    a running (rescaled) sum for each row. Memory stays bounded no matter how many chunks are seen.
+
+    Attributes
+    ----------
+    max : array_like or None
+        The running max for each row.
+    sum : array_like or None
+        The running sum of exp(values - max) for each row.
+    count : int
+        The number of values seen for each row.
+    """
+    def __init__(self):
+        self.max = None
+        self.sum = None
+        self.count = 0
+
+    def update(self, values):
+        """
+        Adds a (rows, n) chunk of values.
+
+        Parameters
+        ----------
+        values : array_like
+            The chunk of values.
+        """
+        values = numpy.asarray(values, dtype='float64')
+        chunk_max = values.max(axis=1)
+        chunk_sum = numpy.exp(values - chunk_max[:, None]).sum(axis=1)
+        self.merge(chunk_max, chunk_sum, values.shape[1])
+
+    def merge(self, other_max, other_sum, other_count):
+        """
+        Combines the running max and sum of another accumulator (like one from a different process) into this one.
+
+        Parameters
+        ----------
+        other_max : array_like
+            The other running max.
+        other_sum : array_like
+            The other running sum.
+        other_count : int
+            The number of values the other accumulator has seen.
+        """
+        if self.max is None:
+            self.max, self.sum = numpy.array(other_max), numpy.array(other_sum)
+        else:
+            new_max = numpy.maximum(self.max, other_max)
+            self.sum = self.sum * numpy.exp(self.max - new_max) + other_sum * numpy.exp(other_max - new_max)
+            self.max = new_max
+        self.count += other_count
+
+    def log_sum_exp(self):
+        """
+        Returns
+        -------
+        array_like
+            log(sum(exp(values))) for each row over everything seen so far.
+        """
+        return self.max + numpy.log(self.sum)
+
+
+# the inputs for the CSL worker processes (set once per process by the pool initializer)
+_csl_inputs = None
+
+
+def _init_csl_worker(inputs):
+    global _csl_inputs
+    _csl_inputs = inputs
+
+
+def _csl_chunk(args):
+    """
+    Computes the running max and sum of one chunk of means against all the inputs (run in a worker process).
+    """
+    means, batch_size = args
+    accumulator = _accumulate_chunk(_csl_inputs, means, batch_size)
+    return accumulator.max, accumulator.sum, accumulator.count
+
+
+def _accumulate_chunk(inputs, means, batch_size, accumulator=None):
+    """
+    Adds the log-likelihoods of the inputs (in minibatches) under one chunk of means to the accumulator.
+    """
+    if accumulator is None:
+        accumulator = OnlineLogSumExp()
+    chunk_max = numpy.empty((inputs.shape[0],), dtype='float64')
+    chunk_sum = numpy.empty((inputs.shape[0],), dtype='float64')
+    for start in range(0, inputs.shape[0], batch_size):
+        batch = OnlineLogSumExp()
+        batch.update(bernoulli_log_likelihoods(inputs[start:start + batch_size], means))
+        chunk_max[start:start + batch_size] = batch.max
+        chunk_sum[start:start + batch_size] = batch.sum
+    accumulator.merge(chunk_max, chunk_sum, means.shape[0])
+    return accumulator
+
+
+def _iter_chunks(samples, chunk_size):
+    """
+    Yields (n, D) chunks of means from an array of samples (any shape ending in D, like a (steps, chains, D)
+    chain), or passes through the chunks of an iterable (like a generator over a sampling chain).
+    """
+    if hasattr(samples, 'shape'):
+        samples = samples.reshape((-1, samples.shape[-1]))
+        for start in range(0, samples.shape[0], chunk_size):
+            yield numpy.asarray(samples[start:start + chunk_size])
+    else:
+        for chunk in samples:
+            chunk = numpy.asarray(chunk)
+            yield chunk.reshape((-1, chunk.shape[-1]))
+
+
+def compute_CSL_streaming(inputs, samples, chunk_size=1000, batch_size=1000, processes=1, max_pending_chunks=None):
+    """
+    Computes the Bernoulli CSL log-likelihood estimate of the inputs from chain samples, streaming over the samples
+    in chunks with an online log-sum-exp. Memory only depends on the chunk and batch sizes, not on the number of
+    samples, so chains with hundreds of thousands of samples can be evaluated.
+
+    Parameters
+    ----------
+    inputs : array_like
+        The (M, D) binary inputs (like the test set) to estimate the log-likelihood of.
+    samples : array_like or iterable
+        The Bernoulli means from the chain: an array (or memmap) whose last axis is D, or an iterable
+        (like a generator) of such chunks.
+    chunk_size : int
+        The number of samples per chunk when `samples` is an array.
+    batch_size : int
+        The number of inputs to compute against a chunk at once.
+    processes : int
+        The number of worker processes to spread the chunks across (1 computes everything in this process).
+    max_pending_chunks : int, optional
+        The maximum number of chunks sent to the workers ahead of their results (this bounds the memory used when
+        `processes` > 1). Defaults to twice the number of processes.
+
+    Returns
+    -------
+    tuple
+        The mean LL over the inputs, and the array of LL values for each input.
+    """
+    inputs = numpy.asarray(inputs, dtype='float64')
+    t = time.time()
+    accumulator = OnlineLogSumExp()
+    chunks = _iter_chunks(samples, chunk_size)
+    if processes > 1:
+        max_pending_chunks = max_pending_chunks or 2 * processes
+        pool = multiprocessing.Pool(processes=processes, initializer=_init_csl_worker, initargs=(inputs,))
+        try:
+            # only keep max_pending_chunks chunks in flight, so the chunks aren't all read (and queued) at once.
+            pending = deque()
+            for chunk in itertools.islice(chunks, max_pending_chunks):
+                pending.append(pool.apply_async(_csl_chunk, ((chunk, batch_size),)))
+            i = 0
+            while len(pending) > 0:
+                chunk_max, chunk_sum, count = pending.popleft().get()
+                accumulator.merge(chunk_max, chunk_sum, count)
+                i += 1
+                log.debug('%d chunks, %d samples so far', i, accumulator.count)
+                for chunk in itertools.islice(chunks, 1):
+                    pending.append(pool.apply_async(_csl_chunk, ((chunk, batch_size),)))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for i, chunk in enumerate(chunks):
+            _accumulate_chunk(inputs, chunk, batch_size, accumulator)
+            log.debug('%d chunks, %d samples so far', i + 1, accumulator.count)
+
+    assert accumulator.count > 0, "No samples were given to compute the CSL over!"
+    LLs = accumulator.log_sum_exp() - numpy.log(accumulator.count)
+    mean_LLs = LLs.mean()
+    log.info('mean LL %s over %d samples' % (str(mean_LLs), accumulator.count))
+    log.info('--- took %s ---' % make_time_units_string(time.time() - t))
+    return mean_LLs, LLs
@@ -0,0 +1,39 @@
+import itertools
+import unittest
+import numpy
+from opendeep.models.single_layer.restricted_boltzmann_machine import RBM
+from opendeep.optimization.log_likelihood.annealed_importance_sampling import rbm_ais, rbm_log_likelihood
+from opendeep.utils.constructors import sharedX
+
+
+class TestAIS(unittest.TestCase):
+    def setUp(self):
+        # an RBM small enough to sum over all of its visible states
+        rng = numpy.random.RandomState(1)
+        n_visible, n_hidden = 6, 4
+        W = rng.randn(n_visible, n_hidden)
+        bv = rng.randn(n_visible) * .5
+        bh = rng.randn(n_hidden) * .5
+        self.rbm = RBM(input_size=n_visible, hidden_size=n_hidden, outdir=None,
+                       params_hook=[sharedX(W, name="W"), sharedX(bv, name="bv"), sharedX(bh, name="bh")])
+        self.visibles = numpy.asarray(list(itertools.product([0, 1], repeat=n_visible)), dtype='float64')
+        # the exact log Z is the log-sum-exp of the negative free energy of every visible state
+        neg_free_energy = numpy.dot(self.visibles, bv) + \
+            numpy.logaddexp(0, numpy.dot(self.visibles, W) + bh).sum(axis=1)
+        max_energy = neg_free_energy.max()
+        self.log_z = max_energy + numpy.log(numpy.exp(neg_free_energy - max_energy).sum())
+
+    def testLogZ(self):
+        log_z = rbm_ais(self.rbm, n_runs=200, batch_size=50, betas=numpy.linspace(0, 1, 1000))
+        self.assertAlmostEqual(log_z, self.log_z, delta=.05)
+
+    def testLogLikelihood(self):
+        # with the exact log Z, the probabilities of all the visible states sum to 1
+        mean_ll = rbm_log_likelihood(self.rbm, self.visibles, self.log_z, batch_size=10)
+        lls = [rbm_log_likelihood(self.rbm, v[None], self.log_z) for v in self.visibles]
+        numpy.testing.assert_allclose(numpy.exp(lls).sum(), 1.)
+        numpy.testing.assert_allclose(mean_ll, numpy.mean(lls))
+
+
+if __name__ == '__main__':
+    unittest.main()
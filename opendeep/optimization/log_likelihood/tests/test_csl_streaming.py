@@ -0,0 +1,56 @@
+import unittest
+import numpy
+from opendeep.optimization.log_likelihood.conservative_sampling_ll import compute_CSL_streaming, OnlineLogSumExp
+
+
+class TestCSLStreaming(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(1)
+        self.inputs = rng.binomial(1, 0.5, size=(25, 16)).astype('float64')
+        self.means = rng.uniform(size=(500, 16))
+        # the direct estimate over the full (M, K, D) tensor
+        means = numpy.clip(self.means, 1e-10, (1 - (1e-5)))
+        lls = (self.inputs[:, None, :] * numpy.log(means)[None, :, :] +
+               (1. - self.inputs[:, None, :]) * numpy.log(1. - means)[None, :, :]).sum(axis=2)
+        max_ll = lls.max(axis=1)
+        self.expected = max_ll + numpy.log(numpy.exp(lls - max_ll[:, None]).sum(axis=1)) - numpy.log(500)
+
+    def testChunks(self):
+        _, lls = compute_CSL_streaming(self.inputs, self.means, chunk_size=64, batch_size=10)
+        numpy.testing.assert_allclose(lls, self.expected)
+
+    def testGenerator(self):
+        chunks = (chunk for chunk in numpy.array_split(self.means, 7))
+        _, lls = compute_CSL_streaming(self.inputs, chunks)
+        numpy.testing.assert_allclose(lls, self.expected)
+
+    def testProcesses(self):
+        mean, lls = compute_CSL_streaming(self.inputs, self.means, chunk_size=50, processes=2)
+        numpy.testing.assert_allclose(lls, self.expected)
+        numpy.testing.assert_allclose(mean, self.expected.mean())
+
+    def testProcessesBounded(self):
+        # count the chunk results merged in this process, to check how far ahead the chunks are read
+        merged = [0]
+        merge = OnlineLogSumExp.merge
+
+        def counting_merge(accumulator, *args):
+            merged[0] += 1
+            return merge(accumulator, *args)
+
+        def chunks():
+            for i, chunk in enumerate(numpy.array_split(self.means, 20)):
+                assert i - merged[0] < 4, "Read chunk %d with only %d results merged!" % (i, merged[0])
+                yield chunk
+
+        OnlineLogSumExp.merge = counting_merge
+        try:
+            _, lls = compute_CSL_streaming(self.inputs, chunks(), processes=2, max_pending_chunks=4)
+        finally:
+            OnlineLogSumExp.merge = merge
+        numpy.testing.assert_allclose(lls, self.expected)
+        self.assertEqual(merged[0], 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
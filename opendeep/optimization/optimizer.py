@@ -19,22 +19,49 @@ Attributes
 ----------
 TRAIN_COST_KEY : str
     The monitor name to use for the training cost. (Optimizer will always automatically monitor the training cost).
+TRAINING_STATE_FILE : str
+    The filename (inside the model's `outdir`) used to checkpoint the full training state.
+TIMING_CHANNEL : str
+    The channel name for the per-epoch timing monitors the Optimizer always computes.
+TIMING_KEYS : list
+    The names of the timing monitors: examples and batches per second, and seconds spent waiting on the data
+    iterator, inside the training function, aggregating and computing monitors, writing to outservices and plots,
+    checkpointing, and for the whole epoch.
+MAX_PENDING_SNAPSHOTS : int
+    The maximum number of parameter snapshots waiting on the asynchronous monitor worker. Epochs finishing while
+    this many are in flight skip their valid/test monitors.
+FLAT_UPDATES_MAX_SIZE : int
+    The largest parameter (in number of elements) flattened together with the others when using `flat_updates`.
+    Larger parameters already compile to big elementwise operations, and copying them in and out of the flat
+    vector every step costs more than it saves, so they keep their own updates.
 """
 # standard libraries
 import logging
 import time
 import os
 import warnings
+import multiprocessing
+import threading
+try:
+    from Queue import Empty
+except ImportError:  # python 3
+    from queue import Empty
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 # third party
 import numpy
+import theano
 import theano.tensor as T
+from theano.compile.sharedvalue import SharedVariable
 from theano.compat.python2x import OrderedDict
 from theano.compat import six
 # internal references
-from opendeep.utils.constructors import sharedX, function
+from opendeep.utils.constructors import sharedX, function, as_floatX
 from opendeep.data.dataset import Dataset
 from opendeep.models.model import Model
-from opendeep.monitor.monitor import collapse_channels
+from opendeep.monitor.monitor import collapse_channels, COLLAPSE_SEPARATOR
 from opendeep.monitor.out_service import FileService
 from opendeep.utils.decay import get_decay_function
 from opendeep.utils.misc import (raise_to_list, make_time_units_string,
@@ -42,10 +69,18 @@ from opendeep.utils.misc import (raise_to_list, make_time_units_string,
                                  add_kwargs_to_dict, trunc)
 from opendeep.utils.batch import minibatch
 from opendeep.utils.misc import min_normalized_izip
+from opendeep.utils import file_ops
+from opendeep.optimization.best_params import BestParams
 
 log = logging.getLogger(__name__)
 
 TRAIN_COST_KEY = 'train_cost'
+TRAINING_STATE_FILE = 'training_state.pkl'
+TIMING_CHANNEL = 'timing'
+TIMING_KEYS = ['examples_per_sec', 'batches_per_sec',
+               'data_time', 'learn_time', 'monitor_time', 'output_time', 'checkpoint_time', 'epoch_time']
+MAX_PENDING_SNAPSHOTS = 2
+FLAT_UPDATES_MAX_SIZE = 4096
 
 
 class Optimizer(object):
@@ -59,6 +94,8 @@ class Optimizer(object):
                  save_freq=10, stop_threshold=None, stop_patience=50,
                  learning_rate=1e-3, lr_decay=None, lr_decay_factor=None,
                  grad_clip=None, hard_clip=False,
+                 stop_monitor=None, best_params_dir=None, accumulate_steps=1,
+                 flat_updates=False, reset_state_every=None,
                  **kwargs):
         """
         Initialize the Optimizer.
@@ -92,6 +129,28 @@ class Optimizer(object):
             Whether to clip gradients. This will clip the norm of the gradients either with a hard cutoff or rescaling.
         hard_clip : bool
             Whether to use a hard cutoff or rescaling for clipping gradients.
+        stop_monitor : str, optional
+            The name of a validation monitor channel to use for early stopping and keeping the best parameters.
+            Defaults to using the training cost.
+        best_params_dir : str, optional
+            If given, the best parameters for early stopping are kept in memmap files inside this directory
+            instead of in memory (useful for very large models).
+        accumulate_steps : int, optional
+            The number of minibatches to accumulate gradients over before applying a parameter update. This gives
+            an effective batch size of `batch_size * accumulate_steps` while only using the memory of `batch_size`.
+        flat_updates : bool, optional
+            Whether to compute the update rule over all the parameters at once, as a single flattened vector.
+            Each optimizer accumulator (momentum velocity, mean square gradients, etc.) is then one contiguous
+            buffer instead of one shared variable per parameter, so the update compiles to a few large
+            elementwise operations. This helps models with many small parameters - parameters larger than
+            `FLAT_UPDATES_MAX_SIZE` keep their own updates. Note that rules with per-parameter terms (like
+            AdaSecant's block-normalized gradients) will treat all the flattened parameters as one block.
+        reset_state_every : int, optional
+            For stateful models (like recurrent nets doing truncated backpropagation through time), the number of
+            minibatches after which to reset the carried model state (see `Model.reset_state()`). This should be
+            the number of chunks each group of sequences was split into, with the data ordered so consecutive
+            minibatches are consecutive chunks of the same sequences. The state is always reset at the start of
+            each pass over a dataset subset.
         """
         log.info("Initializing optimizer %s", str(type(self)))
 
@@ -102,11 +161,18 @@ class Optimizer(object):
             save_freq = 1000000
         if not stop_patience:
             stop_patience = 1
+        if not accumulate_steps:
+            accumulate_steps = 1
+        assert accumulate_steps >= 1, "accumulate_steps needs to be >= 1, found %s" % str(accumulate_steps)
+        assert reset_state_every is None or reset_state_every >= 1, \
+            "reset_state_every needs to be None or >= 1, found %s" % str(reset_state_every)
 
         # Put all init parameters in self.args so we can log the initial configuration.
         self.args = locals().copy()
         self.args.pop('self')
         kwargs = self.args.pop('kwargs')
+        # subclasses calling super() in python 3 also pass their __class__ cell from locals()
+        kwargs.pop('__class__', None)
         self.args = add_kwargs_to_dict(kwargs, self.args)
         # log the arguments
         log.info("Optimizer config args: %s", str(self.args))
@@ -163,6 +229,8 @@ class Optimizer(object):
         self.learning_rate = sharedX(learning_rate, 'learning_rate')
         # whether to scale individual model parameters' learning rates.
         self.lr_scalers = self.model.get_lr_scalers()
+        # masks keeping pruned parameter entries at zero while training (see opendeep.models.utils.pruning).
+        self.param_masks = self.model.get_param_masks()
         # whether to decay
         if lr_decay:
             self.learning_rate_decay = get_decay_function(lr_decay,
@@ -182,6 +250,11 @@ class Optimizer(object):
         self.early_stop_length = stop_patience
         self.grad_clip = grad_clip
         self.hard_clip = hard_clip
+        self.stop_monitor = stop_monitor
+        self.best_params_dir = best_params_dir
+        self.accumulate_steps = accumulate_steps
+        self.flat_updates = flat_updates
+        self.reset_state_every = reset_state_every
 
     def get_updates(self, gradients):
         """
@@ -205,13 +278,89 @@ class Optimizer(object):
             updates[param] = param - scaled_lr * gradient
         return updates
 
-    def train(self, monitor_channels=None, train_outservice=None, plot=None, additional_cost=None):
+    def _get_flat_updates(self, gradients, name='flat_params'):
+        """
+        Computes the updates from `get_updates()` over one flattened vector of all the (small) parameters, so
+        the optimizer's accumulators are single contiguous buffers. The new flat parameter vector is split back into
+        updates for the individual parameters. Parameters larger than `FLAT_UPDATES_MAX_SIZE` get their updates
+        from `get_updates()` as usual.
+
+        Parameters
+        ----------
+        gradients : dict
+            A dictionary mapping from the model's parameters to their gradients.
+        name : str
+            The name to use for the flattened parameters (accumulator names are built from it).
+
+        Returns
+        -------
+        updates : OrderdDict
+            A dictionary mapping from the old model parameters (and flat accumulators), to their new
+            values after a single iteration of the learning rule.
+        """
+        params = [param for param in gradients.keys()
+                  if param.get_value(borrow=True).size <= FLAT_UPDATES_MAX_SIZE]
+        dtypes = set([param.dtype for param in params])
+        if len(dtypes) > 1:
+            log.warning("Can't flatten parameters with different dtypes %s, using separate updates.", str(dtypes))
+            return self.get_updates(gradients)
+        if len(params) < 2:
+            # nothing to gain from flattening
+            return self.get_updates(gradients)
+
+        # the large parameters keep their own updates
+        updates = OrderedDict()
+        separate = OrderedDict([(param, gradient) for param, gradient in six.iteritems(gradients)
+                                if param not in params])
+        if len(separate) > 0:
+            updates.update(self.get_updates(separate))
+
+        log.debug("Flattening %d parameters for the optimizer updates...", len(params))
+        values = [param.get_value(borrow=True) for param in params]
+        shapes = [value.shape for value in values]
+        sizes = [int(numpy.prod(shape)) for shape in shapes]
+        # a placeholder with the shape of the flat vector - the rule uses it for creating its accumulators
+        # and it is swapped out for the (symbolic) concatenation of the actual parameters afterwards.
+        flat_param = theano.shared(numpy.zeros((sum(sizes),), dtype=dtypes.pop()), name=name)
+        flat_gradient = T.concatenate([gradients[param].flatten() for param in params])
+        flat_value = T.concatenate([param.flatten() for param in params])
+
+        # learning rate scalers become one elementwise vector for the flat parameters.
+        if any(param in self.lr_scalers for param in params):
+            self.lr_scalers[flat_param] = as_floatX(numpy.concatenate(
+                [numpy.ones((size,)) * self.lr_scalers.get(param, 1.) for param, size in zip(params, sizes)]
+            ))
+
+        flat_rule = self.get_updates(OrderedDict([(flat_param, flat_gradient)]))
+        self.lr_scalers.pop(flat_param, None)
+
+        new_flat_value = None
+        for variable, update in six.iteritems(flat_rule):
+            update = theano.clone(update, replace={flat_param: flat_value})
+            if variable is flat_param:
+                new_flat_value = update
+            else:
+                updates[variable] = update
+        assert new_flat_value is not None, "Optimizer didn't return an update for the flattened parameters!"
+
+        # split the new flat vector back into the parameters
+        offset = 0
+        for param, shape, size in zip(params, shapes, sizes):
+            updates[param] = new_flat_value[offset:offset + size].reshape(shape)
+            offset += size
+        return updates
+
+    def train(self, monitor_channels=None, train_outservice=None, plot=None, additional_cost=None,
+              resume_from=None, async_monitors=False, background_compile=False, timing_outservices=None):
         """
         This method performs the training!!!
         It is an online training method that goes over minibatches from the dataset for a number of epochs,
         updating parameters after each minibatch.
 
-        You can disrupt training with a KeyBoardInterrupt and it should exit/save parameters gracefully.
+        You can disrupt training with a KeyBoardInterrupt and it should exit/save parameters gracefully. The
+        training state checkpoint keeps the parameters from the moment of the interruption (so resuming continues
+        exactly where training stopped), and then the best parameters found so far are restored to the model and
+        saved, just like when a training function finishes.
 
         Parameters
         ----------
@@ -226,6 +375,26 @@ class Optimizer(object):
         additional_cost : theano expression or list(theano expression), optional
             Any additional cost expressions to use during training (things like regularization). These will be summed
             with the existing cost.
+        resume_from : str, optional
+            Filename of a training state checkpoint (created by `save_training_state()`, by default
+            'training_state.pkl' in the model's `outdir`) to resume training from. This restores the model
+            parameters, optimizer accumulators, decay schedules, random number generator states, and the
+            epoch/patience counters for the training function that was interrupted.
+        async_monitors : bool, optional
+            Whether to compute the valid and test monitors in a separate worker process while training continues.
+            After each epoch, a snapshot of the parameters is sent to the worker, and its results are fed back to
+            the outservices, plot, and early stopping as they arrive. The worker is forked after compilation, so it
+            has its own copy of the compiled monitor functions (this needs the 'fork' start method, and isn't safe
+            when Theano is using a GPU). At most `MAX_PENDING_SNAPSHOTS` snapshots are in flight - if the
+            worker falls further behind, epochs skip their valid/test monitors until it catches up.
+        background_compile : bool, optional
+            Training functions are compiled when their phase starts (and released when it finishes). If this is
+            True, the next phase's training function is compiled in a background thread while the current phase
+            trains.
+        timing_outservices : dict(str: OutService), optional
+            Where to send the per-epoch timing monitors (see `TIMING_KEYS`) - a dictionary mapping timing monitor
+            names to their own OutService, like each Monitor has its own. Timing monitors are always logged and
+            sent to the plot (under the name 'timing/<key>').
         """
         if not self.model:
             log.error("No self.model for the Optimizer!")
@@ -248,38 +417,8 @@ class Optimizer(object):
         #########################
         # gradients and updates #
         #########################
-        train_updates = []
-        self.gradients = []
-        for i, train_cost in enumerate(train_costs):
-            # Now create the training cost function for the model to use while training - update parameters
-            # gradient!
-            if len(train_costs) > 1 and additional_cost is not None:
-                log.warning("additional_cost will double count with gradients during layer-wise pretraining!")
-                warnings.warn("additional_cost will double count with gradients during layer-wise pretraining!")
-            # TODO: additional_cost will double count with gradients during layer-wise pretraining.
-            # Need to somehow make w.r.t. params appropriate for the individual training costs.
-            gradients, _ = self.model.get_gradient(cost=train_cost, additional_cost=additional_cost)
-            # clip gradients if we want.
-            gradients = clip_gradients(gradients, self.grad_clip, self.hard_clip)
-            # append to list
-            self.gradients.append(gradients)
-
-            # Calculate the optimizer updates each run
-            # This is where the magic happens for a lot of sub-implementations of SGD!
-            # It tells how to update the params each training epoch
-            gradient_updates = self.get_updates(gradients)
-
-            # Combine the updates from the model also if applicable
-            updates = self.model.get_updates()
-            if updates:
-                updates.update(gradient_updates)
-            else:
-                updates = gradient_updates
-            train_updates.append(updates)
-
-        # grab the model parameters to use during training
-        self.params = self.model.get_params()
-        log.info("%s params: %s", str(type(self.model)), str(self.params))
+        # the training graph - gradients and optimizer updates for each training cost
+        train_updates, apply_updates = self._build_train_updates(train_costs, additional_cost)
 
         ############
         # monitors #
@@ -308,6 +447,15 @@ class Optimizer(object):
             self.test_monitors_outservice_dict  = OrderedDict([(name, out) for name, _, out in test_collapsed])
         # finally deal with an outservice provided to monitor training cost
         self.train_outservice = train_outservice
+        # and where the timing monitors go
+        timing_outservices = timing_outservices or {}
+        assert isinstance(timing_outservices, dict), \
+            "timing_outservices needs to be a dictionary of timing monitor name: OutService, found %s" % \
+            str(type(timing_outservices))
+        unknown = [name for name in timing_outservices.keys() if name not in TIMING_KEYS]
+        assert len(unknown) == 0, "Unknown timing monitors %s, expected names from %s" % \
+                                  (str(unknown), str(TIMING_KEYS))
+        self.timing_outservice_dict = timing_outservices
         # remove redundant files made by the fileservice for the train monitor.
         # TODO: THIS FEELS LIKE A HACK. I don't like it.
         if isinstance(self.train_outservice, FileService):
@@ -317,21 +465,13 @@ class Optimizer(object):
         #######################################
         # compile train and monitor functions #
         #######################################
+        # the training functions are compiled lazily when each phase starts (see _compile_train_functions)
         function_input = raise_to_list(self.model.get_inputs()) + raise_to_list(self.model.get_targets())
-        train_functions = []
-        for i, (updates, train_cost) in enumerate(zip(train_updates, train_costs)):
-            # Compile the training function!
-            log.info('Compiling f_learn %d/%d function for model %s...', i + 1, len(train_updates),
-                     str(type(self.model)))
-            t = time.time()
+        n_train_functions = len(train_updates)
 
-            f_learn = function(inputs=function_input,
-                               updates=updates,
-                               outputs=[train_cost] + list(self.train_monitors_dict.values()),
-                               name='f_learn_%d' % i)
-
-            log.info('f_learn %d compilation took %s', i + 1, make_time_units_string(time.time() - t))
-            train_functions.append(f_learn)
+        def compile_train_functions(i):
+            return self._compile_train_functions(i, n_train_functions, function_input,
+                                                 train_costs[i], train_updates[i], apply_updates[i])
 
         # figure out if we want valid and test (monitors)
         self.valid_flag = (self.dataset.valid_inputs is not None) and (len(self.valid_monitors_dict) > 0)
@@ -363,51 +503,284 @@ class Optimizer(object):
 
         log.debug("Compilation done. Took %s", make_time_units_string(time.time() - monitor_t))
 
+        # figure out which cost to use for early stopping and keeping the best parameters
+        if self.stop_monitor is not None and not (self.valid_flag and self.stop_monitor in self.valid_monitors_dict):
+            log.warning("Stop monitor %s isn't a valid monitor channel, using the train cost for early stopping.",
+                        str(self.stop_monitor))
+            self.stop_monitor = None
+        # preallocated storage for the best parameters found during each training function
+        self.best_params = BestParams(self.params, memmap_dir=self.best_params_dir)
+
+        # start the worker process for computing valid/test monitors concurrently with training
+        self.monitor_worker = None
+        if async_monitors and (self.valid_flag or self.test_flag):
+            self._start_monitor_worker()
+
         ##################
         # start training #
         ##################
+        # grab the decay functions once so their schedules persist across epochs (and can be checkpointed).
+        self.decay_params = self.get_decay_params()
+        # restore a previous training state if we are resuming.
+        resume_state = None
+        if resume_from is not None:
+            resume_state = self.load_training_state(resume_from)
+
         # make sure to deal with a list of train_cost functions - for layer-wise pretraining!
-        # this list of training functions was created during __init__()
+        # the training functions are compiled as each phase starts, and released when it finishes.
         start_time = time.time()
-        for func_i, train_function in enumerate(train_functions):
-            log.info("-----------TRAINING %s function %d/%d FOR %d EPOCHS-----------",
-                     str(type(self.model)), func_i + 1, len(train_functions), self.n_epoch)
-
-            self.STOP = False
-            self.epoch_counter = 0
-            # reset any decay params
-            for decay_param in self.get_decay_params():
-                decay_param.reset()
+        # the (phase index, thread, result) of a training function compiling in the background
+        background = None
+        for func_i in range(n_train_functions):
+            self.train_function_index = func_i
+            # skip over the training functions that were already finished before resuming.
+            if resume_state is not None and func_i < resume_state['train_function_index']:
+                log.info("Skipping %s function %d/%d (already trained before resuming)",
+                         str(type(self.model)), func_i + 1, n_train_functions)
+                continue
 
-            self.times = []
-            self.best_cost = numpy.inf
-            self.best_params = None
-            self.patience = 0
+            log.info("-----------TRAINING %s function %d/%d FOR %d EPOCHS-----------",
+                     str(type(self.model)), func_i + 1, n_train_functions, self.n_epoch)
+
+            if resume_state is not None and func_i == resume_state['train_function_index']:
+                # pick back up where we left off - the decay functions were already restored.
+                self.STOP = resume_state['STOP']
+                self.epoch_counter = resume_state['epoch_counter']
+                self.times = resume_state['times']
+                self.best_cost = resume_state['best_cost']
+                self.best_params.set_values(resume_state['best_params'])
+                self.patience = resume_state['patience']
+                log.info("Resuming training from epoch %d", self.epoch_counter)
+            else:
+                self.STOP = False
+                self.epoch_counter = 0
+                # reset any decay params
+                for decay_param in self.decay_params:
+                    decay_param.reset()
+
+                self.times = []
+                self.best_cost = numpy.inf
+                self.best_params.clear()
+                self.patience = 0
+            # timing totals for this phase
+            self.phase_timing = OrderedDict([(key, 0.) for key in TIMING_KEYS])
+            self.phase_examples = 0
 
             t = time.time()
 
+            # compile this phase's training functions (or wait for the background compilation)
+            train_function, apply_function = None, None
+            if not self.STOP:
+                if background is not None and background[0] == func_i:
+                    _, thread, result = background
+                    thread.join()
+                    background = None
+                    if 'error' in result:
+                        raise result['error']
+                    train_function, apply_function = result['functions']
+                else:
+                    train_function, apply_function = compile_train_functions(func_i)
+            # start compiling the next phase while this one trains
+            if background_compile and func_i + 1 < n_train_functions and background is None:
+                background = (func_i + 1,) + _compile_in_background(compile_train_functions, func_i + 1)
+
+            interrupted = False
             while not self.STOP:
                 try:
-                    self.STOP = self._perform_one_epoch(train_function, plot)
+                    self.STOP = self._perform_one_epoch(train_function, plot, apply_function)
                 except KeyboardInterrupt:
                     log.info("STOPPING EARLY FROM KEYBOARDINTERRUPT")
-                    self.STOP = True
+                    interrupted = True
+                    break
+
+            # release this phase's compiled functions before moving on
+            train_function, apply_function = None, None
+
+            # wait for the outstanding valid/test results for this training function
+            if self.monitor_worker is not None:
+                self._collect_monitor_results(plot, block=True)
+
+            if interrupted:
+                # checkpoint the training function as unfinished (with the current parameters),
+                # so train(resume_from=...) continues it instead of moving on.
+                self.save_training_state(stop=False)
+                # then leave the model with the best parameters found so far.
+                if self.best_params.has_values():
+                    log.debug("Restoring best model parameters...")
+                    self.best_params.restore()
+                log.debug("Saving model parameters...")
+                self.model.save_params('trained_epoch_' + str(self.epoch_counter))
+                log.info("Training interrupted during %s function %d/%d at epoch %d - resume with "
+                         "train(resume_from=...).", str(type(self.model)), func_i + 1, n_train_functions,
+                         self.epoch_counter)
+                break
+
+            # if we resumed from a finished training function, the best params were already restored and saved.
+            if resume_state is not None and func_i == resume_state['train_function_index'] and resume_state['STOP']:
+                continue
 
             # save params
-            if self.best_params is not None:
+            if self.best_params.has_values():
                 log.debug("Restoring best model parameters...")
-                set_shared_values(self.params, self.best_params)
+                self.best_params.restore()
             log.debug("Saving model parameters...")
             self.model.save_params('trained_epoch_' + str(self.epoch_counter))
+            # checkpoint that this training function is finished.
+            self.save_training_state()
 
             log.info("------------TRAIN TIME TOOK %s---------", make_time_units_string(time.time() - t))
+            if self.phase_timing['epoch_time'] > 0:
+                log.info("Phase timing: %.1f examples/sec overall. Time in data %s, learn %s, monitors %s, "
+                         "outputs %s, checkpoints %s",
+                         self.phase_examples / self.phase_timing['epoch_time'],
+                         make_time_units_string(self.phase_timing['data_time']),
+                         make_time_units_string(self.phase_timing['learn_time']),
+                         make_time_units_string(self.phase_timing['monitor_time']),
+                         make_time_units_string(self.phase_timing['output_time']),
+                         make_time_units_string(self.phase_timing['checkpoint_time']))
+
+        self.best_params.close()
+        if self.monitor_worker is not None:
+            self._stop_monitor_worker()
 
         log.info("------------TOTAL %s TRAIN TIME TOOK %s---------",
                  str(type(self.model)), make_time_units_string(time.time() - start_time))
 
-    def _perform_one_epoch(self, f_learn, plot=None):
+    def _build_train_updates(self, train_costs, additional_cost=None):
         """
-        Performs a single training iteration with the given learn function.
+        Builds the gradients and parameter updates for each training cost, and keeps track of the shared
+        variables the training functions change (`self.params`, `self.gradients` and
+        `self.training_state_variables`). This goes through gradient accumulation, clipping, parameter masks,
+        flat updates, and the model's own updates, just like training.
+
+        Parameters
+        ----------
+        train_costs : list(theano expression)
+            The training costs (one for each training function).
+        additional_cost : theano expression, optional
+            An additional cost (like regularization) summed with each training cost.
+
+        Returns
+        -------
+        tuple
+            The (train_updates, apply_updates) lists with the updates for each training function, and the updates
+            applying the accumulated gradients (None for each function if gradients aren't accumulated).
+        """
+        # grab the model parameters to use during training
+        self.params = self.model.get_params()
+        log.info("%s params: %s", str(type(self.model)), str(self.params))
+
+        train_updates = []
+        # the updates that apply the accumulated gradients (only when accumulating gradients over minibatches)
+        apply_updates = []
+        self.gradients = []
+        # the shared variables (besides model params) updated by each training function - optimizer accumulators
+        # and random number generator states. These are needed to checkpoint and resume training.
+        self.training_state_variables = []
+        for i, train_cost in enumerate(train_costs):
+            # Now create the training cost function for the model to use while training - update parameters
+            # gradient!
+            if len(train_costs) > 1 and additional_cost is not None:
+                log.warning("additional_cost will double count with gradients during layer-wise pretraining!")
+                warnings.warn("additional_cost will double count with gradients during layer-wise pretraining!")
+            # TODO: additional_cost will double count with gradients during layer-wise pretraining.
+            # Need to somehow make w.r.t. params appropriate for the individual training costs.
+            gradients, _ = self.model.get_gradient(cost=train_cost, additional_cost=additional_cost)
+
+            accumulate_updates = OrderedDict()
+            if self.accumulate_steps > 1:
+                # sum the gradients over minibatches into accumulators, and use their mean for the parameter update.
+                accumulated_count = sharedX(0., 'accumulated_count_%d' % i)
+                accumulate_updates[accumulated_count] = accumulated_count + 1.
+                reset_updates = OrderedDict([(accumulated_count, accumulated_count * 0.)])
+                mean_gradients = OrderedDict()
+                for param, gradient in six.iteritems(gradients):
+                    accumulator = sharedX(param.get_value() * 0., 'accumulated_grad_%s' % param.name)
+                    accumulate_updates[accumulator] = accumulator + gradient
+                    reset_updates[accumulator] = accumulator * 0.
+                    mean_gradients[param] = accumulator / accumulated_count
+                gradients = mean_gradients
+
+            # clip gradients if we want.
+            gradients = clip_gradients(gradients, self.grad_clip, self.hard_clip)
+            # pruned entries get no gradient
+            for param, mask in six.iteritems(self.param_masks):
+                if param in gradients:
+                    gradients[param] = gradients[param] * mask
+            # append to list
+            self.gradients.append(gradients)
+
+            # Calculate the optimizer updates each run
+            # This is where the magic happens for a lot of sub-implementations of SGD!
+            # It tells how to update the params each training epoch
+            if self.flat_updates:
+                gradient_updates = self._get_flat_updates(gradients, name='flat_params_%d' % i)
+            else:
+                gradient_updates = self.get_updates(gradients)
+            # and stay exactly zero through the update (momentum, decay...)
+            for param, mask in six.iteritems(self.param_masks):
+                if param in gradient_updates:
+                    gradient_updates[param] = gradient_updates[param] * mask
+
+            # Combine the updates from the model also if applicable
+            updates = self.model.get_updates()
+            if not updates:
+                updates = OrderedDict()
+            if self.accumulate_steps > 1:
+                # the training function only accumulates, a separate function applies the optimizer updates.
+                updates.update(accumulate_updates)
+                gradient_updates.update(reset_updates)
+                apply_updates.append(gradient_updates)
+            else:
+                updates.update(gradient_updates)
+                apply_updates.append(None)
+            train_updates.append(updates)
+            # the random streams (like for dropout noise) advance through their default updates
+            cost_outputs = [train_cost] + (raise_to_list(additional_cost) if additional_cost is not None else [])
+            state_variables = []
+            for variable in list(updates.keys()) + list(gradient_updates.keys()) + \
+                    _default_update_variables(cost_outputs):
+                if variable not in self.params and variable not in state_variables:
+                    state_variables.append(variable)
+            self.training_state_variables.append(state_variables)
+        return train_updates, apply_updates
+
+    def _compile_train_functions(self, i, n, function_input, train_cost, updates, apply_updates=None):
+        """
+        Compiles the training function (and the function applying accumulated gradients, if applicable)
+        for training phase `i`.
+
+        Returns
+        -------
+        tuple
+            The (f_learn, f_apply) functions. f_apply is None if gradients aren't accumulated.
+        """
+        # Compile the training function!
+        log.info('Compiling f_learn %d/%d function for model %s...', i + 1, n, str(type(self.model)))
+        t = time.time()
+
+        f_learn = function(inputs=function_input,
+                           updates=updates,
+                           outputs=[train_cost] + list(self.train_monitors_dict.values()),
+                           name='f_learn_%d' % i)
+
+        log.info('f_learn %d compilation took %s', i + 1, make_time_units_string(time.time() - t))
+
+        # compile the function that applies the accumulated gradients, if applicable.
+        f_apply = None
+        if apply_updates is not None:
+            t = time.time()
+            f_apply = function(inputs=[],
+                               updates=apply_updates,
+                               name='f_apply_%d' % i)
+            log.info('f_apply %d compilation took %s', i + 1, make_time_units_string(time.time() - t))
+        return f_learn, f_apply
+
+    def _perform_one_epoch(self, f_learn, plot=None, f_apply=None):
+        """
+        Performs a single training iteration with the given learn function. If an apply function is given,
+        the learn function only accumulates gradients, and the apply function updates the parameters every
+        `accumulate_steps` minibatches.
         """
         self.epoch_counter += 1
         t = time.time()
@@ -435,8 +808,37 @@ class Optimizer(object):
                 for target in raise_to_list(self.dataset.train_targets)
                 ]
 
-        for batch in min_normalized_izip(*train_data):
+        # seconds spent in each part of the epoch
+        timing = OrderedDict([(key, 0.) for key in TIMING_KEYS])
+        n_examples = 0
+        n_batches = 0
+
+        accumulated = 0
+        batches = min_normalized_izip(*train_data)
+        # start the epoch without any state carried over (for stateful models)
+        self.model.reset_state()
+        while True:
+            data_t = time.time()
+            try:
+                batch = next(batches)
+            except StopIteration:
+                timing['data_time'] += time.time() - data_t
+                break
+            learn_t = time.time()
+            timing['data_time'] += learn_t - data_t
+            if self.reset_state_every and n_batches > 0 and n_batches % self.reset_state_every == 0:
+                self.model.reset_state()
             _outs = raise_to_list(f_learn(*batch))
+            # apply the accumulated gradients every accumulate_steps minibatches
+            if f_apply is not None:
+                accumulated += 1
+                if accumulated == self.accumulate_steps:
+                    f_apply()
+                    accumulated = 0
+            monitor_t = time.time()
+            timing['learn_time'] += monitor_t - learn_t
+            n_examples += len(batch[0])
+            n_batches += 1
             train_costs.append(_outs[0])
             # handle any user defined monitors
             if len(train_monitors) > 0:
@@ -444,10 +846,20 @@ class Optimizer(object):
                 for name, val in current_monitors:
                     val = numpy.asarray(val)
                     train_monitors[name].append(val)
+            timing['monitor_time'] += time.time() - monitor_t
 
+        # apply any leftover accumulated gradients from the end of the epoch
+        if f_apply is not None and accumulated > 0:
+            learn_t = time.time()
+            f_apply()
+            timing['learn_time'] += time.time() - learn_t
+
+        monitor_t = time.time()
         # get the mean values for the batches
         mean_train = numpy.mean(train_costs, 0)
         current_mean_monitors = {key: numpy.mean(vals, 0) for key, vals in train_monitors.items()}
+        output_t = time.time()
+        timing['monitor_time'] += output_t - monitor_t
         # log the mean values!
         log.info('Train cost: %s', trunc(mean_train))
         if len(current_mean_monitors) > 0:
@@ -462,39 +874,66 @@ class Optimizer(object):
         if plot:
             current_mean_monitors.update({TRAIN_COST_KEY: mean_train})
             plot.update_plots(epoch=self.epoch_counter, monitors=current_mean_monitors)
-
-        # set the noise switches off for valid and test sets! we assume unseen data is noisy anyway :)
-        if len(self.noise_switches) > 0 and (self.valid_flag or self.test_flag):
-            log.debug("Turning off %s noise switches", str(len(self.noise_switches)))
-            [switch.set_value(0.) for switch in self.noise_switches]
-
-        #########
-        # valid #
-        #########
-        self._compute_over_subset("valid", self.dataset.valid_inputs, self.dataset.valid_targets,
-                                  self.valid_monitors_dict, self.valid_monitor_function,
-                                  self.valid_monitors_outservice_dict, plot)
-
-        ########
-        # test #
-        ########
-        self._compute_over_subset("test", self.dataset.test_inputs, self.dataset.test_targets,
-                                  self.test_monitors_dict, self.test_monitor_function,
-                                  self.test_monitors_outservice_dict, plot)
+        timing['output_time'] += time.time() - output_t
+
+        if self.monitor_worker is not None:
+            ####################
+            # async valid/test #
+            ####################
+            # send a snapshot of the parameters to the worker, and take whatever results are ready.
+            monitor_t = time.time()
+            self._collect_monitor_results(plot, block=False)
+            # bound the number of parameter copies waiting on a slow worker
+            if self.pending_epochs >= MAX_PENDING_SNAPSHOTS:
+                log.warning("Asynchronous monitors are %d epochs behind, skipping valid/test monitors for epoch %d",
+                            self.pending_epochs, self.epoch_counter)
+            else:
+                snapshot = get_shared_values(self.params)
+                self.monitor_jobs.put((self.epoch_counter, snapshot))
+                if self.stop_monitor is not None:
+                    # keep the snapshot around in case it turns out to be the best one.
+                    self.pending_snapshots[self.epoch_counter] = snapshot
+                self.pending_epochs += 1
+            timing['monitor_time'] += time.time() - monitor_t
+        else:
+            # set the noise switches off for valid and test sets! we assume unseen data is noisy anyway :)
+            if len(self.noise_switches) > 0 and (self.valid_flag or self.test_flag):
+                log.debug("Turning off %s noise switches", str(len(self.noise_switches)))
+                [switch.set_value(0.) for switch in self.noise_switches]
+
+            #########
+            # valid #
+            #########
+            monitor_t = time.time()
+            valid_monitors = self._compute_monitors(self.dataset.valid_inputs, self.dataset.valid_targets,
+                                                    self.valid_monitors_dict, self.valid_monitor_function)
+            output_t = time.time()
+            timing['monitor_time'] += output_t - monitor_t
+            self._report_monitors("valid", valid_monitors, self.valid_monitors_outservice_dict,
+                                  plot, self.epoch_counter)
+            timing['output_time'] += time.time() - output_t
+
+            ########
+            # test #
+            ########
+            monitor_t = time.time()
+            test_monitors = self._compute_monitors(self.dataset.test_inputs, self.dataset.test_targets,
+                                                   self.test_monitors_dict, self.test_monitor_function)
+            output_t = time.time()
+            timing['monitor_time'] += output_t - monitor_t
+            self._report_monitors("test", test_monitors, self.test_monitors_outservice_dict,
+                                  plot, self.epoch_counter)
+            timing['output_time'] += time.time() - output_t
+
+            if self.stop_monitor is not None:
+                self._check_improvement(numpy.sum(valid_monitors[self.stop_monitor]))
 
         ###########
         # cleanup #
         ###########
-        # check for early stopping on train costs
-        cost = numpy.sum(train_costs)
-        # if the cost improved, reset the patience and record the best cost.
-        if cost < self.best_cost * self.early_stop_threshold:
-            self.patience = 0
-            self.best_cost = cost
-            # save the parameters that made it the best
-            self.best_params = get_shared_values(self.params)
-        elif not numpy.isnan(cost):
-            self.patience += 1
+        # check for early stopping on train costs (validation monitors are checked when they are computed)
+        if self.stop_monitor is None:
+            self._check_improvement(numpy.sum(train_costs))
 
         # check for stopping either from n_epochs or from threshold/patience
         stop = False
@@ -505,34 +944,151 @@ class Optimizer(object):
             log.info("Stopping early (reached stop threshold)...")
             stop = True
 
-        timing = time.time() - t
-        self.times.append(timing)
+        epoch_time = time.time() - t
+        self.times.append(epoch_time)
 
-        log.info('time: ' + make_time_units_string(timing))
+        log.info('time: ' + make_time_units_string(epoch_time))
 
         log.debug('remaining time: ' +
                  make_time_units_string((self.n_epoch - self.epoch_counter) * numpy.mean(self.times)))
 
-        if (self.epoch_counter % self.save_frequency) == 0:
-            #save params
-            self.model.save_params('trained_epoch_' + str(self.epoch_counter))
-
         # ANNEAL!
         if not stop:
             # perform the appropriate decay on the decay functions/parameters for this optimizer and model
-            for decay_param in self.get_decay_params():
+            for decay_param in self.decay_params:
                 decay_param.decay()
 
         # reset the switches
         if len(self.noise_switches) > 0:
             [switch.set_value(val) for switch, val in zip(self.noise_switches, switch_vals)]
 
+        if (self.epoch_counter % self.save_frequency) == 0:
+            checkpoint_t = time.time()
+            #save params
+            self.model.save_params('trained_epoch_' + str(self.epoch_counter))
+            # checkpoint the whole training state (after annealing so the next epoch resumes correctly)
+            self.save_training_state(stop=stop)
+            timing['checkpoint_time'] += time.time() - checkpoint_t
+
+        # throughput over the whole epoch (including checkpointing)
+        timing['epoch_time'] = time.time() - t
+        timing['examples_per_sec'] = n_examples / max(timing['epoch_time'], 1e-12)
+        timing['batches_per_sec'] = n_batches / max(timing['epoch_time'], 1e-12)
+        self._report_timing(timing, plot)
+        self.phase_examples += n_examples
+        for key in TIMING_KEYS:
+            self.phase_timing[key] += timing[key]
+
         # return whether or not to stop this epoch
         return stop
 
-    def _compute_over_subset(self, subset, inputs, targets,
-                             monitors_dict, monitor_function, monitors_outservice_dict,
-                             plot):
+    def _report_timing(self, timing, plot=None):
+        """
+        Logs the timing monitors for an epoch, and sends them to their outservices and the plot.
+
+        Parameters
+        ----------
+        timing : dict
+            The timing monitor values (see `TIMING_KEYS`).
+        plot : Plot, optional
+            The Plot object to send the values to.
+        """
+        log.info('Throughput: %.1f examples/sec, %.2f batches/sec. Time in data %s, learn %s, monitors %s, '
+                 'outputs %s, checkpoint %s',
+                 timing['examples_per_sec'], timing['batches_per_sec'],
+                 make_time_units_string(timing['data_time']), make_time_units_string(timing['learn_time']),
+                 make_time_units_string(timing['monitor_time']), make_time_units_string(timing['output_time']),
+                 make_time_units_string(timing['checkpoint_time']))
+        for name, service in self.timing_outservice_dict.items():
+            if service:
+                service.write(timing[name], "train")
+        if plot:
+            plot.update_plots(epoch=self.epoch_counter,
+                              monitors={COLLAPSE_SEPARATOR.join([TIMING_CHANNEL, key]): value
+                                        for key, value in timing.items()})
+
+    def _check_improvement(self, cost, snapshot=None):
+        """
+        Updates the best cost, best parameters, and patience for early stopping.
+
+        Parameters
+        ----------
+        cost : float
+            The cost for this epoch.
+        snapshot : list, optional
+            The parameter values that produced `cost`, if they aren't the current parameter values (like
+            when the cost was computed asynchronously).
+        """
+        # if the cost improved, reset the patience and record the best cost.
+        if cost < self.best_cost * self.early_stop_threshold:
+            self.patience = 0
+            self.best_cost = cost
+            # save the parameters that made it the best (copied in place into the preallocated buffers)
+            if snapshot is not None:
+                self.best_params.set_values(snapshot)
+            else:
+                self.best_params.record()
+        elif not numpy.isnan(cost):
+            self.patience += 1
+
+    def _start_monitor_worker(self):
+        """
+        Forks the worker process that computes the valid and test monitors on parameter snapshots.
+        """
+        log.info("Starting worker process for asynchronous valid/test monitors...")
+        self.monitor_jobs = multiprocessing.Queue()
+        self.monitor_results = multiprocessing.Queue()
+        self.pending_snapshots = {}
+        self.pending_epochs = 0
+        self.monitor_worker = multiprocessing.Process(target=_monitor_worker,
+                                                      args=(self, self.monitor_jobs, self.monitor_results))
+        self.monitor_worker.daemon = True
+        self.monitor_worker.start()
+
+    def _stop_monitor_worker(self):
+        """
+        Tells the monitor worker process to finish, and waits for it.
+        """
+        self.monitor_jobs.put(None)
+        self.monitor_worker.join()
+        self.monitor_worker = None
+        self.pending_snapshots = {}
+
+    def _collect_monitor_results(self, plot=None, block=False):
+        """
+        Reports the valid/test monitor results that the worker process has finished, and uses them for early
+        stopping if there is a `stop_monitor`.
+
+        Parameters
+        ----------
+        plot : Plot, optional
+            The Plot object to send the monitor values to.
+        block : bool
+            Whether to wait for all outstanding results instead of only taking the ones that are ready.
+        """
+        while self.pending_epochs > 0:
+            try:
+                epoch, results = self.monitor_results.get(block=block)
+            except Empty:
+                break
+            self.pending_epochs -= 1
+            snapshot = self.pending_snapshots.pop(epoch, None)
+            if results is None:
+                log.error("Asynchronous monitors failed for epoch %d!", epoch)
+                continue
+            self._report_monitors("valid", results.get("valid", {}), self.valid_monitors_outservice_dict,
+                                  plot, epoch)
+            self._report_monitors("test", results.get("test", {}), self.test_monitors_outservice_dict,
+                                  plot, epoch)
+            if self.stop_monitor is not None and self.stop_monitor in results.get("valid", {}):
+                self._check_improvement(numpy.sum(results["valid"][self.stop_monitor]), snapshot=snapshot)
+
+    def _compute_monitors(self, inputs, targets, monitors_dict, monitor_function):
+        """
+        Runs the monitor function over the minibatches of a dataset subset, and returns the dictionary of
+        mean monitor values (empty if there was nothing to compute).
+        """
+        current_mean_monitors = {}
         inputs = raise_to_list(inputs)
         targets = raise_to_list(targets)
         if inputs is not None and len(monitors_dict) > 0:
@@ -541,7 +1097,11 @@ class Optimizer(object):
             if targets is not None and not self.unsupervised:
                 data += [minibatch(target, self.batch_size, self.min_batch_size) for target in targets]
 
-            for batch in min_normalized_izip(*data):
+            # start the subset without any state carried over (for stateful models)
+            self.model.reset_state()
+            for i, batch in enumerate(min_normalized_izip(*data)):
+                if self.reset_state_every and i > 0 and i % self.reset_state_every == 0:
+                    self.model.reset_state()
                 _outs = raise_to_list(monitor_function(*batch))
                 current_monitors = zip(monitors_dict.keys(), _outs)
                 for name, val in current_monitors:
@@ -550,15 +1110,142 @@ class Optimizer(object):
 
             # get the mean values for the batches
             current_mean_monitors = {key: numpy.mean(vals, 0) for key, vals in monitors.items()}
+        return current_mean_monitors
+
+    def _report_monitors(self, subset, current_mean_monitors, monitors_outservice_dict, plot, epoch):
+        """
+        Logs the mean monitor values for a dataset subset, and sends them to their outservices and the plot.
+        """
+        if len(current_mean_monitors) > 0:
             # log the mean values!
-            log.info('%s monitors: %s', subset, str(current_mean_monitors))
+            log.info('%s monitors (epoch %d): %s', subset, epoch, str(current_mean_monitors))
             # send the values to their outservices
             for name, service in monitors_outservice_dict.items():
                 if name in current_mean_monitors and service:
-                    service.write(current_mean_monitors[name], "test")
+                    service.write(current_mean_monitors[name], subset)
             # if there is a plot, also send them over!
             if plot:
-                plot.update_plots(epoch=self.epoch_counter, monitors=current_mean_monitors)
+                plot.update_plots(epoch=epoch, monitors=current_mean_monitors)
+
+    def get_training_state(self, stop=None):
+        """
+        Returns a dictionary describing the complete training state - everything needed to resume training
+        exactly where it left off: the model parameters, the optimizer's shared variables (accumulators like
+        momentum velocity or the AdaDelta/RMSProp/AdaSecant running averages, and the random stream states
+        advanced by the training function's updates and default updates), decay function schedules, numpy's
+        random state, and the epoch/patience counters.
+
+        Parameters
+        ----------
+        stop : bool, optional
+            Whether the current training function has finished. Defaults to `self.STOP`.
+
+        Returns
+        -------
+        dict
+            The training state.
+        """
+        func_i = self.train_function_index
+        return {
+            'train_function_index': func_i,
+            'STOP': self.STOP if stop is None else stop,
+            'epoch_counter': self.epoch_counter,
+            'times': list(self.times),
+            'best_cost': self.best_cost,
+            'best_params': self.best_params.get_values(),
+            'patience': self.patience,
+            'params': get_shared_values(self.params),
+            'training_state_values': [get_shared_values(variables)
+                                      for variables in self.training_state_variables],
+            'decay_states': [decay_param.get_state() for decay_param in self.decay_params],
+            'numpy_random_state': numpy.random.get_state()
+        }
+
+    def set_training_state(self, state):
+        """
+        Restores the model parameters, optimizer shared variables, decay schedules and random states from
+        a training state created by `get_training_state()`.
+
+        Parameters
+        ----------
+        state : dict
+            The training state to restore.
+        """
+        set_shared_values(self.params, state['params'])
+        assert len(state['training_state_values']) == len(self.training_state_variables), \
+            "Training state has %d training functions, but the optimizer compiled %d!" % \
+            (len(state['training_state_values']), len(self.training_state_variables))
+        for variables, values in zip(self.training_state_variables, state['training_state_values']):
+            set_shared_values(variables, values)
+        assert len(state['decay_states']) == len(self.decay_params), \
+            "Training state has %d decay functions, but the optimizer has %d!" % \
+            (len(state['decay_states']), len(self.decay_params))
+        for decay_param, decay_state in zip(self.decay_params, state['decay_states']):
+            decay_param.set_state(decay_state)
+        numpy.random.set_state(state['numpy_random_state'])
+
+    def save_training_state(self, filename=TRAINING_STATE_FILE, stop=None):
+        """
+        Pickles the current training state (see `get_training_state()`) to `filename` in the model's `outdir`.
+
+        Parameters
+        ----------
+        filename : str, optional
+            The filename to save to inside the model's `outdir`.
+        stop : bool, optional
+            Whether the current training function has finished. Defaults to `self.STOP`.
+
+        Returns
+        -------
+        bool
+            Whether or not successfully saved the file.
+        """
+        # make sure outdir was not set to false (no saving or outputs)
+        if getattr(self.model, 'outdir', None):
+            state_file = os.path.realpath(os.path.join(self.model.outdir, filename))
+            log.debug("Saving training state to %s", state_file)
+            # write to a temporary file first so being killed mid-write doesn't clobber the last good checkpoint.
+            tmp_file = state_file + '.tmp'
+            with open(tmp_file, 'wb') as f:
+                try:
+                    pickle.dump(self.get_training_state(stop=stop), f, protocol=pickle.HIGHEST_PROTOCOL)
+                except Exception as e:
+                    log.exception("Some issue saving training state to %s! Exception: %s", state_file, str(e))
+                    return False
+            os.rename(tmp_file, state_file)
+            return True
+        else:
+            return False
+
+    def load_training_state(self, filename):
+        """
+        Loads a training state pickle file created by `save_training_state()` and restores it.
+
+        Parameters
+        ----------
+        filename : str
+            Path to the training state file.
+
+        Returns
+        -------
+        dict
+            The loaded training state (for the epoch/patience counters).
+
+        Raises
+        ------
+        AssertionError
+            If the file couldn't be found or isn't a pickle file.
+        """
+        filename = os.path.realpath(filename)
+        ftype = file_ops.get_file_type(filename)
+        if ftype != file_ops.PKL:
+            log.error("Training state file %s couldn't be found or isn't a pickle file!", filename)
+            raise AssertionError("Training state file %s couldn't be found or isn't a pickle file!" % filename)
+        log.info("Loading training state from %s", filename)
+        with open(filename, 'rb') as f:
+            state = pickle.load(f)
+        self.set_training_state(state)
+        return state
 
     def get_decay_params(self):
         """
@@ -576,6 +1263,71 @@ class Optimizer(object):
         return decay_params
 
 
+def _default_update_variables(outputs):
+    """
+    Finds the shared variables with default updates (like the states of random streams) used to compute the outputs.
+    """
+    return [variable for variable in theano.gof.graph.inputs(outputs)
+            if isinstance(variable, SharedVariable) and getattr(variable, 'default_update', None) is not None]
+
+
+def _compile_in_background(compile_fn, i):
+    """
+    Runs `compile_fn(i)` in a daemon thread.
+
+    Returns
+    -------
+    tuple
+        The (thread, result) where result is a dictionary that will hold 'functions' (or 'error' if
+        compilation raised an exception) once the thread finishes.
+    """
+    result = {}
+
+    def compile_target():
+        try:
+            result['functions'] = compile_fn(i)
+        except Exception as e:
+            log.exception("Exception compiling training function %d in the background: %s", i + 1, str(e))
+            result['error'] = e
+
+    thread = threading.Thread(target=compile_target, name='compile_f_learn_%d' % i)
+    thread.daemon = True
+    thread.start()
+    return thread, result
+
+
+def _monitor_worker(optimizer, jobs, results):
+    """
+    The loop run by the forked worker process for asynchronous valid/test monitors. It takes
+    (epoch, parameter values) jobs, sets its copy of the parameters, and puts (epoch, {subset: mean monitors})
+    on the results queue. A None job ends the loop.
+    """
+    # unseen data is assumed noisy anyway - keep the noise switches off in the worker.
+    [switch.set_value(0.) for switch in optimizer.noise_switches]
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        epoch, param_values = job
+        try:
+            set_shared_values(optimizer.params, param_values)
+            subset_monitors = {}
+            if optimizer.valid_flag:
+                subset_monitors["valid"] = optimizer._compute_monitors(
+                    optimizer.dataset.valid_inputs, optimizer.dataset.valid_targets,
+                    optimizer.valid_monitors_dict, optimizer.valid_monitor_function
+                )
+            if optimizer.test_flag:
+                subset_monitors["test"] = optimizer._compute_monitors(
+                    optimizer.dataset.test_inputs, optimizer.dataset.test_targets,
+                    optimizer.test_monitors_dict, optimizer.test_monitor_function
+                )
+        except Exception as e:
+            log.exception("Exception computing asynchronous monitors for epoch %d: %s", epoch, str(e))
+            subset_monitors = None
+        results.put((epoch, subset_monitors))
+
+
 def clip_gradients(gradients, grad_clip=5., hard_clip=False):
     """
     This returns the gradient parameters clipped according to the grad_clip value given in initialization.
@@ -23,7 +23,9 @@ class SGD(Optimizer):
                  save_freq=None, stop_threshold=None, stop_patience=None,
                  learning_rate=.1, lr_decay="exponential", lr_decay_factor=.995,
                  momentum=0.5, momentum_decay="linear", momentum_factor=0, nesterov_momentum=True,
-                 grad_clip=None, hard_clip=False):
+                 grad_clip=None, hard_clip=False,
+                 stop_monitor=None, best_params_dir=None, accumulate_steps=1,
+                 flat_updates=False, reset_state_every=None):
         """
         Initialize SGD.
 
@@ -67,6 +69,20 @@ class SGD(Optimizer):
             Whether to clip gradients. This will clip with a maximum of grad_clip or the parameter norm.
         hard_clip : bool
             Whether to use a hard cutoff or rescaling for clipping gradients.
+        stop_monitor : str, optional
+            The name of a validation monitor channel to use for early stopping and keeping the best parameters.
+            Defaults to using the training cost.
+        best_params_dir : str, optional
+            If given, the best parameters for early stopping are kept in memmap files inside this directory
+            instead of in memory (useful for very large models).
+        accumulate_steps : int, optional
+            The number of minibatches to accumulate gradients over before applying a parameter update. This gives
+            an effective batch size of `batch_size * accumulate_steps` while only using the memory of `batch_size`.
+        flat_updates : bool, optional
+            Whether to compute the update rule over all the parameters at once, as a single flattened vector
+            (one contiguous buffer per accumulator).
+        reset_state_every : int, optional
+            For stateful (truncated BPTT) models, reset the carried model state every this many minibatches.
         """
         # superclass init
         initial_parameters = locals().copy()
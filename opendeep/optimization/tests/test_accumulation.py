@@ -0,0 +1,45 @@
+import unittest
+import numpy
+import theano
+from opendeep.data.dataset_memory import NumpyDataset
+from opendeep.models.single_layer.basic import Dense
+from opendeep.optimization.stochastic_gradient_descent import SGD
+from opendeep.utils.misc import get_shared_values
+
+
+class TestAccumulation(unittest.TestCase):
+    def setUp(self):
+        self.rng = numpy.random.RandomState(1)
+        self.initial_params = None
+
+    def _train(self, dataset, batch_size, accumulate_steps):
+        model = Dense(input_size=8, output_size=4, activation='tanh', outdir=None)
+        if self.initial_params is None:
+            self.initial_params = get_shared_values(model.get_params())
+        for param, value in zip(model.get_params(), self.initial_params):
+            param.set_value(value)
+        optimizer = SGD(dataset=dataset, model=model, epochs=2, batch_size=batch_size, learning_rate=.1,
+                        momentum=.9, accumulate_steps=accumulate_steps)
+        optimizer.train()
+        return get_shared_values(model.get_params())
+
+    def _check(self, n_examples):
+        dataset = NumpyDataset(train_inputs=self.rng.randn(n_examples, 8).astype(theano.config.floatX),
+                               train_targets=self.rng.randn(n_examples, 4).astype(theano.config.floatX))
+        # 3 accumulated minibatches of 10 make the same updates as minibatches of 30
+        accumulated = self._train(dataset, batch_size=10, accumulate_steps=3)
+        large = self._train(dataset, batch_size=30, accumulate_steps=1)
+        for initial, a, b in zip(self.initial_params, accumulated, large):
+            assert numpy.any(a != initial)
+            numpy.testing.assert_allclose(a, b, rtol=1e-5, atol=1e-7)
+
+    def testFullGroups(self):
+        self._check(n_examples=60)
+
+    def testPartialGroup(self):
+        # the last group only has 2 minibatches (like the last minibatch of 20), so its mean is over 2
+        self._check(n_examples=50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import numpy
+import theano
+from opendeep.data.dataset_memory import NumpyDataset
+from opendeep.models.single_layer.basic import Dense
+from opendeep.models.utils.pruning import prune
+from opendeep.optimization.batch_size_tuner import tune_batch_size
+from opendeep.optimization.stochastic_gradient_descent import SGD
+from opendeep.utils.misc import get_shared_values
+
+
+class TestBatchSizeTuner(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(1)
+        self.dataset = NumpyDataset(train_inputs=rng.randn(200, 20).astype(theano.config.floatX),
+                                    train_targets=rng.randn(200, 10).astype(theano.config.floatX))
+
+    def _optimizer(self, **kwargs):
+        model = Dense(input_size=20, output_size=10, activation='tanh', noise='dropout', outdir=None)
+        prune(model, .5)
+        return SGD(dataset=self.dataset, model=model, epochs=1, batch_size=20, learning_rate=.1, momentum=.9,
+                   **kwargs)
+
+    def _check_unchanged(self, isolate, **kwargs):
+        optimizer = self._optimizer(**kwargs)
+        params = get_shared_values(optimizer.model.get_params())
+        switch = optimizer.model.switch
+        switch.set_value(0.)
+        results = tune_batch_size(optimizer, batch_sizes=[40, 10, 20], n_batches=3, isolate=isolate)
+        self.assertEqual([result['batch_size'] for result in results], [10, 20, 40])
+        for result in results:
+            self.assertIsNone(result['error'])
+            assert result['examples_per_sec'] > 0
+        # tuning leaves the model (and its noise switch) alone
+        for before, after in zip(params, get_shared_values(optimizer.model.get_params())):
+            numpy.testing.assert_array_equal(before, after)
+        self.assertEqual(switch.get_value(), 0.)
+        # and training still works afterwards, keeping the pruned weights at zero
+        W = optimizer.model.get_params()[0]
+        pruned = W.get_value() == 0
+        optimizer.train()
+        assert numpy.any(W.get_value() != params[0])
+        numpy.testing.assert_array_equal(W.get_value()[pruned], 0)
+
+    def testIsolated(self):
+        self._check_unchanged(isolate=True, accumulate_steps=2, flat_updates=True)
+
+    def testInProcess(self):
+        self._check_unchanged(isolate=False, accumulate_steps=2, flat_updates=True)
+
+    def testApply(self):
+        optimizer = self._optimizer()
+        results = tune_batch_size(optimizer, batch_sizes=[10, 20], n_batches=2, apply=True, lr_policy='linear')
+        best = max(results, key=lambda result: result['examples_per_sec'])['batch_size']
+        self.assertEqual(optimizer.batch_size, best)
+        numpy.testing.assert_allclose(optimizer.learning_rate.get_value(), .1 * best / 20.)
+
+    def testMemoryPerTrial(self):
+        rng = numpy.random.RandomState(2)
+        dataset = NumpyDataset(train_inputs=rng.randn(2000, 1000).astype(theano.config.floatX),
+                               train_targets=rng.randn(2000, 1000).astype(theano.config.floatX))
+        model = Dense(input_size=1000, output_size=1000, activation='tanh', outdir=None)
+        optimizer = SGD(dataset=dataset, model=model, epochs=1, batch_size=2000)
+        # raise the high water mark of this process first
+        tune_batch_size(optimizer, batch_sizes=[2000], n_batches=1, warmup_batches=0, isolate=False)
+        # forked trials still measure the memory each batch size needs
+        small, large = tune_batch_size(optimizer, batch_sizes=[10, 2000], n_batches=1, warmup_batches=0,
+                                       isolate=True)
+        self.assertIsNone(large['error'])
+        # at least one (2000, 1000) array of activations
+        itemsize = numpy.dtype(theano.config.floatX).itemsize
+        assert large['peak_memory_mb'] > 2000 * 1000 * itemsize / 1024. ** 2, large['peak_memory_mb']
+        assert large['peak_memory_mb'] > small['peak_memory_mb']
+
+if __name__ == '__main__':
+    unittest.main()
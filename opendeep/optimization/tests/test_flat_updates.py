@@ -0,0 +1,59 @@
+import unittest
+import numpy
+import theano
+from opendeep.data.dataset_memory import NumpyDataset
+from opendeep.models.container import Prototype
+from opendeep.models.single_layer.basic import Dense
+from opendeep.optimization.adadelta import AdaDelta
+from opendeep.optimization.optimizer import FLAT_UPDATES_MAX_SIZE
+from opendeep.optimization.rmsprop import RMSProp
+from opendeep.optimization.stochastic_gradient_descent import SGD
+from opendeep.utils.misc import get_shared_values
+
+
+class TestFlatUpdates(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(1)
+        self.dataset = NumpyDataset(train_inputs=rng.randn(40, 70).astype(theano.config.floatX),
+                                    train_targets=rng.randn(40, 4).astype(theano.config.floatX))
+        self.initial_params = None
+
+    def _model(self):
+        # one parameter too large to flatten, and three small ones
+        model = Prototype(outdir=None)
+        model.add(Dense(input_size=70, output_size=60, activation='tanh', outdir=None))
+        model.add(Dense(inputs_hook=(60, model.get_outputs()), input_size=60, output_size=4,
+                        activation='linear', outdir=None))
+        if self.initial_params is None:
+            self.initial_params = get_shared_values(model.get_params())
+        for param, value in zip(model.get_params(), self.initial_params):
+            param.set_value(value)
+        return model
+
+    def _train(self, optimizer_class, flat_updates, **kwargs):
+        model = self._model()
+        optimizer = optimizer_class(dataset=self.dataset, model=model, epochs=2, batch_size=20,
+                                    flat_updates=flat_updates, **kwargs)
+        optimizer.train()
+        return get_shared_values(model.get_params())
+
+    def _check(self, optimizer_class, **kwargs):
+        assert self._model().get_params()[0].get_value().size > FLAT_UPDATES_MAX_SIZE
+        separate = self._train(optimizer_class, False, **kwargs)
+        flat = self._train(optimizer_class, True, **kwargs)
+        for initial, a, b in zip(self.initial_params, separate, flat):
+            assert numpy.any(a != initial)
+            numpy.testing.assert_allclose(a, b, rtol=1e-5, atol=1e-7)
+
+    def testSGD(self):
+        self._check(SGD, learning_rate=.1, momentum=.9, nesterov_momentum=True)
+
+    def testRMSProp(self):
+        self._check(RMSProp, learning_rate=1e-3)
+
+    def testAdaDelta(self):
+        self._check(AdaDelta, learning_rate=1.)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+import numpy
+import theano
+from opendeep.data.dataset_memory import NumpyDataset
+from opendeep.models.single_layer.basic import Dense
+from opendeep.monitor.out_service import OutService
+from opendeep.optimization.stochastic_gradient_descent import SGD
+
+
+class ListService(OutService):
+    # keeps the written values in memory
+    def __init__(self):
+        self.values = []
+
+    def write(self, value, subset):
+        self.values.append((value, subset))
+
+
+class TestTimingOutservices(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(1)
+        dataset = NumpyDataset(train_inputs=rng.randn(40, 8).astype(theano.config.floatX),
+                               train_targets=rng.randn(40, 4).astype(theano.config.floatX))
+        model = Dense(input_size=8, output_size=4, outdir=None)
+        self.optimizer = SGD(dataset=dataset, model=model, epochs=2, batch_size=10)
+
+    def testSeparateServices(self):
+        services = {'examples_per_sec': ListService(), 'batches_per_sec': ListService(), 'epoch_time': ListService()}
+        self.optimizer.train(timing_outservices=services)
+        # every timing monitor writes one value per epoch to its own service
+        for name, service in services.items():
+            self.assertEqual(len(service.values), 2, name)
+            assert all(subset == 'train' and value > 0 for value, subset in service.values)
+        # 40 examples in 4 batches each epoch
+        for (examples, _), (batches, _) in zip(services['examples_per_sec'].values,
+                                               services['batches_per_sec'].values):
+            numpy.testing.assert_allclose(examples / batches, 10.)
+
+    def testInvalid(self):
+        # one service for all the timing monitors would interleave their values
+        self.assertRaises(AssertionError, self.optimizer.train, timing_outservices=ListService())
+        self.assertRaises(AssertionError, self.optimizer.train, timing_outservices={'unknown': ListService()})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+import shutil
+import tempfile
+import unittest
+import numpy
+import theano
+import theano.sandbox.rng_mrg as RNG_MRG
+from opendeep.data.dataset_memory import NumpyDataset
+from opendeep.models.single_layer.basic import Dense
+from opendeep.optimization.optimizer import TRAINING_STATE_FILE
+from opendeep.optimization.stochastic_gradient_descent import SGD
+from opendeep.utils.misc import get_shared_values
+
+
+def _interrupt_at(optimizer, epoch, partial_update=None):
+    # raise a KeyboardInterrupt instead of finishing the epoch after `epoch`
+    perform_one_epoch = optimizer._perform_one_epoch
+
+    def interrupted(*args, **kwargs):
+        if optimizer.epoch_counter >= epoch:
+            # the interrupted epoch can get partway through updating the parameters
+            if partial_update is not None:
+                for param in optimizer.params:
+                    param.set_value(param.get_value() + partial_update)
+            raise KeyboardInterrupt()
+        return perform_one_epoch(*args, **kwargs)
+    optimizer._perform_one_epoch = interrupted
+
+
+class TestTrainingState(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(1)
+        self.dataset = NumpyDataset(train_inputs=rng.randn(60, 8).astype(theano.config.floatX),
+                                    train_targets=rng.randn(60, 4).astype(theano.config.floatX))
+        self.initial_params = None
+        self.outdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.outdir)
+
+    def _model(self):
+        # the same initial parameters and random streams every time
+        model = Dense(input_size=8, output_size=4, activation='tanh', noise='dropout',
+                      mrg=RNG_MRG.MRG_RandomStreams(1), outdir=self.outdir)
+        if self.initial_params is None:
+            self.initial_params = get_shared_values(model.get_params())
+        for param, value in zip(model.get_params(), self.initial_params):
+            param.set_value(value)
+        return model
+
+    def _optimizer(self, model):
+        return SGD(dataset=self.dataset, model=model, epochs=5, batch_size=10, learning_rate=.1,
+                   lr_decay='exponential', lr_decay_factor=.9, momentum=.9)
+
+    def _final_state(self, optimizer):
+        return (optimizer.epoch_counter,
+                [decay_param.get_state() for decay_param in optimizer.decay_params],
+                [get_shared_values(variables) for variables in optimizer.training_state_variables],
+                get_shared_values(optimizer.params))
+
+    def _assert_same(self, a, b):
+        if isinstance(a, dict):
+            self.assertEqual(sorted(a.keys()), sorted(b.keys()))
+            for key in a:
+                self._assert_same(a[key], b[key])
+        elif isinstance(a, (list, tuple)):
+            self.assertEqual(len(a), len(b))
+            for x, y in zip(a, b):
+                self._assert_same(x, y)
+        else:
+            numpy.testing.assert_array_equal(a, b)
+
+    def testInterruptRestoresBest(self):
+        model = self._model()
+        optimizer = self._optimizer(model)
+        _interrupt_at(optimizer, 3, partial_update=1.)
+        optimizer.train()
+        with open(os.path.join(self.outdir, TRAINING_STATE_FILE), 'rb') as f:
+            state = pickle.load(f)
+        self.assertEqual(state['epoch_counter'], 3)
+        self.assertFalse(state['STOP'])
+        # the checkpoint keeps the parameters from the interruption, but the model is left with the best ones
+        self._assert_same(get_shared_values(model.get_params()), state['best_params'])
+        assert not numpy.allclose(state['params'][0], state['best_params'][0])
+        resumed = self._optimizer(model)
+        resumed.train(resume_from=os.path.join(self.outdir, TRAINING_STATE_FILE))
+        self.assertEqual(resumed.epoch_counter, 5)
+
+    def testResume(self):
+        numpy.random.seed(2)
+        uninterrupted = self._optimizer(self._model())
+        uninterrupted.train()
+        expected = self._final_state(uninterrupted)
+
+        numpy.random.seed(2)
+        model = self._model()
+        optimizer = self._optimizer(model)
+        _interrupt_at(optimizer, 2)
+        optimizer.train()
+        # training picks back up from the checkpoint with a fresh optimizer
+        resumed = self._optimizer(model)
+        resumed.train(resume_from=os.path.join(self.outdir, TRAINING_STATE_FILE))
+        self.assertEqual(resumed.epoch_counter, 5)
+        self._assert_same(self._final_state(resumed), expected)
+        # the random streams were checkpointed too
+        assert any(getattr(variable, 'default_update', None) is not None
+                   for variable in resumed.training_state_variables[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,6 +10,7 @@ import theano.tensor as T
 from theano.compat.six import integer_types
 # internal imports
 from opendeep.utils.config import create_dictionary_like
+from opendeep.utils import profiling
 
 log = logging.getLogger(__name__)
 
@@ -19,6 +20,9 @@ def function(*args, **kwargs):
     Almost no part of OpenDeep can assume that an unused input is an error, so
     the default from Theano is inappropriate for this project.
 
+    If profiling was turned on for the function's `name` (see :func:`opendeep.utils.profiling.profile_functions`),
+    the function is compiled with profiling and wrapped to write its report after the profiling window.
+
     See: http://deeplearning.net/software/theano/library/compile/function.html
 
     Parameters
@@ -33,6 +37,10 @@ def function(*args, **kwargs):
     theano.function
         Compiled Theano function.
     """
+    name = kwargs.get('name')
+    if profiling.is_profiled(name):
+        kwargs['profile'] = profiling.ProfileStats(atexit_print=False, message=name)
+        return profiling.wrap_function(theano.function(*args, on_unused_input='warn', **kwargs), name)
     return theano.function(*args, on_unused_input='warn', **kwargs)
 
 def grad(*args, **kwargs):
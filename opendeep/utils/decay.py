@@ -55,6 +55,29 @@ class DecayFunction(object):
         """
         self.param.set_value(self.initial)
 
+    def get_state(self):
+        """
+        Returns everything needed to restore this decay function to its current point in the schedule
+        (used when checkpointing training).
+
+        Returns
+        -------
+        dict
+            Dictionary of the current value of the shared variable and any internal counters.
+        """
+        return {'value': self.param.get_value()}
+
+    def set_state(self, state):
+        """
+        Restores this decay function to the point in the schedule described by `state`.
+
+        Parameters
+        ----------
+        state : dict
+            A dictionary created by `get_state()`.
+        """
+        self.param.set_value(as_floatX(state['value']))
+
     def simulate(self, initial, reduction_factor, epoch):
         """
         This will take an initial value for a hypothetical variable, the reduction factor appropriate to the
@@ -138,6 +161,19 @@ class Montreal(DecayFunction):
         self.param.set_value(as_floatX(new_value))
         self.epoch += 1
 
+    def reset(self):
+        super(self.__class__, self).reset()
+        self.epoch = 1
+
+    def get_state(self):
+        state = super(self.__class__, self).get_state()
+        state['epoch'] = self.epoch
+        return state
+
+    def set_state(self, state):
+        super(self.__class__, self).set_state(state)
+        self.epoch = state.get('epoch', 1)
+
     def simulate(self, initial, reduction_factor, epoch):
         new_value = initial / (1 + reduction_factor*epoch)
         return new_value
@@ -14,8 +14,11 @@ import numpy
 import theano
 import theano.tensor as T
 import theano.compat.six as six
+from theano.compat.python2x import OrderedDict
+from theano.ifelse import ifelse
 # internal imports
 from opendeep.utils.constructors import as_floatX, sharedX
+from opendeep.utils.misc import raise_to_list
 
 log = logging.getLogger(__name__)
 
@@ -323,6 +326,294 @@ def get_bias(shape, name="b", init_values=None):
     val = as_floatX(numpy.ones(shape=shape, dtype=theano.config.floatX) * init_values)
     return sharedX(value=val, name=name)
 
+def get_carried_state(like, name="state"):
+    """
+    Creates a shared variable to carry a recurrent state (like the last hidden values) between calls of a compiled
+    function, for truncated backpropagation through time over consecutive chunks of sequences.
+
+    The state starts out empty. Whenever it doesn't match the shape of `like` (because it is empty after a
+    reset, or the batch size changed), zeros are used as the initial state instead.
+
+    Parameters
+    ----------
+    like : tensor
+        The symbolic initial state to use when there is no carried state (normally zeros of shape
+        (batch_size, hidden_size)).
+    name : str
+        The name for the shared variable.
+
+    Returns
+    -------
+    tuple
+        (SharedVariable, tensor) - the state variable to update with the final state, and the symbolic
+        initial state to use for the recurrence.
+    """
+    state = theano.shared(numpy.zeros((0,) * like.ndim, dtype=like.dtype), name=name)
+    initial = ifelse(T.all(T.eq(state.shape, like.shape)), state, like)
+    return state, initial
+
+def reset_carried_state(states):
+    """
+    Empties carried recurrent states created with `get_carried_state` (so the next call starts from zeros).
+
+    Parameters
+    ----------
+    states : SharedVariable or list(SharedVariable)
+        The carried states to reset.
+    """
+    if not isinstance(states, (list, tuple)):
+        states = [states]
+    for state in states:
+        state.set_value(numpy.zeros((0,) * state.ndim, dtype=state.dtype))
+
+def fuse_weights(weights, name="W"):
+    """
+    Concatenates the values of several shared weights (like the separate gate weights of an LSTM) along their
+    last axis into one new shared variable, so they can be applied with a single dot product.
+
+    Parameters
+    ----------
+    weights : list(SharedVariable)
+        The shared variables to fuse. They need the same shape except for the last axis.
+    name : str
+        The name for the fused shared variable.
+
+    Returns
+    -------
+    SharedVariable
+        The fused weights.
+    """
+    return sharedX(value=numpy.concatenate([weight.get_value() for weight in weights], axis=-1), name=name)
+
+def slice_gate(x, n, size):
+    """
+    Returns the `n`th block of `size` units along the last axis of `x` (one gate from a fused gate computation).
+
+    Parameters
+    ----------
+    x : tensor
+        The fused gate values.
+    n : int
+        Which gate (block) to slice.
+    size : int
+        The number of units per gate.
+
+    Returns
+    -------
+    tensor
+        The slice for the gate.
+    """
+    return x[tuple([slice(None)] * (x.ndim - 1) + [slice(n * size, (n + 1) * size)])]
+
+def fuse_gate_values(param_values, layout):
+    """
+    Converts a dictionary of parameter values from the split gate layout to the fused layout (see `fuse_weights`).
+    Values that are already fused, or whose split parts are missing, are left alone.
+
+    Parameters
+    ----------
+    param_values : dict(str: array_like)
+        The parameter values by name.
+    layout : dict(str: list(str))
+        The names of the fused parameters mapped to the ordered names of their split parts.
+
+    Returns
+    -------
+    dict(str: array_like)
+        A new dictionary with the parameter values in the fused layout.
+    """
+    param_values = dict(param_values)
+    for fused_name, split_names in layout.items():
+        if fused_name not in param_values and all(name in param_values for name in split_names):
+            param_values[fused_name] = numpy.concatenate(
+                [numpy.asarray(param_values.pop(name)) for name in split_names], axis=-1
+            )
+    return param_values
+
+def split_gate_values(param_values, layout):
+    """
+    Converts a dictionary of parameter values from the fused gate layout back to the split layout.
+    This is the inverse of `fuse_gate_values`.
+
+    Parameters
+    ----------
+    param_values : dict(str: array_like)
+        The parameter values by name.
+    layout : dict(str: list(str))
+        The names of the fused parameters mapped to the ordered names of their split parts.
+
+    Returns
+    -------
+    dict(str: array_like)
+        A new dictionary with the parameter values in the split layout.
+    """
+    param_values = dict(param_values)
+    for fused_name, split_names in layout.items():
+        if fused_name in param_values:
+            parts = numpy.split(numpy.asarray(param_values.pop(fused_name)), len(split_names), axis=-1)
+            for name, part in zip(split_names, parts):
+                param_values.setdefault(name, part)
+    return param_values
+
+def block_diagonal(matrices):
+    """
+    Builds the symbolic block-diagonal matrix with the given matrices along its diagonal.
+
+    Parameters
+    ----------
+    matrices : list(matrix)
+        The matrices to put on the diagonal.
+
+    Returns
+    -------
+    matrix
+        The block-diagonal matrix.
+    """
+    rows = []
+    for i, matrix in enumerate(matrices):
+        row = [matrix if i == j else T.zeros((matrix.shape[0], other.shape[1]), dtype=matrix.dtype)
+               for j, other in enumerate(matrices)]
+        rows.append(T.concatenate(row, axis=1))
+    return T.concatenate(rows, axis=0)
+
+def stack_bidirectional_inputs(x, size, n_gates=1):
+    """
+    Stacks a (timesteps, batch, n_gates*size) sequence with its time-reversed copy along the last axis, gate by
+    gate, so a single scan can go over both directions at once. Each gate block becomes
+    [forward gate, backward gate] of 2*size units.
+
+    Parameters
+    ----------
+    x : tensor3
+        The (projected) input sequence.
+    size : int
+        The number of units per gate.
+    n_gates : int
+        The number of gates concatenated along the last axis.
+
+    Returns
+    -------
+    tensor3
+        The (timesteps, batch, n_gates*2*size) stacked sequence.
+    """
+    x_b = x[::-1]
+    return T.concatenate(
+        [block for n in range(n_gates) for block in [slice_gate(x, n, size), slice_gate(x_b, n, size)]],
+        axis=2
+    )
+
+def stack_bidirectional_weights(U, U_b, size, n_gates=1):
+    """
+    Combines the forward and backward recurrent weights into one matrix for the stacked hiddens from
+    `stack_bidirectional_inputs` (block-diagonal for each gate).
+
+    Parameters
+    ----------
+    U : matrix
+        The (size, n_gates*size) forward recurrent weights.
+    U_b : matrix
+        The (size, n_gates*size) backward recurrent weights.
+    size : int
+        The number of units per gate.
+    n_gates : int
+        The number of gates concatenated along the last axis.
+
+    Returns
+    -------
+    matrix
+        The (2*size, n_gates*2*size) stacked recurrent weights.
+    """
+    return T.concatenate(
+        [block_diagonal([slice_gate(U, n, size), slice_gate(U_b, n, size)]) for n in range(n_gates)],
+        axis=1
+    )
+
+def unstack_bidirectional(hiddens, size):
+    """
+    Splits the stacked hiddens computed over `stack_bidirectional_inputs` back into the forward and backward
+    hiddens (both in forward time order).
+
+    Parameters
+    ----------
+    hiddens : tensor3
+        The (timesteps, batch, 2*size) stacked hiddens.
+    size : int
+        The number of hidden units per direction.
+
+    Returns
+    -------
+    tuple
+        (forward hiddens, backward hiddens).
+    """
+    return slice_gate(hiddens, 0, size), slice_gate(hiddens, 1, size)[::-1]
+
+def fold_switches(outputs, updates=None, switches=None, value=0.):
+    """
+    Replaces the (scalar) switch shared variables in the outputs and updates expressions with constants, so that
+    Theano's optimizer can fold the `T.switch` ops and prune the branches (like noise and their random streams)
+    that are not taken. This is used to compile inference functions that never look at the switches.
+
+    Parameters
+    ----------
+    outputs : theano expression or list(theano expression)
+        The output expression(s).
+    updates : dict or list of (SharedVariable, expression) pairs, optional
+        The updates to also replace the switches in.
+    switches : list(SharedVariable), optional
+        The switches to replace.
+    value : float
+        The constant value for the switches (0. is off).
+
+    Returns
+    -------
+    tuple
+        (outputs, updates) with the switches replaced - outputs keeps the form it was given in, and updates is an
+        OrderedDict (or None if no updates were given).
+    """
+    switches = raise_to_list(switches) or []
+    replace = OrderedDict(
+        [(switch, T.constant(numpy.asarray(value, dtype=switch.dtype), name=switch.name)) for switch in switches]
+    )
+    if updates is not None and hasattr(updates, 'items'):
+        updates = list(updates.items())
+    if len(replace) == 0:
+        return outputs, (OrderedDict(updates) if updates is not None else None)
+
+    output_list = raise_to_list(outputs)
+    update_pairs = updates or []
+    cloned = theano.clone(output_list + [expression for _, expression in update_pairs], replace=replace)
+    new_outputs = cloned[:len(output_list)]
+    if not isinstance(outputs, (list, tuple)):
+        new_outputs = new_outputs[0]
+    new_updates = None
+    if updates is not None:
+        new_updates = OrderedDict(zip([variable for variable, _ in update_pairs], cloned[len(output_list):]))
+    log.debug("Folded %d switches to %s", len(replace), str(value))
+    return new_outputs, new_updates
+
+def find_dot(outputs, W):
+    """
+    Finds the `T.dot(x, W)` product with a weights matrix in the graph of the outputs, so it can be replaced (like
+    with a quantized or sparse product) through `theano.clone`.
+
+    Parameters
+    ----------
+    outputs : theano expression or list(theano expression)
+        The output expression(s) to search.
+    W : SharedVariable
+        The weights matrix, as the second argument of the dot product.
+
+    Returns
+    -------
+    theano expression or None
+        The dot product variable, or None if the weights aren't multiplied in the graph.
+    """
+    for variable in theano.gof.graph.ancestors(raise_to_list(outputs)):
+        if variable.owner is not None and isinstance(variable.owner.op, T.basic.Dot) and \
+                variable.owner.inputs[1] is W:
+            return variable
+    return None
+
 def mirror_images(input, image_shape, cropsize, rand, flag_rand):
     """
     This takes an input batch of images (normally the input to a convolutional net),
@@ -0,0 +1,313 @@
+"""
+A NumPy-only runtime for models exported with :func:`opendeep.models.utils.numpy_export.export_numpy`.
+
+The export is a directory with the parameters in 'params.npz' and the layer specifications in 'model.json'.
+This module only needs numpy (no Theano, and not the rest of OpenDeep), and the exporter copies it next to the
+exported files, so an inference process can load and run the model without compiling anything::
+
+    import numpy_runtime
+    model = numpy_runtime.load('outputs/export/')
+    predictions = model.run(inputs)
+
+The layers compute the same forward pass as the compiled `f_run` of the original models with their noise switches
+turned off.
+"""
+# standard libraries
+import logging
+import json
+import os
+# third party libraries
+import numpy
+from numpy.lib.stride_tricks import as_strided
+
+log = logging.getLogger(__name__)
+
+SPEC_FILE = 'model.json'
+PARAMS_FILE = 'params.npz'
+FORMAT_VERSION = 1
+
+
+###############
+# activations #
+###############
+def sigmoid(x):
+    return 1. / (1. + numpy.exp(-x))
+
+def softmax(x):
+    e = numpy.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+def softplus(x):
+    return numpy.logaddexp(0, x)
+
+def rectifier(x):
+    return numpy.maximum(x, 0)
+
+def linear(x):
+    return x
+
+_activations = {'sigmoid': sigmoid,
+                'softmax': softmax,
+                'softplus': softplus,
+                'rectifier': rectifier,
+                'relu': rectifier,
+                'tanh': numpy.tanh,
+                'linear': linear}
+
+def get_activation(name):
+    """
+    Parameters
+    ----------
+    name : str or None
+        The name of the activation (same as the ones in opendeep.utils.activation).
+
+    Returns
+    -------
+    function
+        The NumPy activation function.
+    """
+    if name is None:
+        return linear
+    func = _activations.get(name.lower())
+    if func is None:
+        raise NotImplementedError("Did not recognize activation {0!s}! Please use one of: {1!s}".format(
+            name, list(_activations.keys())))
+    return func
+
+
+#####################
+# layer computation #
+#####################
+def _windows(x, rows, cols, stride):
+    """
+    The (batch, channels, out_rows, out_cols, rows, cols) strided view of the sliding windows over a bc01 input.
+    """
+    b, c, r, col = x.shape
+    out_r = (r - rows) // stride[0] + 1
+    out_c = (col - cols) // stride[1] + 1
+    s = x.strides
+    return as_strided(x, shape=(b, c, out_r, out_c, rows, cols),
+                      strides=(s[0], s[1], s[2] * stride[0], s[3] * stride[1], s[2], s[3]))
+
+def conv2d(x, W, stride=(1, 1), pad=(0, 0)):
+    """
+    The 2D convolution of a bc01 input with (filters, channels, rows, cols) kernels, like Theano's
+    `T.nnet.conv2d` (the kernels are flipped).
+    """
+    if pad[0] > 0 or pad[1] > 0:
+        x = numpy.pad(x, ((0, 0), (0, 0), (pad[0], pad[0]), (pad[1], pad[1])), mode='constant')
+    kernels = W[:, :, ::-1, ::-1]
+    windows = _windows(numpy.ascontiguousarray(x), W.shape[2], W.shape[3], stride)
+    # (batch, out_rows, out_cols, filters) from one big dot product over the (im2col) windows
+    conved = numpy.tensordot(windows, kernels, axes=([1, 4, 5], [1, 2, 3]))
+    return conved.transpose(0, 3, 1, 2)
+
+def max_pool(x, size, stride):
+    """
+    The max pooling of a bc01 input over (size, size) windows, including the partial windows at the borders like
+    Theano's `max_pool_2d` with ignore_border=False.
+    """
+    out_shape = []
+    for dim in x.shape[2:]:
+        if stride >= size:
+            out_shape.append((dim - 1) // stride + 1)
+        else:
+            out_shape.append(max(0, (dim - 1 - size + stride) // stride) + 1)
+    # pad the end of each image dimension so the partial windows are complete
+    padded_shape = [(n - 1) * stride + size for n in out_shape]
+    padded = numpy.full(x.shape[:2] + tuple(max(p, d) for p, d in zip(padded_shape, x.shape[2:])),
+                        -numpy.inf, dtype=x.dtype)
+    padded[:, :, :x.shape[2], :x.shape[3]] = x
+    return _windows(padded, size, size, (stride, stride))[:, :, :out_shape[0], :out_shape[1]].max(axis=(4, 5))
+
+def cross_channel_normalization(x, alpha=1e-4, k=2, beta=0.75, n=5):
+    """
+    Local response normalization across the channels of a bc01 input (like
+    `opendeep.utils.nnet.cross_channel_normalization_bc01`).
+    """
+    half = n // 2
+    sq = numpy.zeros((x.shape[0], x.shape[1] + 2 * half) + x.shape[2:], dtype=x.dtype)
+    sq[:, half:half + x.shape[1]] = x ** 2
+    scale = k + alpha * sum(sq[:, i:i + x.shape[1]] for i in range(n))
+    return x / scale ** beta
+
+def dense(x, params, spec):
+    # inputs coming from a convolutional layer get flattened
+    if x.ndim > 2:
+        x = x.reshape((x.shape[0], -1))
+    output = get_activation(spec['activation'])(numpy.dot(x, params['W']) + params['b'])
+    if spec.get('argmax'):
+        output = numpy.argmax(output, axis=-1)
+    return output
+
+def conv_2d(x, params, spec):
+    W = params['W']
+    border_mode = spec['border_mode']
+    rows, cols = W.shape[2:]
+    if border_mode == 'valid':
+        conved = conv2d(x, W, spec['strides'])
+    elif border_mode in ['full', 'same']:
+        conved = conv2d(x, W, spec['strides'], pad=(rows - 1, cols - 1))
+        if border_mode == 'same':
+            shift_x, shift_y = (rows - 1) // 2, (cols - 1) // 2
+            conved = conved[:, :, shift_x:x.shape[2] + shift_x, shift_y:x.shape[3] + shift_y]
+    else:
+        raise RuntimeError("Invalid border mode: '%s'" % border_mode)
+    return get_activation(spec['activation'])(conved + params['b'][None, :, None, None])
+
+def conv_pool(x, params, spec):
+    stride = (spec['convstride'], spec['convstride'])
+    pad = (spec['padsize'], spec['padsize'])
+    if spec['group'] == 1:
+        conved = conv2d(x, params['W'], stride, pad) + params['b'][None, :, None, None]
+    else:
+        half = x.shape[1] // 2
+        conved = numpy.concatenate([
+            conv2d(x[:, :half], params['W0'], stride, pad) + params['b0'][None, :, None, None],
+            conv2d(x[:, half:], params['W1'], stride, pad) + params['b1'][None, :, None, None]
+        ], axis=1)
+    output = get_activation(spec['activation'])(conved)
+    if spec['poolsize'] != 1:
+        output = max_pool(output, spec['poolsize'], spec['poolstride'])
+    if spec['local_response_normalization']:
+        output = cross_channel_normalization(output)
+    return output
+
+def _recurrent_input(x, spec):
+    # recurrent layers work with (timesteps, batch, data)
+    if not spec['time_major']:
+        return x.transpose(1, 0, 2)
+    if x.ndim == 1:
+        return x[:, None, None]
+    if x.ndim == 2:
+        return x[:, None, :]
+    return x.reshape(x.shape[:2] + (-1,))
+
+def _scan(step, projected, h0, reverse=False):
+    """
+    Runs the step over time, returning the hiddens in the order they were computed (like Theano's scan with
+    go_backwards).
+    """
+    state = h0
+    hiddens = []
+    for t in (reversed(range(len(projected))) if reverse else range(len(projected))):
+        state = step(projected[t], state)
+        hiddens.append(state[0])
+    return numpy.asarray(hiddens)
+
+def lstm(x, params, spec):
+    xs = _recurrent_input(x, spec)
+    size = spec['hidden_size']
+    act = get_activation(spec['hidden_activation'])
+    inner_act = get_activation(spec['inner_hidden_activation'])
+    projected = numpy.dot(xs, params['W_x_gates']) + params['b_gates']
+
+    def step_with(U):
+        def step(x_t, state):
+            h_tm1, c_tm1 = state
+            gates = x_t + numpy.dot(h_tm1, U)
+            c_tilde = act(gates[..., :size])
+            i_t = inner_act(gates[..., size:2 * size])
+            f_t = inner_act(gates[..., 2 * size:3 * size])
+            o_t = inner_act(gates[..., 3 * size:])
+            c_t = f_t * c_tm1 + i_t * c_tilde
+            return o_t * act(c_t), c_t
+        return step
+
+    zeros = numpy.zeros((xs.shape[1], size), dtype=projected.dtype)
+    direction = spec['direction']
+    hiddens = _scan(step_with(params['U_h_gates']), projected, (zeros, zeros), reverse=direction == 'backward')
+    if direction == 'bidirectional':
+        hiddens = hiddens + _scan(step_with(params['U_h_gates_b']), projected, (zeros, zeros), reverse=True)[::-1]
+    return get_activation(spec['activation'])(numpy.dot(hiddens, params['W_h_y']) + params['b_y'])
+
+def gru(x, params, spec):
+    xs = _recurrent_input(x, spec)
+    size = spec['hidden_size']
+    act = get_activation(spec['hidden_activation'])
+    inner_act = get_activation(spec['inner_hidden_activation'])
+    projected = numpy.dot(xs, params['W_x_gates']) + params['b_gates']
+    U = params['U_h_gates']
+
+    def step(x_t, state):
+        h_tm1 = state[0]
+        h_dot = numpy.dot(h_tm1, U)
+        z_t = inner_act(x_t[..., :size] + h_dot[..., :size])
+        r_t = inner_act(x_t[..., size:2 * size] + h_dot[..., size:2 * size])
+        h_tilde = act(x_t[..., 2 * size:] + r_t * h_dot[..., 2 * size:])
+        return ((1 - z_t) * h_tm1 + z_t * h_tilde,)
+
+    zeros = numpy.zeros((xs.shape[1], size), dtype=projected.dtype)
+    hiddens = _scan(step, projected, (zeros,), reverse=not spec['forward'])
+    return get_activation(spec['activation'])(numpy.dot(hiddens, params['W_h_y']) + params['b_y'])
+
+# the layer type names in model.json: layer function
+_layers = {'Dense': dense,
+           'Conv2D': conv_2d,
+           'ConvPoolLayer': conv_pool,
+           'LSTM': lstm,
+           'GRU': gru}
+
+
+class NumpyModel(object):
+    """
+    A stack of exported layers, where each layer's input is the previous layer's output.
+
+    Parameters
+    ----------
+    layers : list(dict)
+        The layer specifications (each with a 'type' and the parameter 'names' to look up).
+    params : dict
+        The {name: array} parameter values.
+    """
+    def __init__(self, layers, params):
+        self.layers = []
+        for spec in layers:
+            if spec['type'] not in _layers:
+                raise NotImplementedError("No NumPy runtime for layer type %s!" % spec['type'])
+            layer_params = {name: params[key] for name, key in spec['params'].items()}
+            self.layers.append((_layers[spec['type']], layer_params, spec))
+
+    def run(self, input):
+        """
+        Computes the model's output.
+
+        Parameters
+        ----------
+        input : array_like
+            The input to the first layer (in the same format as the original model's `run()`).
+
+        Returns
+        -------
+        array_like
+            The output of the last layer.
+        """
+        output = numpy.asarray(input)
+        for func, params, spec in self.layers:
+            output = func(output, params, spec)
+        return output
+
+
+def load(path):
+    """
+    Loads an exported model.
+
+    Parameters
+    ----------
+    path : str
+        The export directory, containing 'model.json' and 'params.npz'.
+
+    Returns
+    -------
+    NumpyModel
+        The model to `run()`.
+    """
+    with open(os.path.join(path, SPEC_FILE), 'r') as f:
+        spec = json.load(f)
+    if spec.get('format') != FORMAT_VERSION:
+        raise NotImplementedError("Can't load export format %s (expected %d)!" % (str(spec.get('format')),
+                                                                                    FORMAT_VERSION))
+    with numpy.load(os.path.join(path, PARAMS_FILE)) as f:
+        params = {key: f[key] for key in f.files}
+    log.debug("Loaded %d NumPy layers from %s", len(spec['layers']), path)
+    return NumpyModel(spec['layers'], params)
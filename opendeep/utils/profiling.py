@@ -0,0 +1,269 @@
+"""
+This module provides op-level profiling for compiled Theano functions, selected by function name.
+
+Turn profiling on for the functions you care about before they are compiled with
+:func:`opendeep.utils.constructors.function`::
+
+    from opendeep.utils import profiling
+    profiling.profile_functions(['f_learn_0', 'valid_monitor_function'], model=model, n_calls=50)
+
+After the window of calls, a ranked report of per-Op and per-Apply time is written to the model's `outdir` (or the
+given `outdir`) as 'profile_<name>.txt' (with the raw numbers in 'profile_<name>.json'). Two json reports (like
+before and after a change) can be compared with :func:`diff_profiles`.
+"""
+# standard libraries
+import logging
+import os
+import json
+from collections import defaultdict
+# third party libraries
+from theano.compat import six
+from theano.compile.profiling import ProfileStats
+
+log = logging.getLogger(__name__)
+
+# function name: settings for the functions that should be profiled
+_profiled_functions = {}
+
+
+def profile_functions(names, model=None, outdir=None, n_calls=100, warmup_calls=1, top=50):
+    """
+    Turns on profiling for compiled functions with the given names. This affects functions compiled after this call.
+
+    Parameters
+    ----------
+    names : str or list(str)
+        The names of the functions to profile (the `name` given to `function()`, like 'f_learn_0', 'f_run',
+        or 'valid_monitor_function').
+    model : Model, optional
+        The model whose `outdir` the reports are written to.
+    outdir : str, optional
+        The directory to write the reports to instead of the model's `outdir`. If neither is given (or the
+        model's `outdir` is None), the text reports are only logged.
+    n_calls : int
+        The number of calls to collect timings over.
+    warmup_calls : int
+        The number of calls to skip before collecting timings.
+    top : int
+        The number of Ops and Apply nodes to list in the text report.
+    """
+    if isinstance(names, six.string_types):
+        names = [names]
+    if outdir is None and model is not None:
+        outdir = getattr(model, 'outdir', None)
+    for name in names:
+        _profiled_functions[name] = {'outdir': outdir, 'n_calls': n_calls, 'warmup_calls': warmup_calls, 'top': top}
+        log.info("Profiling enabled for function %s (%d calls after %d warmup calls), reports go to %s",
+                 name, n_calls, warmup_calls, outdir or "the logs")
+
+
+def stop_profiling(names=None):
+    """
+    Turns off profiling for the given function names (or all of them if None) for functions compiled afterwards.
+
+    Parameters
+    ----------
+    names : str or list(str), optional
+        The function names to stop profiling.
+    """
+    if names is None:
+        _profiled_functions.clear()
+    else:
+        if isinstance(names, six.string_types):
+            names = [names]
+        for name in names:
+            _profiled_functions.pop(name, None)
+
+
+def is_profiled(name):
+    """
+    Returns
+    -------
+    bool
+        Whether a function with this name should be profiled when it is compiled.
+    """
+    return name is not None and name in _profiled_functions
+
+
+def wrap_function(theano_fn, name):
+    """
+    Wraps a compiled Theano function (compiled with `profile=ProfileStats`) so its timings are collected over the
+    configured window of calls and written as a report.
+
+    Parameters
+    ----------
+    theano_fn : theano.compile.function_module.Function
+        The compiled function.
+    name : str
+        The function's name.
+
+    Returns
+    -------
+    ProfiledFunction
+        The callable wrapper.
+    """
+    settings = _profiled_functions[name]
+    return ProfiledFunction(theano_fn, name, **settings)
+
+
+def _node_key(apply_key):
+    # newer Theano versions key the apply times by (fgraph, node) instead of node
+    if isinstance(apply_key, tuple):
+        return apply_key[-1]
+    return apply_key
+
+
+class ProfiledFunction(object):
+    """
+    A callable wrapper around a compiled Theano function that collects its profile over a window of calls.
+    Every other attribute is passed through to the wrapped function.
+    """
+    def __init__(self, fn, name, outdir, n_calls=100, warmup_calls=1, top=50):
+        self.fn = fn
+        self.name = name
+        self.outdir = outdir
+        self.n_calls = n_calls
+        self.warmup_calls = warmup_calls
+        self.top = top
+        self.calls = 0
+        # no timings during the warmup calls
+        self.fn.profile = None
+        if self.warmup_calls == 0:
+            self._start()
+
+    def _start(self):
+        # the compiled function keeps timing every call - flush the warmup timings out before collecting.
+        if hasattr(self.fn.fn, 'update_profile'):
+            self.fn.fn.update_profile(ProfileStats(atexit_print=False))
+        self.fn.profile = ProfileStats(atexit_print=False, message=self.name)
+
+    def __call__(self, *args, **kwargs):
+        outputs = self.fn(*args, **kwargs)
+        self.calls += 1
+        if self.calls == self.warmup_calls:
+            self._start()
+        elif self.calls == self.warmup_calls + self.n_calls:
+            self.write_report()
+            # stop collecting after the window.
+            self.fn.profile = None
+        return outputs
+
+    def __getattr__(self, item):
+        return getattr(self.fn, item)
+
+    def get_stats(self):
+        """
+        Summarizes the collected profile.
+
+        Returns
+        -------
+        dict
+            Dictionary with the function's 'name', 'calls', total 'function_time', the 'op_time' per Op
+            (seconds), and the 'apply_time' per Apply node (seconds).
+        """
+        profile = self.fn.profile
+        stats = {'name': self.name, 'calls': 0, 'function_time': 0., 'op_time': {}, 'apply_time': {}}
+        if profile is None:
+            return stats
+        stats['calls'] = profile.fct_callcount
+        stats['function_time'] = profile.fct_call_time
+        op_time = defaultdict(float)
+        apply_time = {}
+        for apply_key, t in profile.apply_time.items():
+            node = _node_key(apply_key)
+            op_time[str(node.op)] += t
+            apply_time[str(node)] = apply_time.get(str(node), 0.) + t
+        stats['op_time'] = dict(op_time)
+        stats['apply_time'] = apply_time
+        return stats
+
+    def write_report(self):
+        """
+        Writes the ranked text report and the json stats for this function to `outdir` (or logs the text report
+        if `outdir` is None).
+
+        Returns
+        -------
+        str
+            The path to the text report (None if it was only logged).
+        """
+        stats = self.get_stats()
+        if not self.outdir:
+            log.info(_format_stats(stats, self.top))
+            return None
+        if not os.path.exists(self.outdir):
+            os.makedirs(self.outdir)
+        basename = os.path.join(self.outdir, 'profile_%s' % self.name)
+        with open(basename + '.json', 'w') as f:
+            json.dump(stats, f, indent=2)
+        with open(basename + '.txt', 'w') as f:
+            f.write(_format_stats(stats, self.top))
+        log.info("Wrote profile for function %s over %d calls to %s.txt", self.name, stats['calls'], basename)
+        return basename + '.txt'
+
+
+def _ranked_lines(times, total, top):
+    lines = []
+    for key, t in sorted(times.items(), key=lambda item: item[1], reverse=True)[:top]:
+        lines.append("%10.6fs  %5.1f%%  %s" % (t, 100. * t / total if total > 0 else 0., key))
+    return lines
+
+
+def _format_stats(stats, top=50):
+    op_total = sum(stats['op_time'].values())
+    lines = ["Profile for function %s: %d calls, %.6fs total, %.6fs in Ops" %
+             (stats['name'], stats['calls'], stats['function_time'], op_total),
+             "", "Ops (ranked by time):"]
+    lines += _ranked_lines(stats['op_time'], op_total, top)
+    lines += ["", "Apply nodes (ranked by time):"]
+    lines += _ranked_lines(stats['apply_time'], op_total, top)
+    return '\n'.join(lines) + '\n'
+
+
+def diff_profiles(before, after, outfile=None, top=50):
+    """
+    Compares two profile json reports (from :class:`ProfiledFunction`) Op by Op, normalized per call.
+
+    Parameters
+    ----------
+    before : str
+        Path to the first profile_<name>.json.
+    after : str
+        Path to the second profile_<name>.json.
+    outfile : str, optional
+        Where to write the text diff.
+    top : int
+        The number of Ops to list.
+
+    Returns
+    -------
+    list
+        List of (op, before seconds per call, after seconds per call, difference) tuples, ranked by the size of
+        the difference.
+    """
+    with open(before, 'r') as f:
+        before_stats = json.load(f)
+    with open(after, 'r') as f:
+        after_stats = json.load(f)
+    before_calls = max(before_stats['calls'], 1)
+    after_calls = max(after_stats['calls'], 1)
+    ops = set(before_stats['op_time'].keys()) | set(after_stats['op_time'].keys())
+    diffs = []
+    for op in ops:
+        b = before_stats['op_time'].get(op, 0.) / before_calls
+        a = after_stats['op_time'].get(op, 0.) / after_calls
+        diffs.append((op, b, a, a - b))
+    diffs.sort(key=lambda diff: abs(diff[3]), reverse=True)
+
+    lines = ["Profile diff (seconds per call): %s -> %s" % (before, after),
+             "Function time per call: %.6fs -> %.6fs" % (before_stats['function_time'] / before_calls,
+                                                         after_stats['function_time'] / after_calls),
+             ""]
+    for op, b, a, d in diffs[:top]:
+        lines.append("%+10.6fs  %10.6fs -> %10.6fs  %s" % (d, b, a, op))
+    report = '\n'.join(lines) + '\n'
+    log.info(report)
+    if outfile is not None:
+        with open(outfile, 'w') as f:
+            f.write(report)
+    return diffs
@@ -0,0 +1,320 @@
+"""
+This module provides a dynamic-batching server for running a :class:`Model` on individual requests.
+
+Requests submitted from any number of threads are coalesced into batches (up to `max_batch_size` examples, waiting at
+most `max_wait` seconds after the first one arrives), each batch is computed with one call of the model's `f_run`,
+and the results are scattered back to the waiting requests. Examples are checked against the model's inputs when
+they are submitted, and examples of different shapes are computed in separate batches. This trades a small, tunable
+latency budget for the throughput of running full batches::
+
+    from opendeep.utils.serving import BatchingServer, serve_http
+    server = BatchingServer(model, max_batch_size=128, max_wait=0.01).start()
+    prediction = server.predict(example)  # blocks until the batch with this example has run
+    # or through a local HTTP front end taking POSTed json like {"input": [...]}
+    serve_http(server, port=8000).serve_forever()
+"""
+# standard libraries
+import logging
+import json
+import threading
+import time
+# third party libraries
+import numpy
+from theano.compat.python2x import OrderedDict
+from theano.compat.six.moves import queue, BaseHTTPServer, socketserver
+# internal imports
+from opendeep.utils.misc import raise_to_list
+
+log = logging.getLogger(__name__)
+
+
+class Request(object):
+    """
+    A single example waiting to be computed in a batch. `result()` blocks until its batch has run.
+    """
+    def __init__(self, inputs):
+        self.inputs = inputs
+        self.output = None
+        self.error = None
+        self._done = threading.Event()
+
+    def set_result(self, output=None, error=None):
+        self.output = output
+        self.error = error
+        self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """
+        Parameters
+        ----------
+        timeout : float, optional
+            The number of seconds to wait for the result.
+
+        Returns
+        -------
+        array_like or list(array_like)
+            The model's output(s) for this example.
+
+        Raises
+        ------
+        RuntimeError
+            If the result isn't ready after `timeout` seconds.
+        """
+        if not self._done.wait(timeout):
+            raise RuntimeError("Request timed out after %s seconds!" % str(timeout))
+        if self.error is not None:
+            raise self.error
+        return self.output
+
+
+class BatchingServer(object):
+    """
+    Runs a model on batches coalesced from individually submitted examples, in a background thread.
+
+    Parameters
+    ----------
+    model : :class:`Model`
+        The model (or :class:`Prototype`) to run. Its run function is compiled for inference (with the noise
+        switches folded off) when the server starts.
+    max_batch_size : int
+        The maximum number of examples to compute in one call.
+    max_wait : float
+        The maximum number of seconds to wait for more examples after the first example of a batch arrives.
+    run_fn : function, optional
+        The function computing a batch of inputs, to use instead of the model's `run()`.
+    """
+    def __init__(self, model=None, max_batch_size=64, max_wait=0.005, run_fn=None):
+        assert model is not None or run_fn is not None, "BatchingServer needs a model or a run_fn!"
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.run_fn = run_fn
+        self.requests = queue.Queue()
+        self.thread = None
+        # the number of dimensions and dtype of each model input without the batch dimension. Without a model,
+        # they are taken from the first submitted example.
+        self.input_ndims = None
+        self.input_dtypes = None
+        if model is not None:
+            model_inputs = raise_to_list(model.get_inputs())
+            self.input_ndims = [model_input.ndim - 1 for model_input in model_inputs]
+            self.input_dtypes = [model_input.dtype for model_input in model_inputs]
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        # batch statistics for tuning max_batch_size and max_wait
+        self.n_batches = 0
+        self.n_examples = 0
+
+    def start(self):
+        """
+        Compiles the run function (if needed) and starts the batching thread.
+
+        Returns
+        -------
+        BatchingServer
+            This server.
+        """
+        if self.run_fn is None:
+            self.model.compile_run_fn(inference=True)
+            self.run_fn = self.model.run
+        self._stop.clear()
+        self.thread = threading.Thread(target=self._serve, name='batching_server')
+        self.thread.daemon = True
+        self.thread.start()
+        log.info("Started batching server with max_batch_size %d and max_wait %ss",
+                 self.max_batch_size, str(self.max_wait))
+        return self
+
+    def stop(self):
+        """
+        Stops the batching thread after the current batch. The requests still waiting in the queue fail with a
+        RuntimeError.
+        """
+        self._stop.set()
+        if self.thread is not None:
+            self.thread.join()
+        with self._lock:
+            self.thread = None
+            n_failed = 0
+            while True:
+                try:
+                    request = self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                request.set_result(error=RuntimeError("The batching server was stopped!"))
+                n_failed += 1
+        if n_failed > 0:
+            log.warning("Batching server stopped with %d requests still queued, failed them.", n_failed)
+        if self.n_batches > 0:
+            log.info("Batching server ran %d examples in %d batches (mean batch size %.2f)",
+                     self.n_examples, self.n_batches, self.n_examples / float(self.n_batches))
+
+    def submit(self, inputs):
+        """
+        Queues one example to be computed in the next batch.
+
+        Parameters
+        ----------
+        inputs : array_like or list(array_like)
+            The example for each of the model's inputs (without the batch dimension). A list is taken as one
+            example per model input.
+
+        Returns
+        -------
+        Request
+            The request, whose `result()` is the model's output for this example.
+
+        Raises
+        ------
+        ValueError
+            If the example doesn't match the model's inputs (number of inputs, dimensions, or numeric dtype).
+        RuntimeError
+            If the server isn't running.
+        """
+        inputs = [numpy.asarray(example) for example in raise_to_list(inputs)]
+        with self._lock:
+            if self.thread is None:
+                raise RuntimeError("The batching server isn't running - call start() first!")
+            self._check_inputs(inputs)
+            request = Request(inputs)
+            self.requests.put(request)
+        return request
+
+    def _check_inputs(self, inputs):
+        if self.input_ndims is None:
+            self.input_ndims = [example.ndim for example in inputs]
+        if len(inputs) != len(self.input_ndims):
+            raise ValueError("Expected %d inputs for the model, found %d!" % (len(self.input_ndims), len(inputs)))
+        for i, (example, ndim) in enumerate(zip(inputs, self.input_ndims)):
+            if example.ndim != ndim:
+                raise ValueError("Expected input %d to have %d dimensions (without the batch), found shape %s!" %
+                                 (i, ndim, str(example.shape)))
+            kinds = 'biuf' if self.input_dtypes is None or self.input_dtypes[i].startswith('float') else 'biu'
+            if example.dtype.kind not in kinds:
+                raise ValueError("Expected input %d to be numeric (%s), found dtype %s!" %
+                                 (i, self.input_dtypes[i] if self.input_dtypes else 'any', str(example.dtype)))
+
+    def predict(self, inputs, timeout=None):
+        """
+        Computes the model's output for one example, blocking until its batch has run.
+
+        Parameters
+        ----------
+        inputs : array_like or list(array_like)
+            The example for each of the model's inputs (without the batch dimension).
+        timeout : float, optional
+            The number of seconds to wait for the result.
+
+        Returns
+        -------
+        array_like or list(array_like)
+            The model's output(s) for this example.
+        """
+        return self.submit(inputs).result(timeout)
+
+    def _next_batch(self):
+        # block for the first request of the batch (checking for stop every so often)
+        try:
+            batch = [self.requests.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.time()
+            try:
+                if remaining > 0:
+                    batch.append(self.requests.get(timeout=remaining))
+                else:
+                    batch.append(self.requests.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _serve(self):
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if len(batch) > 0:
+                self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        # examples of different shapes (like sequences of different lengths) can't be stacked together
+        groups = OrderedDict()
+        for request in batch:
+            groups.setdefault(tuple(example.shape for example in request.inputs), []).append(request)
+        for group in groups.values():
+            self._run_group(group)
+        self.n_batches += 1
+        self.n_examples += len(batch)
+
+    def _run_group(self, batch):
+        try:
+            # stack each input over the examples in the batch
+            inputs = [numpy.asarray([request.inputs[i] for request in batch],
+                                    dtype=self.input_dtypes[i] if self.input_dtypes else None)
+                      for i in range(len(batch[0].inputs))]
+            outputs = self.run_fn(inputs)
+            if isinstance(outputs, (list, tuple)):
+                for idx, request in enumerate(batch):
+                    request.set_result(output=[output[idx] for output in outputs])
+            else:
+                for idx, request in enumerate(batch):
+                    request.set_result(output=outputs[idx])
+        except Exception as e:
+            log.exception("Error running a batch of %d requests!", len(batch))
+            for request in batch:
+                if not request.done():
+                    request.set_result(error=e)
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def serve_http(server, host='localhost', port=8000):
+    """
+    Creates a simple local HTTP front end for a :class:`BatchingServer`. Each POST takes json like
+    ``{"input": example}`` (or ``{"inputs": [example for each model input]}``) and responds with
+    ``{"output": output}``. Every connection is handled in its own thread, so concurrent requests get batched.
+
+    Parameters
+    ----------
+    server : BatchingServer
+        The started batching server to send the requests to.
+    host : str
+        The host name to listen on.
+    port : int
+        The port to listen on.
+
+    Returns
+    -------
+    HTTPServer
+        The HTTP server - call `serve_forever()` on it to start handling requests.
+    """
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+        def do_POST(self):
+            try:
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+                inputs = body['inputs'] if 'inputs' in body else [body['input']]
+                output = server.predict(inputs)
+                if isinstance(output, list):
+                    output = [numpy.asarray(out).tolist() for out in output]
+                else:
+                    output = numpy.asarray(output).tolist()
+                code, response = 200, {'output': output}
+            except Exception as e:
+                code, response = 400, {'error': str(e)}
+            response = json.dumps(response).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(response)))
+            self.end_headers()
+            self.wfile.write(response)
+
+        def log_message(self, format, *args):
+            log.debug(format, *args)
+
+    log.info("Serving batched model requests on http://%s:%d", host, port)
+    return _ThreadingHTTPServer((host, port), Handler)
@@ -0,0 +1,118 @@
+import unittest
+from opendeep.utils.nnet import (fuse_gate_values, split_gate_values, block_diagonal,
+                                 stack_bidirectional_inputs, stack_bidirectional_weights, unstack_bidirectional,
+                                 get_carried_state, reset_carried_state)
+import numpy
+import theano
+import theano.tensor as T
+
+class TestGateLayout(unittest.TestCase):
+    def setUp(self):
+        self.layout = {"U_h_gates": ["U_h_z", "U_h_r", "U_h_h"], "b_gates": ["b_z", "b_r", "b_h"]}
+        self.split = {"U_h_z": numpy.ones((4, 4)), "U_h_r": 2*numpy.ones((4, 4)), "U_h_h": 3*numpy.ones((4, 4)),
+                      "b_z": numpy.zeros((4,)), "b_r": numpy.ones((4,)), "b_h": 2*numpy.ones((4,)),
+                      "W_h_y": numpy.eye(4)}
+
+    def testFuse(self):
+        fused = fuse_gate_values(self.split, self.layout)
+        assert set(fused.keys()) == {"U_h_gates", "b_gates", "W_h_y"}, fused.keys()
+        assert fused["U_h_gates"].shape == (4, 12)
+        assert fused["b_gates"].shape == (12,)
+        numpy.testing.assert_array_equal(fused["U_h_gates"][:, 4:8], self.split["U_h_r"])
+
+    def testRoundTrip(self):
+        split = split_gate_values(fuse_gate_values(self.split, self.layout), self.layout)
+        assert set(split.keys()) == set(self.split.keys())
+        for name, value in self.split.items():
+            numpy.testing.assert_array_equal(split[name], value)
+
+    def testUnchanged(self):
+        # values already in the requested layout are left alone
+        split = split_gate_values(self.split, self.layout)
+        assert set(split.keys()) == set(self.split.keys())
+
+class TestBidirectionalStacking(unittest.TestCase):
+    def setUp(self):
+        self.rng = numpy.random.RandomState(1)
+        self.size, self.n_gates = 3, 2
+
+    def _random(self, *shape):
+        return self.rng.randn(*shape).astype(theano.config.floatX)
+
+    def testBlockDiagonal(self):
+        a, b = self._random(2, 3), self._random(4, 1)
+        expected = numpy.zeros((6, 4), dtype=theano.config.floatX)
+        expected[:2, :3] = a
+        expected[2:, 3:] = b
+        numpy.testing.assert_array_equal(block_diagonal([T.as_tensor_variable(a), T.as_tensor_variable(b)]).eval(),
+                                         expected)
+
+    def testStackInputs(self):
+        x = self._random(5, 2, self.n_gates * self.size)
+        stacked = stack_bidirectional_inputs(T.as_tensor_variable(x), self.size, self.n_gates).eval()
+        assert stacked.shape == (5, 2, 2 * self.n_gates * self.size)
+        # each gate block is [forward gate, time-reversed gate]
+        for n in range(self.n_gates):
+            gate = slice(n * self.size, (n + 1) * self.size)
+            block = stacked[:, :, 2 * n * self.size:2 * (n + 1) * self.size]
+            numpy.testing.assert_array_equal(block[:, :, :self.size], x[:, :, gate])
+            numpy.testing.assert_array_equal(block[:, :, self.size:], x[::-1, :, gate])
+
+    def testStackedStep(self):
+        # one step over the stacked hiddens is the step of each direction with its own weights
+        x, x_b = self._random(2, self.n_gates * self.size), self._random(2, self.n_gates * self.size)
+        h, h_b = self._random(2, self.size), self._random(2, self.size)
+        U, U_b = self._random(self.size, self.n_gates * self.size), self._random(self.size, self.n_gates * self.size)
+        # the stacked inputs at the first timestep hold x forward and x_b (the last timestep) backward
+        stacked_x = stack_bidirectional_inputs(T.as_tensor_variable(numpy.asarray([x, x_b])),
+                                               self.size, self.n_gates)[0]
+        stacked_U = stack_bidirectional_weights(T.as_tensor_variable(U), T.as_tensor_variable(U_b),
+                                                self.size, self.n_gates)
+        stacked = (stacked_x + T.dot(T.as_tensor_variable(numpy.concatenate([h, h_b], axis=1)), stacked_U)).eval()
+        forward, backward = x + numpy.dot(h, U), x_b + numpy.dot(h_b, U_b)
+        for n in range(self.n_gates):
+            gate = slice(n * self.size, (n + 1) * self.size)
+            block = stacked[:, 2 * n * self.size:2 * (n + 1) * self.size]
+            numpy.testing.assert_allclose(block[:, :self.size], forward[:, gate], rtol=1e-5)
+            numpy.testing.assert_allclose(block[:, self.size:], backward[:, gate], rtol=1e-5)
+
+    def testUnstack(self):
+        # a scan over the stacked inputs gives the backward hiddens in reversed time order
+        hiddens, hiddens_b = self._random(5, 2, self.size), self._random(5, 2, self.size)
+        stacked = T.as_tensor_variable(numpy.concatenate([hiddens, hiddens_b[::-1]], axis=2))
+        forward, backward = unstack_bidirectional(stacked, self.size)
+        numpy.testing.assert_array_equal(forward.eval(), hiddens)
+        numpy.testing.assert_array_equal(backward.eval(), hiddens_b)
+
+
+class TestCarriedState(unittest.TestCase):
+    def setUp(self):
+        # a running sum over calls, starting from zeros
+        x = T.matrix("x")
+        self.state, initial = get_carried_state(T.zeros_like(x), name="sum")
+        total = initial + x
+        self.f = theano.function([x], total, updates=[(self.state, total)])
+        self.x = numpy.ones((2, 3), dtype=theano.config.floatX)
+
+    def testCarry(self):
+        numpy.testing.assert_array_equal(self.f(self.x), self.x)
+        numpy.testing.assert_array_equal(self.f(self.x), 2 * self.x)
+        numpy.testing.assert_array_equal(self.state.get_value(), 2 * self.x)
+
+    def testShapeChange(self):
+        self.f(self.x)
+        # a different batch size starts from zeros again
+        numpy.testing.assert_array_equal(self.f(self.x[:1]), self.x[:1])
+        numpy.testing.assert_array_equal(self.f(self.x[:1]), 2 * self.x[:1])
+
+    def testReset(self):
+        self.f(self.x)
+        reset_carried_state([self.state])
+        assert self.state.get_value().shape == (0, 0)
+        numpy.testing.assert_array_equal(self.f(self.x), self.x)
+        reset_carried_state(self.state)
+        numpy.testing.assert_array_equal(self.f(self.x), self.x)
+
+
+if __name__ == '__main__':
+    unittest.main()
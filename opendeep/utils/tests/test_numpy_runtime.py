@@ -0,0 +1,51 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import numpy
+from opendeep.utils import numpy_runtime
+
+class TestNumpyRuntime(unittest.TestCase):
+    def setUp(self):
+        self.rng = numpy.random.RandomState(1)
+
+    def testConv2D(self):
+        x = self.rng.randn(2, 3, 7, 7)
+        W = self.rng.randn(4, 3, 3, 3)
+        conved = numpy_runtime.conv2d(x, W, stride=(2, 2), pad=(1, 1))
+        # direct convolution (with the flipped kernels)
+        padded = numpy.pad(x, ((0, 0), (0, 0), (1, 1), (1, 1)), mode='constant')
+        flipped = W[:, :, ::-1, ::-1]
+        expected = numpy.zeros((2, 4, 4, 4))
+        for i in range(4):
+            for j in range(4):
+                window = padded[:, :, 2*i:2*i+3, 2*j:2*j+3]
+                expected[:, :, i, j] = numpy.tensordot(window, flipped, axes=([1, 2, 3], [1, 2, 3]))
+        numpy.testing.assert_allclose(conved, expected)
+
+    def testMaxPool(self):
+        x = numpy.arange(36, dtype='float64').reshape((1, 1, 6, 6))
+        pooled = numpy_runtime.max_pool(x, size=3, stride=2)
+        # the last window only covers the partial border
+        numpy.testing.assert_array_equal(pooled[0, 0], [[14, 16, 17], [26, 28, 29], [32, 34, 35]])
+
+    def testLoad(self):
+        path = tempfile.mkdtemp()
+        try:
+            W, b = self.rng.randn(5, 3), self.rng.randn(3)
+            numpy.savez(os.path.join(path, numpy_runtime.PARAMS_FILE), layer0_W=W, layer0_b=b)
+            spec = {'format': numpy_runtime.FORMAT_VERSION,
+                    'layers': [{'type': 'Dense', 'activation': 'softmax', 'argmax': True,
+                                'params': {'W': 'layer0_W', 'b': 'layer0_b'}}]}
+            with open(os.path.join(path, numpy_runtime.SPEC_FILE), 'w') as f:
+                json.dump(spec, f)
+            x = self.rng.randn(4, 5)
+            output = numpy_runtime.load(path).run(x)
+            numpy.testing.assert_array_equal(output, numpy.argmax(numpy.dot(x, W) + b, axis=1))
+        finally:
+            shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
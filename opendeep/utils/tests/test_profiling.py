@@ -0,0 +1,91 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+import theano
+import theano.tensor as T
+from opendeep.models.single_layer.basic import Dense
+from opendeep.utils import profiling
+from opendeep.utils.constructors import function
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.outdir = tempfile.mkdtemp()
+        self.x = T.matrix('x')
+        self.inputs = numpy.ones((10, 10), dtype=theano.config.floatX)
+
+    def tearDown(self):
+        profiling.stop_profiling()
+        shutil.rmtree(self.outdir)
+
+    def _compile(self, name):
+        return function(inputs=[self.x], outputs=T.tanh(T.dot(self.x, self.x)).sum(), name=name)
+
+    def testWindow(self):
+        profiling.profile_functions(u'f_profiled', outdir=self.outdir, n_calls=3, warmup_calls=2)
+        assert profiling.is_profiled('f_profiled') and not profiling.is_profiled('f_other')
+        f = self._compile('f_profiled')
+        assert isinstance(f, profiling.ProfiledFunction)
+        # attributes go through to the compiled function
+        self.assertEqual(f.name, 'f_profiled')
+        for _ in range(4):
+            f(self.inputs)
+        # the window only counts the calls after the warmup
+        self.assertEqual(f.fn.profile.fct_callcount, 2)
+        for count in f.fn.profile.apply_callcount.values():
+            self.assertEqual(count, 2)
+        assert not os.path.exists(os.path.join(self.outdir, 'profile_f_profiled.json'))
+        # the report is written after the window, and the profiling stops
+        f(self.inputs)
+        f(self.inputs)
+        assert f.fn.profile is None
+        with open(os.path.join(self.outdir, 'profile_f_profiled.json'), 'r') as stats_file:
+            stats = json.load(stats_file)
+        self.assertEqual(stats['calls'], 3)
+        assert len(stats['op_time']) > 0 and len(stats['apply_time']) > 0
+        assert os.path.exists(os.path.join(self.outdir, 'profile_f_profiled.txt'))
+
+    def testOutdir(self):
+        # reports go to the model's outdir
+        model = Dense(input_size=2, output_size=2, outdir=self.outdir)
+        profiling.profile_functions(['f_model'], model=model, n_calls=1, warmup_calls=0)
+        f = self._compile('f_model')
+        f(self.inputs)
+        assert os.path.exists(os.path.join(self.outdir, 'profile_f_model.txt'))
+        # and are only logged without one
+        profiling.profile_functions('f_logged', model=Dense(input_size=2, output_size=2, outdir=None), n_calls=1)
+        f = self._compile('f_logged')
+        f(self.inputs)
+        f(self.inputs)
+        self.assertIsNone(f.write_report())
+        assert not os.path.exists(os.path.join(os.getcwd(), 'outputs', 'profiling'))
+
+    def testStop(self):
+        profiling.profile_functions(['f_a', 'f_b'], outdir=self.outdir)
+        profiling.stop_profiling('f_a')
+        assert not profiling.is_profiled('f_a') and profiling.is_profiled('f_b')
+        assert not isinstance(self._compile('f_a'), profiling.ProfiledFunction)
+        profiling.stop_profiling()
+        assert not profiling.is_profiled('f_b')
+
+    def testDiff(self):
+        before = {'name': 'f', 'calls': 2, 'function_time': 2., 'op_time': {'Dot': 1., 'Tanh': .2}, 'apply_time': {}}
+        after = {'name': 'f', 'calls': 4, 'function_time': 2., 'op_time': {'Dot': 1., 'Sum': .6}, 'apply_time': {}}
+        paths = []
+        for name, stats in [('before', before), ('after', after)]:
+            paths.append(os.path.join(self.outdir, name + '.json'))
+            with open(paths[-1], 'w') as stats_file:
+                json.dump(stats, stats_file)
+        outfile = os.path.join(self.outdir, 'diff.txt')
+        diffs = profiling.diff_profiles(paths[0], paths[1], outfile=outfile)
+        # per call, ranked by the size of the change
+        self.assertEqual([diff[0] for diff in diffs], ['Dot', 'Sum', 'Tanh'])
+        numpy.testing.assert_allclose([diff[1:] for diff in diffs],
+                                      [(.5, .25, -.25), (0., .15, .15), (.1, 0., -.1)])
+        assert os.path.exists(outfile)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import threading
+import numpy
+from opendeep.utils.serving import BatchingServer
+
+class TestBatchingServer(unittest.TestCase):
+    def setUp(self):
+        self.batch_sizes = []
+
+        def run_fn(inputs):
+            self.batch_sizes.append(len(inputs[0]))
+            return inputs[0] * 2
+        self.server = BatchingServer(run_fn=run_fn, max_batch_size=8, max_wait=0.05).start()
+
+    def testPredict(self):
+        output = self.server.predict(numpy.arange(3), timeout=5)
+        numpy.testing.assert_array_equal(output, numpy.arange(3) * 2)
+
+    def testBatching(self):
+        requests = [self.server.submit(numpy.ones(3) * i) for i in range(20)]
+        for i, request in enumerate(requests):
+            numpy.testing.assert_array_equal(request.result(timeout=5), numpy.ones(3) * 2 * i)
+        assert max(self.batch_sizes) <= 8
+        assert len(self.batch_sizes) < 20, self.batch_sizes
+
+    def testConcurrent(self):
+        results = {}
+
+        def client(i):
+            results[i] = self.server.predict(numpy.ones(2) * i, timeout=5)
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(10)]
+        [thread.start() for thread in threads]
+        [thread.join() for thread in threads]
+        for i in range(10):
+            numpy.testing.assert_array_equal(results[i], numpy.ones(2) * 2 * i)
+
+    def testMalformed(self):
+        request = self.server.submit(numpy.ones(3))
+        # a request with the wrong dimensions or dtype is refused without failing the others
+        self.assertRaises(ValueError, self.server.submit, numpy.ones((2, 3)))
+        self.assertRaises(ValueError, self.server.submit, numpy.array(['a', 'b', 'c']))
+        self.assertRaises(ValueError, self.server.submit, [numpy.ones(3), numpy.ones(3)])
+        numpy.testing.assert_array_equal(request.result(timeout=5), numpy.ones(3) * 2)
+
+    def testShapes(self):
+        # examples of different lengths are computed in separate batches
+        requests = [self.server.submit(numpy.ones(2 + i % 2) * i) for i in range(6)]
+        for i, request in enumerate(requests):
+            numpy.testing.assert_array_equal(request.result(timeout=5), numpy.ones(2 + i % 2) * 2 * i)
+
+    def testStop(self):
+        release = threading.Event()
+        started = threading.Event()
+
+        def run_fn(inputs):
+            started.set()
+            release.wait()
+            return inputs[0]
+        server = BatchingServer(run_fn=run_fn, max_batch_size=1, max_wait=0).start()
+        running = server.submit(numpy.ones(2))
+        started.wait(5)
+        queued = [server.submit(numpy.ones(2)) for _ in range(3)]
+        # let the running batch finish after the server is told to stop
+        threading.Timer(0.1, release.set).start()
+        server.stop()
+        numpy.testing.assert_array_equal(running.result(timeout=5), numpy.ones(2))
+        for request in queued:
+            self.assertRaises(RuntimeError, request.result, 5)
+        self.assertRaises(RuntimeError, server.submit, numpy.ones(2))
+
+    def tearDown(self):
+        self.server.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()